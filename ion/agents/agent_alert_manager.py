@@ -34,16 +34,70 @@ class AgentAlertManager(object):
         for aggregate_type in AggregateStatusType._str_map.keys():
             agent.aparam_aggstatus[aggregate_type] = DeviceStatusType.STATUS_UNKNOWN
         agent.aparam_set_aggstatus = self.aparam_set_aggstatus
-    
+
+        # Stream alerts by (stream_name, value_id), see _get_stream_alerts.
+        self._stream_alerts = None
+        self._indexed_alerts = None
+        self._indexed_count = 0
+
     def process_alerts(self, **kwargs):
 
         log.debug("process_alerts: aparam_alerts=%s; kwargs=%s", self._agent.aparam_alerts, kwargs)
 
-        for a in self._agent.aparam_alerts:
+        if 'stream_name' in kwargs and 'value_id' in kwargs:
+            # Only the alerts on this stream value can be triggered.
+            stream_alerts = self._get_stream_alerts()
+            alerts = stream_alerts.get((kwargs['stream_name'], kwargs['value_id']), []) + \
+                     stream_alerts.get((kwargs['stream_name'], None), [])
+        else:
+            alerts = self._agent.aparam_alerts
+
+        for a in alerts:
             a.eval_alert(**kwargs)
 
         # update the aggreate status for this device
         self._process_aggregate_alerts()
+
+    def process_value_alerts(self, stream_name, values):
+        """
+        Evaluate a buffered batch of stream values and update the aggregate
+        status once for the whole batch.
+        @param stream_name   the stream the values arrived on.
+        @param values        dict of value_id to the sequence of values
+                             received for it, oldest first.
+        """
+        if not values:
+            return
+
+        log.debug("process_value_alerts: stream_name=%s; value_ids=%s", stream_name, values.keys())
+
+        stream_alerts = self._get_stream_alerts()
+        for a in stream_alerts.get((stream_name, None), []):
+            a.eval_alert(stream_name=stream_name)
+
+        for value_id, vals in values.iteritems():
+            for a in stream_alerts.get((stream_name, value_id), []):
+                a.eval_alert_batch(stream_name=stream_name, values=vals, value_id=value_id)
+
+        self._process_aggregate_alerts()
+
+    def _get_stream_alerts(self):
+        """
+        Dict of the stream alerts keyed by (stream_name, value_id), with a
+        value_id of None for alerts on the stream as a whole. Rebuilt whenever
+        the agent alerts change.
+        """
+        alerts = self._agent.aparam_alerts
+        if self._indexed_alerts is not alerts or self._indexed_count != len(alerts):
+            self._stream_alerts = {}
+            for a in alerts:
+                if isinstance(a, StreamAlert):
+                    key = (a._stream_name, getattr(a, '_value_id', None))
+                    self._stream_alerts.setdefault(key, []).append(a)
+            self._indexed_alerts = alerts
+            self._indexed_count = len(alerts)
+
+        return self._stream_alerts
         
     def _update_aggstatus(self, aggregate_type, new_status):
         """
@@ -19,8 +19,6 @@ import uuid
 
 # 3rd party.
 import gevent
-import numpy
-import base64
 
 # Publilshing objects.
 from pyon.ion.stream import StreamPublisher
@@ -31,7 +29,121 @@ from interface.objects import StreamRoute
 from pyon.core.bootstrap import get_obj_registry
 from pyon.core.object import IonObjectDeserializer
 
-from ion.agents.populate_rdt import populate_rdt
+from ion.agents.populate_rdt import ParticleSchema
+
+
+class StreamSampleBuffer(object):
+    """
+    Bounded ring buffer of the samples waiting to be published on a stream.
+    Samples are unpacked on arrival into preallocated columns, one per stream
+    field, and drained into arrays by the stream's ParticleSchema.
+
+    When the buffer is full the policy decides what happens to a new sample:
+        'publish'       the owner publishes the buffer first (backpressure).
+        'drop_oldest'   the oldest buffered sample is overwritten.
+        'drop_newest'   the new sample is dropped.
+    """
+    policies = ('publish', 'drop_oldest', 'drop_newest')
+
+    def __init__(self, schema, capacity=1000, policy='publish'):
+        assert policy in self.policies
+        self.schema = schema
+        self.capacity = capacity
+        self.policy = policy
+        self.dropped = 0
+
+        # Particle key -> field, the driver timestamp is the temporal parameter.
+        # Entries in the particle values list always go to their own field.
+        self._fields = schema.fields
+        self._field_map = dict((f, f) for f in schema.fields)
+        self._field_map['driver_timestamp'] = schema.temporal_parameter
+        self._columns = dict((f, [None] * capacity) for f in self._field_map.itervalues())
+        # Field -> flags of the slots holding base64 encoded values.
+        self._binary = {}
+        self._seen = set()
+        self._start = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def full(self):
+        return self._count >= self.capacity
+
+    def append(self, sample):
+        """
+        Packs the sample into the columns. Returns False if it was dropped.
+        """
+        if self._count >= self.capacity:
+            self.dropped += 1
+            if self.policy != 'drop_oldest':
+                return False
+            # Reuse the oldest slot.
+            pos = self._start
+            for column in self._columns.itervalues():
+                column[pos] = None
+            for flags in self._binary.itervalues():
+                flags[pos] = False
+            self._start = (self._start + 1) % self.capacity
+        else:
+            pos = (self._start + self._count) % self.capacity
+            self._count += 1
+
+        field_map = self._field_map
+        for k, v in sample.iteritems():
+            if k == 'values':
+                for value_dict in v:
+                    field = value_dict['value_id']
+                    if field not in self._fields:
+                        continue
+                    self._columns[field][pos] = value_dict['value']
+                    self._seen.add(field)
+                    if 'binary' in value_dict:
+                        flags = self._binary.get(field)
+                        if flags is None:
+                            flags = self._binary[field] = [False] * self.capacity
+                        flags[pos] = True
+            else:
+                field = field_map.get(k)
+                if field is not None:
+                    self._columns[field][pos] = v
+                    self._seen.add(field)
+        return True
+
+    def drain(self):
+        """
+        Removes every buffered sample, oldest first.
+        Returns the number of samples and a dict of field to value array for
+        the fields the samples carried, the temporal parameter always included.
+        """
+        count = self._count
+        if count == 0:
+            return 0, {}
+
+        start = self._start
+        end = start + count
+        wrapped = max(end - self.capacity, 0)
+        cleared = min(end, self.capacity) - start
+
+        self._seen.add(self.schema.temporal_parameter)
+        columns = {}
+        for field in self._seen:
+            column = self._columns[field]
+            columns[field] = column[start:end] + column[:wrapped]
+            column[start:end] = [None] * cleared
+            column[:wrapped] = [None] * wrapped
+
+        binary = {}
+        for field, flags in self._binary.iteritems():
+            binary[field] = [i for i, flag in enumerate(flags[start:end] + flags[:wrapped]) if flag]
+            flags[start:end] = [False] * cleared
+            flags[:wrapped] = [False] * wrapped
+
+        self._seen = set()
+        self._start = 0
+        self._count = 0
+        return count, self.schema.to_arrays(columns, binary)
+
 
 class AgentStreamPublisher(object):
     """
@@ -42,9 +154,14 @@ class AgentStreamPublisher(object):
         self._publishers = {}
         self._stream_greenlets = {}
         self._stream_buffers = {}
+        self._stream_def_objs = {}
         self._connection_ID = None
         self._connection_index = {}
-        
+
+        # Sample staging, see StreamSampleBuffer.
+        self._buffer_size = self._agent.CFG.get_safe('stream_buffer.size', 1000)
+        self._buffer_policy = self._agent.CFG.get_safe('stream_buffer.policy', 'publish')
+
         stream_info = self._agent.CFG.get('stream_config', None)
         if not stream_info:
             log.error('Instrument agent %s has no stream config.',
@@ -71,7 +188,12 @@ class AgentStreamPublisher(object):
                 else:
                     stream_def = config['stream_definition_ref']
                     self._stream_defs[stream_name] = stream_def
-                    rdt = RecordDictionaryTool(stream_definition_id=stream_def)    
+                    # Read once, every granule on the stream is built from it.
+                    stream_def_obj = RecordDictionaryTool.read_stream_def(stream_def)
+                    rdt = RecordDictionaryTool(stream_definition=stream_def_obj, stream_definition_id=stream_def)
+                self._stream_def_objs[stream_name] = stream_def_obj
+                self._stream_buffers[stream_name] = StreamSampleBuffer(ParticleSchema.for_rdt(rdt),
+                                                        self._buffer_size, self._buffer_policy)
                 self._agent.aparam_streams[stream_name] = rdt.fields
                 self._agent.aparam_pubrate[stream_name] = 0
             except Exception as e:
@@ -94,7 +216,6 @@ class AgentStreamPublisher(object):
                                     stream_id=stream_id, stream_route=route)
                 self._publishers[stream_name] = publisher
                 self._stream_greenlets[stream_name] = None
-                self._stream_buffers[stream_name] = []
         
             except Exception as e:
                 errmsg = 'Instrument agent %s' % self._agent._proc_name
@@ -111,7 +232,12 @@ class AgentStreamPublisher(object):
         
         try:
             stream_name = sample['stream_name']
-            self._stream_buffers[stream_name].insert(0,sample)
+            stream_buffer = self._stream_buffers[stream_name]
+            if stream_buffer.full() and stream_buffer.policy == 'publish':
+                self._publish_stream_buffer(stream_name)
+            if not stream_buffer.append(sample):
+                log.warning('Instrument agent %s stream %s buffer is full, %d samples dropped.',
+                            self._agent._proc_name, stream_name, stream_buffer.dropped)
             if not self._stream_greenlets[stream_name]:
                 self._publish_stream_buffer(stream_name)
 
@@ -168,26 +294,22 @@ class AgentStreamPublisher(object):
         """
 
         try:
-            buf_len = len(self._stream_buffers[stream_name])
-            if buf_len == 0:
+            count, data = self._stream_buffers[stream_name].drain()
+            if count == 0:
                 return
 
+            # The cached definition saves the read, granules on a referenced
+            # stream definition still carry only its id.
             stream_def = self._stream_defs[stream_name]
-            if isinstance(stream_def, str):
-                rdt = RecordDictionaryTool(stream_definition_id=stream_def)
-            else:
-                rdt = RecordDictionaryTool(stream_definition=stream_def)
-                
+            rdt = RecordDictionaryTool(stream_definition=self._stream_def_objs[stream_name],
+                    stream_definition_id=stream_def if isinstance(stream_def, str) else '')
+
             publisher = self._publishers[stream_name]
-                
-            vals = []
-            for x in xrange(buf_len):
-                vals.append(self._stream_buffers[stream_name].pop())
-    
-            rdt = populate_rdt(rdt, vals)
-            
-            log.info('Outgoing granule: %s',
-                     ['%s: %s'%(k,v) for k,v in rdt.iteritems()])
+
+            for k, v in data.iteritems():
+                rdt[k] = v
+
+            log.debug('Outgoing granule of %d samples on stream %s.', count, stream_name)
             g = rdt.to_granule(data_producer_id=self._agent.resource_id, connection_id=self._connection_ID.hex,
                     connection_index=str(self._connection_index[stream_name]))
             
@@ -16,6 +16,8 @@ from pyon.public import IonObject, log
 # Standard imports.
 import time
 import copy
+import operator
+import numpy as np
 
 # gevent.
 import gevent
@@ -211,6 +213,14 @@ class StreamAlert(BaseAlert):
         event_data = super(StreamAlert, self).make_event_data()
         event_data['stream_name'] = self._stream_name
         return event_data
+
+    def eval_alert_batch(self, stream_name=None, values=None, value_id=None, **kwargs):
+        """
+        Evaluates a buffered sequence of values, oldest first. Override where
+        the alert logic can be applied to the whole sequence at once.
+        """
+        for value in values:
+            self.eval_alert(stream_name=stream_name, value=value, value_id=value_id, **kwargs)
     
 class StreamValueAlert(StreamAlert):
     
@@ -250,11 +260,35 @@ class StreamValueAlert(StreamAlert):
         event_data['value_id'] = self._value_id
         return event_data
 
+    def _publish_transitions(self, values, idx, status):
+        """
+        Publishes the alert wherever status changes along a batch, exactly as
+        evaluating the values one at a time would.
+        values  the values as received.
+        idx     array of the indices into values that were evaluated.
+        status  boolean array with the status after each evaluated value.
+        """
+        initial_status = self._status
+        changed = np.empty(status.shape, dtype=bool)
+        changed[0] = initial_status is None or status[0] != initial_status
+        changed[1:] = status[1:] != status[:-1]
+
+        for i in np.flatnonzero(changed):
+            self._prev_status = self._status
+            self._current_value = values[idx[i]]
+            self._status = bool(status[i])
+            self.publish_alert()
+
+        self._current_value = values[idx[-1]]
+        self._status = bool(status[-1])
+        self._prev_status = bool(status[-2]) if len(status) > 1 else initial_status
+
 class IntervalAlert(StreamValueAlert):
     """
     An alert that triggers when values leave a defined range.
     """
     rel_ops = ['<', '<=']
+    rel_op_funcs = {'<' : operator.lt, '<=' : operator.le}
 
     schema = {
         "lower_bound" : {
@@ -338,6 +372,18 @@ class IntervalAlert(StreamValueAlert):
         status['upper_rel_op'] = self._upper_rel_op
         return status
 
+    def _in_interval(self, value):
+        """
+        True where value lies within the interval, for a single value or a
+        NumPy array of values.
+        """
+        status = True
+        if self._lower_bound is not None:
+            status = IntervalAlert.rel_op_funcs[self._lower_rel_op](self._lower_bound, value)
+        if self._upper_bound is not None:
+            status = status & IntervalAlert.rel_op_funcs[self._upper_rel_op](value, self._upper_bound)
+        return status
+
     def eval_alert(self, stream_name=None, value=None, value_id=None, **kwargs):
 
         if stream_name != self._stream_name or value_id != self._value_id \
@@ -346,37 +392,28 @@ class IntervalAlert(StreamValueAlert):
 
         self._current_value = value
         self._prev_status = self._status
-        
-        if self._lower_bound and self._upper_bound:
-            if self._lower_rel_op == '<=':
-                if self._upper_rel_op == '<=':
-                    self._status = (self._lower_bound <= self._current_value <= self._upper_bound)
-                
-                else:
-                    self._status = (self._lower_bound <= self._current_value < self._upper_bound)
-                    
-            else:
-                if self._upper_rel_op == '<=':
-                    self._status = (self._lower_bound < self._current_value <= self._upper_bound)
-                
-                else:
-                    self._status = (self._lower_bound < self._current_value < self._upper_bound)
-                        
-        elif self._lower_bound:
-            if self._lower_rel_op == '<=':
-                self._status = (self._lower_bound <= self._current_value)
-            else:
-                self._status = (self._lower_bound < self._current_value)
-            
-        elif self._upper_bound:
-            if self._upper_rel_op == '<=':
-                self._status = (self._current_value <= self._upper_bound)
-            else:
-                self._status = (self._current_value < self._upper_bound)
-                
+        self._status = bool(self._in_interval(value))
+
         if self._prev_status != self._status:
             self.publish_alert()
 
+    def eval_alert_batch(self, stream_name=None, values=None, value_id=None, **kwargs):
+
+        if stream_name != self._stream_name or value_id != self._value_id \
+                          or not len(values):
+            return
+
+        try:
+            arr = np.asarray(values, dtype='float64')
+        except (TypeError, ValueError):
+            # Not numeric, evaluate one at a time.
+            return super(IntervalAlert, self).eval_alert_batch(stream_name, values, value_id)
+
+        # As in eval_alert, missing and zero values are skipped.
+        idx = np.flatnonzero(~np.isnan(arr) & (arr != 0))
+        if idx.size:
+            self._publish_transitions(values, idx, self._in_interval(arr[idx]))
+
 
 class RSNEventAlert(BaseAlert):
     """
@@ -467,7 +504,92 @@ class DeltaAlert(StreamValueAlert):
     """
     An alert that triggers when a large jump is seen in data streams.
     """
-    pass
+    schema = {
+        "delta" : {
+            "display_name" : "Delta",
+            "description" : "Largest valid change between consecutive values.",
+            "required" : True,
+            "type" : "float",
+            "min_value" : 0.0
+        },
+        "class_name" : {
+            "display_name" : "Alert Class Name",
+            "descritpion" : "Name of class implementing alert.",
+            "required" : True,
+            "type" : "str",
+            "valid_values" : ["DeltaAlert"]
+        }
+    }
+
+    @classmethod
+    def get_schema(cls):
+        retval = StreamValueAlert.get_schema()
+        retval['type'].update(cls.schema)
+        retval['display_name'] = 'Data Delta Alert'
+        retval['description'] = 'Alert triggered by jumps between consecutive data values.'
+        retval['type']['value']['type'] = "float"
+        return retval
+
+    def __init__(self, name=None, stream_name=None, description=None, alert_type=None,
+                 value_id=None, resource_id=None, origin_type=None, aggregate_type=None,
+                 delta=None, **kwargs):
+
+        super(DeltaAlert, self).__init__(name, description, alert_type, resource_id,
+                        origin_type, aggregate_type, stream_name, value_id)
+
+        assert isinstance(delta, (int, float))
+        self._delta = delta
+        self._last_value = None
+
+    def get_status(self):
+        status = super(DeltaAlert, self).get_status()
+        status['delta'] = self._delta
+        return status
+
+    def eval_alert(self, stream_name=None, value=None, value_id=None, **kwargs):
+
+        if stream_name != self._stream_name or value_id != self._value_id \
+                          or not isinstance(value, (int, float)):
+            return
+
+        last_value = self._last_value
+        self._last_value = value
+        if last_value is None:
+            return
+
+        self._current_value = value
+        self._prev_status = self._status
+        self._status = bool(abs(value - last_value) <= self._delta)
+
+        if self._prev_status != self._status:
+            self.publish_alert()
+
+    def eval_alert_batch(self, stream_name=None, values=None, value_id=None, **kwargs):
+
+        if stream_name != self._stream_name or value_id != self._value_id \
+                          or not len(values):
+            return
+
+        try:
+            arr = np.asarray(values, dtype='float64')
+        except (TypeError, ValueError):
+            return super(DeltaAlert, self).eval_alert_batch(stream_name, values, value_id)
+
+        idx = np.flatnonzero(~np.isnan(arr))
+        if not idx.size:
+            return
+
+        series = arr[idx]
+        last_value = self._last_value
+        self._last_value = values[idx[-1]]
+        if last_value is None:
+            # The first value only sets the reference for the next.
+            steps, idx = np.diff(series), idx[1:]
+        else:
+            steps = np.diff(np.concatenate(([last_value], series)))
+
+        if idx.size:
+            self._publish_transitions(values, idx, np.abs(steps) <= self._delta)
 
 class LateDataAlert(StreamAlert):
     """
@@ -528,6 +650,11 @@ class LateDataAlert(StreamAlert):
         if not self._status:
             self._status = True
             self.publish_alert()
+
+    def eval_alert_batch(self, stream_name=None, values=None, **kwargs):
+        # Only the arrival of data matters here.
+        if len(values):
+            self.eval_alert(stream_name=stream_name)
         
     def _check_data(self):
         """
@@ -733,6 +860,7 @@ def get_alerts_schema():
         
     return {
         "IntervalAlert" :    IntervalAlert.get_schema(),
+        "DeltaAlert"        : DeltaAlert.get_schema(),
         "LateDataAlert"     : LateDataAlert.get_schema(),
         "StateAlert"        : StateAlert.get_schema(),
         "CommandErrorAlert" : CommandErrorAlert.get_schema()
@@ -17,6 +17,9 @@ from pyon.public import log
 
 # Standard library.
 import copy
+import time
+import numpy as np
+from mock import Mock, patch
 
 # Gevent async.
 from gevent.event import AsyncResult
@@ -24,6 +27,8 @@ import gevent
 
 # Pyon unittest support.
 from pyon.util.int_test import IonIntegrationTestCase
+from pyon.util.unit_test import PyonTestCase
+from pyon.util.containers import DotDict
 from nose.plugins.attrib import attr
 import unittest
 
@@ -36,6 +41,7 @@ from interface.objects import StreamAlertType, AggregateStatusType
 # Alarm objects.
 from pyon.public import IonObject
 from ion.agents.alerts.alerts import *
+from ion.agents.agent_alert_manager import AgentAlertManager
 
 # Resource agent.
 from pyon.agent.agent import ResourceAgentState, ResourceAgentEvent
@@ -490,4 +496,110 @@ class TestAlerts(IonIntegrationTestCase):
         {'origin': 'abc123', 'status': 1, '_id': '23153a1c48de4f25bce6f84cfab8444a', 'description': 'Detected comms failure.', 'time_stamps': [], 'type_': 'DeviceStatusAlertEvent', 'valid_values': [], 'values': [None], 'value_id': '', 'base_types': ['DeviceStatusEvent', 'DeviceEvent', 'Event'], 'stream_name': '', 'ts_created': '1366740538586', 'sub_type': 1, 'origin_type': 'InstrumentDevice', 'name': 'comms_warning'}
         {'origin': 'abc123', 'status': 1, '_id': '18b85d52ac1a438a9f5f8e69e5f4f6e8', 'description': 'The alert is cleared.', 'time_stamps': [], 'type_': 'DeviceStatusAlertEvent', 'valid_values': [], 'values': [None], 'value_id': '', 'base_types': ['DeviceStatusEvent', 'DeviceEvent', 'Event'], 'stream_name': '', 'ts_created': '1366740538592', 'sub_type': 3, 'origin_type': 'InstrumentDevice', 'name': 'comms_warning'}
         """
-        
\ No newline at end of file
+        
+
+class AlertBatchTestCase(PyonTestCase):
+    """
+    Records the alerts published instead of sending events.
+    """
+    def setUp(self):
+        self._published = []
+        def publish_alert(alert):
+            self._published.append((alert._name, alert._status, alert._current_value))
+        patcher = patch.object(BaseAlert, 'publish_alert', publish_alert)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _interval_alert(self, name='current_interval'):
+        return IntervalAlert(name=name, description='Current is out of range.',
+                             alert_type=StreamAlertType.WARNING,
+                             aggregate_type=AggregateStatusType.AGGREGATE_DATA,
+                             resource_id='abc123', origin_type='InstrumentDevice',
+                             stream_name='fakestreamname', value_id='port_current',
+                             lower_bound=10.5, lower_rel_op='<', upper_bound=20.0, upper_rel_op='<=')
+
+    def _delta_alert(self, name='current_delta'):
+        return DeltaAlert(name=name, description='Current jumped.',
+                          alert_type=StreamAlertType.WARNING,
+                          aggregate_type=AggregateStatusType.AGGREGATE_DATA,
+                          resource_id='abc123', origin_type='InstrumentDevice',
+                          stream_name='fakestreamname', value_id='port_current',
+                          delta=5.0)
+
+    def _compare(self, scalar_alert, batch_alert, batches):
+        for vals in batches:
+            for x in vals:
+                scalar_alert.eval_alert(stream_name='fakestreamname', value=x, value_id='port_current')
+        expected, self._published = self._published, []
+
+        for vals in batches:
+            batch_alert.eval_alert_batch(stream_name='fakestreamname', values=vals, value_id='port_current')
+
+        self.assertEquals(self._published, expected)
+        self.assertEquals(batch_alert.get_status(), scalar_alert.get_status())
+        self.assertEquals(batch_alert._prev_status, scalar_alert._prev_status)
+        return expected
+
+
+@attr('UNIT', group='sa')
+class TestAlertBatches(AlertBatchTestCase):
+    """
+    Batched evaluation of stream value alerts.
+    """
+    def test_interval_batch(self):
+        batches = [[30, 30.4, None, 5.5, 5.6, 15.1], [15.2], [0, 15.3, 3.3, 3.4, 20.0, 20.1]]
+        published = self._compare(self._interval_alert(), self._interval_alert(), batches)
+        self.assertEquals([x[1:] for x in published],
+                          [(False, 30), (True, 15.1), (False, 3.3), (True, 20.0), (False, 20.1)])
+
+    def test_delta_batch(self):
+        batches = [[10.0], [11.0, 20.0, 21.0, None], [22.0, 10.0, 12.0]]
+        published = self._compare(self._delta_alert(), self._delta_alert(), batches)
+        self.assertEquals([x[1:] for x in published],
+                          [(True, 11.0), (False, 20.0), (True, 21.0), (False, 10.0), (True, 12.0)])
+
+    def test_manager_dispatch(self):
+        agent = DotDict(aparam_alerts=[], aparam_aggstatus={}, resource_id='abc123')
+        manager = AgentAlertManager(agent)
+        manager._process_aggregate_alerts = Mock()
+
+        interval = self._interval_alert()
+        other = self._interval_alert(name='other_stream')
+        other._stream_name = 'otherstream'
+        agent.aparam_alerts = [interval, other]
+
+        manager.process_value_alerts('fakestreamname', {'port_current' : [30, 15.1], 'port_voltage' : [1.0]})
+        self.assertEquals([x[0] for x in self._published], ['current_interval', 'current_interval'])
+        self.assertEquals(other.get_status()['status'], None)
+        self.assertEquals(manager._process_aggregate_alerts.call_count, 1)
+
+        # Alerts added later are picked up.
+        agent.aparam_alerts.append(self._delta_alert())
+        self.assertIn(('fakestreamname', 'port_current'), manager._get_stream_alerts())
+        self.assertEquals(len(manager._get_stream_alerts()[('fakestreamname', 'port_current')]), 2)
+
+    def test_interval_batch_wave(self):
+        vals = list(np.sin(np.arange(1000) / 50.0) * 20)
+        self._compare(self._interval_alert(), self._interval_alert(), [vals[:500], vals[500:]])
+
+
+# Timings only, run with: bin/nosetests -a BENCHMARK
+@attr('BENCHMARK', group='sa')
+class TestAlertBatchesBenchmark(AlertBatchTestCase):
+
+    def test_interval_batch_benchmark(self):
+        vals = list(np.sin(np.arange(100000) / 50.0) * 20)
+
+        scalar_alert, batch_alert = self._interval_alert(), self._interval_alert()
+        then = time.time()
+        for x in vals:
+            scalar_alert.eval_alert(stream_name='fakestreamname', value=x, value_id='port_current')
+        scalar_time = time.time() - then
+        expected, self._published = self._published, []
+
+        then = time.time()
+        batch_alert.eval_alert_batch(stream_name='fakestreamname', values=vals, value_id='port_current')
+        batch_time = time.time() - then
+
+        log.info('IntervalAlert over %d values: per value %.4fs, batch %.4fs', len(vals), scalar_time, batch_time)
+        self.assertEquals(self._published, expected)
@@ -26,7 +26,7 @@ from interface.services.coi.iresource_registry_service import ResourceRegistrySe
 ### For new granule and stream interface
 from ion.services.dm.utility.granule.record_dictionary import RecordDictionaryTool
 
-from ion.agents.data.handlers.handler_utils import calculate_iteration_count, list_file_info, get_time_from_filename
+from ion.agents.data.handlers.handler_utils import calculate_iteration_count, list_file_info, get_new_file_info, get_time_from_filename
 from pyon.agent.agent import ResourceAgentState
 from pyon.ion.stream import StandaloneStreamPublisher
 
@@ -45,6 +45,9 @@ class DataHandlerParameter(DriverParameter):
 
 
 class BaseDataHandler(object):
+    # True when _get_data records in config['set_new_data_check'] what has been read as it yields the granules,
+    # the check can then be persisted part way through an acquisition (see _publish_data)
+    _new_data_check_tracks_progress = False
 
     def __init__(self, dh_config):
         '''
@@ -613,24 +616,64 @@ class BaseDataHandler(object):
     def _publish_data(cls, publisher, data_generator, config=None, update_new_data_check_attachment=None):
         """
         Iterates over the data_generator and publishes granules to the stream indicated in stream_id
+        The new data check (config['set_new_data_check']) is persisted once publishing completes. Handlers whose
+        _get_data tracks its progress in the check (_new_data_check_tracks_progress) also have it checkpointed every
+        config['checkpoint_granules'] granules or config['checkpoint_interval'] seconds, whichever comes first, and
+        when publishing stops on an error, so the next acquisition resumes from the last granule published. Other
+        handlers set the check for the whole acquisition up front, it is not persisted if publishing fails.
         @param publisher to publish the data with
         @param data_generator enumerator to cycle through the data
+        @param config dict containing configuration parameters
+        @param update_new_data_check_attachment classmethod to persist the new data check
         @throws InstrumentDataException if data_generator isn't an enumerator
         """
         if data_generator is None or not hasattr(data_generator, '__iter__'):
             raise InstrumentDataException('Invalid object returned from _get_data: returned object cannot be None and must have \'__iter__\' attribute')
 
-        for count, gran in enumerate(data_generator):
-            if isinstance(gran, Granule):
-                #log.warn('_publish_data: {0}\n{1}'.format(count, gran))
-                publisher.publish(gran)
-                if config and 'set_new_data_check' in config:
-                    update_new_data_check_attachment(config['external_dataset_res_id'], config['set_new_data_check'])
-            else:
-                log.warn('Could not publish object of {0} returned by _get_data: {1}'.format(type(gran), gran))
+        checkpointing = bool(config) and update_new_data_check_attachment is not None
+        progress = checkpointing and cls._new_data_check_tracks_progress
+        if progress:
+            every_granules = get_safe(config, 'checkpoint_granules', 100)
+            every_seconds = get_safe(config, 'checkpoint_interval', 30)
+        # The new data check as of the last granule published, and as last persisted
+        state = {'published': None, 'persisted': None, 'pending': 0, 'since': time.time()}
+
+        def snapshot():
+            # Handlers replace the entries rather than changing them, a shallow copy is a snapshot
+            ndc = config['set_new_data_check']
+            state['published'] = list(ndc) if isinstance(ndc, list) else ndc
+
+        def checkpoint():
+            if state['pending'] and state['published'] != state['persisted']:
+                update_new_data_check_attachment(config['external_dataset_res_id'], state['published'])
+                state['persisted'] = state['published']
+            state['pending'] = 0
+            state['since'] = time.time()
+
+        try:
+            for count, gran in enumerate(data_generator):
+                if isinstance(gran, Granule):
+                    #log.warn('_publish_data: {0}\n{1}'.format(count, gran))
+                    publisher.publish(gran)
+                    if checkpointing and 'set_new_data_check' in config:
+                        state['pending'] += 1
+                        if progress:
+                            snapshot()
+                            if state['pending'] >= every_granules or time.time() - state['since'] >= every_seconds:
+                                checkpoint()
+                else:
+                    log.warn('Could not publish object of {0} returned by _get_data: {1}'.format(type(gran), gran))
+        except:
+            if progress:
+                checkpoint()
+            raise
+
+        if state['pending']:
+            # The check as the handler left it, including the progress made after the last granule
+            snapshot()
+            checkpoint()
 
         publisher.close()
-        #TODO: Persist the 'state' of this operation so that it can be re-established in case of failure
 
         #TODO: When finished publishing, update (either directly, or via an event callback to the agent) the UpdateDescription
 
@@ -760,18 +803,9 @@ class DummyDataHandler(BaseDataHandler):
         curr_list = list_file_info(base_url, list_pattern)
 
         # Determine which files are new
-        #Not exactly the prettiest method, but here goes:
-        #old_list comes in as a list of lists: [[]]
-        #curr_list comes in as a list of tuples: [()]
-        #each needs to be a set of tuples for set.difference to work properly
-        #set.difference returns a list of tuples that appear in curr_list but not old_list, providing the new
-        #files that are available
-
-        curr_set = set(tuple(x) for x in curr_list)
-        old_set = set(tuple(x) for x in old_list)
-
-        #new_list = [tuple(x) for x in curr_list if list(x) not in old_list] - removed because it wasn't working properly
-        new_list = list(curr_set.difference(old_set))
+        #old_list comes in as a list of lists: [[]], curr_list as a list of tuples: [()]
+        #get_new_file_info matches them up by file name
+        new_list = get_new_file_info(curr_list, old_list)
 
         if len(new_list) is 0:
             raise NoNewDataWarning()
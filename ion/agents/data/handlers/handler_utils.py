@@ -111,6 +111,31 @@ def list_file_info_fs(base, pattern):
     return olst
 
 
+def _file_info_key(info):
+    """
+    Splits a file info entry into its name and its (modification time, size) stamp; ftp listings are bare names
+    """
+    if isinstance(info, basestring):
+        return info, ()
+    return info[0], tuple(info[1:3])
+
+
+def get_new_file_info(curr_list, old_list):
+    """
+    Returns the entries of curr_list that are not in old_list: files with a new name or whose modification time
+    or size changed. Entries are compared by name, so the lists may hold tuples or lists (as persisted).
+    @param curr_list file info entries, as returned by list_file_info
+    @param old_list file info entries from the previous check
+    """
+    old_map = dict(_file_info_key(f) for f in old_list)
+    new_list = []
+    for f in curr_list:
+        name, stamp = _file_info_key(f)
+        if old_map.get(name) != stamp:
+            new_list.append(f)
+    return new_list
+
+
 def get_time_from_filename(file_name, date_extraction_pattern, date_pattern):
     """
     @param file_name name of the file
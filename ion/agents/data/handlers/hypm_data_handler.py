@@ -26,6 +26,9 @@ DH_CONFIG_DETAILS = {
 
 
 class HYPMDataHandler(BaseDataHandler):
+    # _get_data records the read position of each file in the new data check
+    _new_data_check_tracks_progress = True
+
     @classmethod
     def _init_acquisition_cycle(cls, config):
         # TODO: Can't build a parser here because we won't have a file name!!  Just a directory :)
@@ -62,16 +65,14 @@ class HYPMDataHandler(BaseDataHandler):
         #if the file names are the same (curr_file[0] and old_file[0]) check the size of the
         #current file (curr_file[2]) with the file position when the last file was read (old_file[3])
         #if there's more data now that was read last time, add the file to the list
+        old_map = dict((old_file[0], old_file) for old_file in old_list)
         new_list = []
         for curr_file in curr_list:
-            found = False
-            for old_file in old_list:
-                if curr_file[0] == old_file[0]:      #if filenames are the same, that means the file is still in the directory, and was previously read
-                    found = True
-                    if curr_file[2] > old_file[3]:   #f2[2] is the current file size, f2[3] is the last read file size
-                        new_list.append((curr_file[0], curr_file[1], curr_file[2], old_file[-1]))     #add it in if the current file size is bigger than the last time
-            if not found:
+            old_file = old_map.get(curr_file[0])
+            if old_file is None:
                 new_list.append(curr_file)
+            elif curr_file[2] > old_file[3]:   #curr_file[2] is the current file size, old_file[3] is the last read file size
+                new_list.append((curr_file[0], curr_file[1], curr_file[2], old_file[-1]))     #add it in if the current file size is bigger than the last time
 
         config['set_new_data_check'] = curr_list
 
@@ -113,17 +114,13 @@ class HYPMDataHandler(BaseDataHandler):
         module = __import__(parser_mod, fromlist=[parser_cls])
         classobj = getattr(module, parser_cls)
 
+        # File name -> index in the new data check
+        ndc_index = dict((ndc[0], i) for i, ndc in enumerate(get_safe(config, 'set_new_data_check') or []))
+
         for f in new_flst:
             try:
-                try:
-                    #find the new data check index in config
-                    index = -1
-                    for ndc in config['set_new_data_check']:
-                        if ndc[0] == f[0]:
-                            index = config['set_new_data_check'].index(ndc)
-                            break
-                except:
-                    log.error('File name not found in attachment')
+                #find the new data check index in config
+                index = ndc_index.get(f[0], -1)
 
                 parser = classobj(f[0], f[3])
 
@@ -11,7 +11,7 @@
 from pyon.public import log
 from pyon.util.containers import get_safe
 from ion.services.dm.utility.granule.record_dictionary import RecordDictionaryTool
-from ion.agents.data.handlers.base_data_handler import BaseDataHandler
+from ion.agents.data.handlers.base_data_handler import BaseDataHandler, NoNewDataWarning
 from ion.agents.data.handlers.handler_utils import calculate_iteration_count
 import hashlib
 import numpy as np
@@ -42,28 +42,21 @@ class NetcdfDataHandler(BaseDataHandler):
             # Get the Dataset object from the config (should have been instantiated in _init_acquisition_cycle)
             ds = get_safe(config, 'dataset_object')
 
-            base_nd_check = get_safe(ext_dset_res.update_description.parameters, 'new_data_check')
+            # The check persisted by the last acquisition, or the one the resource was configured with
+            base_nd_check = get_safe(config, 'new_data_check') or get_safe(ext_dset_res.update_description.parameters, 'new_data_check')
 
             t_slice = slice(None)
-            if base_nd_check:
-                t_new_vname = ext_dset_res.dataset_description.parameters['temporal_dimension']
-                t_new_arr = ds.variables[t_new_vname][t_slice]
-
-                new_data = msgpack.packb(t_new_arr, default=encode_ion)
-                if new_data != base_nd_check:
-                    #new time data has arrived, figure out what's different and build the new slice
-                    first_index = -1
-                    last_index = -1
-                    t_old_arr = msgpack.unpackb(base_nd_check, object_hook=decode_ion)
-                    for new_data in t_new_arr:
-                        if not new_data in t_old_arr:
-                            if first_index == -1:
-                                first_index = np.nonzero(t_new_arr == new_data)[0][0]
-                                last_index = np.nonzero(t_new_arr == new_data)[0][0]
-                            else:
-                                last_index = np.nonzero(t_new_arr == new_data)[0][0]
-
-                    t_slice = slice(first_index, last_index)
+            t_vname = get_safe(ext_dset_res.dataset_description.parameters, 'temporal_dimension')
+            if t_vname and t_vname in ds.variables:
+                t_new_arr = np.ma.getdata(ds.variables[t_vname][:])
+                if base_nd_check:
+                    new_idx = cls._find_new_times(t_new_arr, base_nd_check)
+                    if not new_idx.size:
+                        raise NoNewDataWarning()
+                    t_slice = slice(int(new_idx[0]), int(new_idx[-1]) + 1)
+
+                # The new new_data_check - used for the next "new data" evaluation
+                config['set_new_data_check'] = cls._get_time_fingerprint(t_new_arr)
 
             return {
                 'temporal_slice': t_slice
@@ -71,6 +64,43 @@ class NetcdfDataHandler(BaseDataHandler):
 
         return None
 
+    @classmethod
+    def _get_time_fingerprint(cls, t_arr):
+        """
+        Compact new data check for a time array: its size, last value and a digest of its contents
+        @param t_arr the time array
+        @retval dict with 'size', 'last' and 'sha1'
+        """
+        t_arr = np.ascontiguousarray(t_arr)
+        return {
+            'size': int(t_arr.size),
+            'last': t_arr[-1].item() if t_arr.size else None,
+            'sha1': hashlib.sha1(t_arr.tostring()).hexdigest(),
+        }
+
+    @classmethod
+    def _find_new_times(cls, t_new_arr, base_nd_check):
+        """
+        Returns the indices of the times in t_new_arr that are not covered by the new data check
+        @param t_new_arr the current time array
+        @param base_nd_check a time fingerprint, or the msgpacked time array older checks held
+        @retval sorted array of indices into t_new_arr
+        """
+        t_new_arr = np.ascontiguousarray(t_new_arr)
+        if isinstance(base_nd_check, dict):
+            size = base_nd_check['size']
+            if t_new_arr.size >= size and hashlib.sha1(t_new_arr[:size].tostring()).hexdigest() == base_nd_check['sha1']:
+                # Only appended to since the check, the common case
+                return np.arange(size, t_new_arr.size)
+            # Rewritten, anything after the last time checked is new
+            last = base_nd_check['last']
+            if last is None:
+                return np.arange(t_new_arr.size)
+            return np.nonzero(t_new_arr > last)[0]
+
+        t_old_arr = np.asanyarray(msgpack.unpackb(base_nd_check, object_hook=decode_ion))
+        return np.nonzero(np.logical_not(np.in1d(t_new_arr, t_old_arr)))[0]
+
     @classmethod
     def _constraints_for_historical_request(cls, config):
         """
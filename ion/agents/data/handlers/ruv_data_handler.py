@@ -9,7 +9,7 @@
 from pyon.public import log
 from pyon.util.containers import get_safe
 from ion.agents.data.handlers.base_data_handler import BaseDataHandler, NoNewDataWarning
-from ion.agents.data.handlers.handler_utils import list_file_info, get_sbuffer, get_time_from_filename
+from ion.agents.data.handlers.handler_utils import list_file_info, get_new_file_info, get_sbuffer, get_time_from_filename
 import numpy as np
 import re
 from StringIO import StringIO
@@ -54,7 +54,7 @@ class RuvDataHandler(BaseDataHandler):
         curr_list = list_file_info(base_url, list_pattern)
 
         # Determine which files are new
-        new_list = [x for x in curr_list if x not in old_list]
+        new_list = get_new_file_info(curr_list, old_list)
 
         if len(new_list) is 0:
             raise NoNewDataWarning()
@@ -205,9 +205,6 @@ class RuvParser(object):
             'TMIN': ('Mn',),
             'TSEC': ('S',), }, }
 
-    header_map = {}
-    table_map = {}
-
     _ctf_re = re.compile('%CTF: ?([0-9]+(?:\.[0-9]*)?)')
 
     _h_line_re = re.compile('%([a-zA-Z:]*) ?(.*)')
@@ -240,13 +237,18 @@ class RuvParser(object):
         tbl_hdrs = self._tbl_hdrs_re.findall(tbl_core)
         tbl_p_map = {}
         data_map = {}
+        # Read the table once, a column per column type
+        data = np.genfromtxt(StringIO(tbl_core.replace('%', '')), skip_header=len(tbl_hdrs), usecols=range(len(ctypes)), missing_values='999.000')
+        data = data.reshape(-1, len(ctypes))
         for i in xrange(len(ctypes)):
             tbl_p_map[ctypes[i]] = self._col_type_map[tbl_key][ctypes[i]]
-            data_map[ctypes[i]] = np.genfromtxt(StringIO(tbl_core.replace('%', '')), skip_header=len(tbl_hdrs), usecols=i, missing_values='999.000')
+            data_map[ctypes[i]] = data[:, i]
 
         self.table_map[tbl_key] = {'params': tbl_p_map, 'data': data_map}
 
     def __init__(self, url):
+        self.header_map = {}
+        self.table_map = {}
 
         fstr = None
         sb = None
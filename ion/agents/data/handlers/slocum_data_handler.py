@@ -11,7 +11,7 @@ from pyon.public import log
 from pyon.util.containers import get_safe
 from ion.services.dm.utility.granule.record_dictionary import RecordDictionaryTool
 from ion.agents.data.handlers.base_data_handler import BaseDataHandler
-from ion.agents.data.handlers.handler_utils import list_file_info, get_sbuffer, calculate_iteration_count, get_time_from_filename
+from ion.agents.data.handlers.handler_utils import list_file_info, get_new_file_info, get_sbuffer, calculate_iteration_count, get_time_from_filename
 import numpy as np
 
 DH_CONFIG_DETAILS = {
@@ -56,7 +56,7 @@ class SlocumDataHandler(BaseDataHandler):
 
         curr_list = list_file_info(base_url, list_pattern)
 
-        new_list = [x for x in curr_list if x not in old_list]
+        new_list = get_new_file_info(curr_list, old_list)
 
         ret['start_time'] = get_time_from_filename(new_list[0][0], date_extraction_pattern, date_pattern)
         ret['end_time'] = get_time_from_filename(new_list[len(new_list) - 1][0], date_extraction_pattern, date_pattern)
@@ -98,6 +98,7 @@ class SlocumDataHandler(BaseDataHandler):
         """
         new_flst = get_safe(config, 'constraints.new_files', [])
         hdr_cnt = get_safe(config, 'header_count', SlocumParser.DEFAULT_HEADER_SIZE)
+        stream_def_obj = None
         for f in new_flst:
             try:
                 parser = SlocumParser(f[0], hdr_cnt)
@@ -113,11 +114,14 @@ class SlocumDataHandler(BaseDataHandler):
                 dprod_id = get_safe(config, 'data_producer_id', 'unknown data producer')
 
                 stream_def = get_safe(config, 'stream_def')
+                if stream_def_obj is None:
+                    # Read once, every granule is built from it and references it by id
+                    stream_def_obj = RecordDictionaryTool.read_stream_def(stream_def)
 
                 cnt = calculate_iteration_count(len(parser.data_map[parser.data_map.keys()[0]]), max_rec)
                 for x in xrange(cnt):
                     #rdt = RecordDictionaryTool(taxonomy=ttool)
-                    rdt = RecordDictionaryTool(stream_definition_id=stream_def)
+                    rdt = RecordDictionaryTool(stream_definition=stream_def_obj, stream_definition_id=stream_def)
 
                     for name in parser.sensor_map:
                         d = parser.data_map[name][x * max_rec:(x + 1) * max_rec]
@@ -135,9 +139,8 @@ class SlocumParser(object):
     # John K's documentation says there are 16 header lines, but I believe there are actually 17
     # The 17th indicating the 'dtype' of the data for that column
     DEFAULT_HEADER_SIZE = 17
-    header_map = {}
-    sensor_map = {}
-    data_map = {}
+    # Byte size in the header -> column dtype
+    _dtype_map = {'1': 'byte', '2': 'short', '4': 'float', '8': 'double'}
 
     def __init__(self, url=None, header_size=17):
         """
@@ -150,6 +153,9 @@ class SlocumParser(object):
             raise SlocumParseException('Must provide a filename')
 
         self.header_size = int(header_size)
+        self.header_map = {}
+        self.sensor_map = {}
+        self.data_map = {}
 
         sb = None
         try:
@@ -165,24 +171,17 @@ class SlocumParser(object):
             sensor_names = sb.readline().split()
             units = sb.readline().split()
             # Keep track of the intended data type for each sensor
-            dtypes = []
-            for d in sb.readline().split():
-                if d is '1':
-                    dtypes.append('byte')
-                elif d is '2':
-                    dtypes.append('short')
-                elif d is '4':
-                    dtypes.append('float')
-                elif d is '8':
-                    dtypes.append('double')
+            dtypes = [self._dtype_map[d] for d in sb.readline().split() if d in self._dtype_map]
 
             assert len(sensor_names) == len(units) == len(dtypes)
 
+            # Read the table once into a structured array, a field per sensor
+            sb.seek(0)
+            fields = [('f{0}'.format(i), d) for i, d in enumerate(dtypes)]
+            dat = np.atleast_1d(np.genfromtxt(fname=sb, skip_header=self.header_size, usecols=range(len(dtypes)), dtype=fields, missing_values='NaN'))
             for i in xrange(len(sensor_names)):
-                sb.seek(0)
                 self.sensor_map[sensor_names[i]] = (units[i], dtypes[i])
-                dat = np.genfromtxt(fname=sb, skip_header=self.header_size, usecols=i, dtype=dtypes[i], missing_values='NaN')  # ,usemask=True)
-                self.data_map[sensor_names[i]] = dat
+                self.data_map[sensor_names[i]] = dat[fields[i][0]]
 
         finally:
             if not sb is None:
@@ -22,6 +22,7 @@ from interface.objects import Granule, Attachment, StreamRoute
 
 from ion.agents.data.handlers.base_data_handler import BaseDataHandler,\
     ConfigurationError, DummyDataHandler, FibonacciDataHandler
+from ion.agents.data.handlers.hypm_data_handler import HYPMDataHandler
 from ion.services.dm.utility.granule.record_dictionary import\
     RecordDictionaryTool
 from pyon.agent.agent import ResourceAgentState
@@ -106,6 +107,67 @@ class TestBaseDataHandlerUnit(PyonTestCase):
         self.assertEqual(publisher.publish.call_count, 0)
         self.assertEqual(log_mock.warn.call_count, 3)
 
+    def _file_granules(self, config, count, fail_after=None):
+        # Records its progress in the new data check before each granule, like the HYPM and SBE52 handlers do
+        for i in xrange(count):
+            if i == fail_after:
+                raise IOError('read failed')
+            config['set_new_data_check'][0] = ('file', i)
+            yield Mock(spec=Granule)
+
+    def _granules(self, count, fail_after=None):
+        for i in xrange(count):
+            if i == fail_after:
+                raise IOError('read failed')
+            yield Mock(spec=Granule)
+
+    def test__publish_data_checkpoints(self):
+        publisher = Mock()
+        update_new_data_check_attachment = Mock()
+        config = {'external_dataset_res_id': 'res_id', 'set_new_data_check': [('file', None)],
+                  'checkpoint_granules': 2, 'checkpoint_interval': 3600}
+
+        HYPMDataHandler._publish_data(publisher, self._file_granules(config, 5), config, update_new_data_check_attachment)
+
+        self.assertEqual(publisher.publish.call_count, 5)
+        expected = [call('res_id', [('file', 1)]), call('res_id', [('file', 3)]), call('res_id', [('file', 4)])]
+        self.assertEqual(update_new_data_check_attachment.call_args_list, expected)
+
+        # No final checkpoint when nothing was published since the last one
+        update_new_data_check_attachment.reset_mock()
+        HYPMDataHandler._publish_data(publisher, self._file_granules(config, 2), config, update_new_data_check_attachment)
+        self.assertEqual(update_new_data_check_attachment.call_args_list, [call('res_id', [('file', 1)])])
+
+    def test__publish_data_checkpoint_on_error(self):
+        publisher = Mock()
+        update_new_data_check_attachment = Mock()
+        config = {'external_dataset_res_id': 'res_id', 'set_new_data_check': [('file', None)],
+                  'checkpoint_granules': 100, 'checkpoint_interval': 3600}
+
+        with self.assertRaises(IOError):
+            HYPMDataHandler._publish_data(publisher, self._file_granules(config, 5, fail_after=3), config, update_new_data_check_attachment)
+
+        # The next acquisition resumes after the last granule published
+        update_new_data_check_attachment.assert_called_once_with('res_id', [('file', 2)])
+
+    def test__publish_data_whole_acquisition_check(self):
+        # The file list handlers set the check to the current listing before anything is published
+        publisher = Mock()
+        update_new_data_check_attachment = Mock()
+        listing = [('file_a', 1000., 10, 0), ('file_b', 1001., 20, 0)]
+        config = {'external_dataset_res_id': 'res_id', 'set_new_data_check': listing,
+                  'checkpoint_granules': 1, 'checkpoint_interval': 0}
+
+        # Not persisted part way through, or when publishing fails, the unpublished files are read again
+        with self.assertRaises(IOError):
+            DummyDataHandler._publish_data(publisher, self._granules(5, fail_after=3), config, update_new_data_check_attachment)
+        self.assertEqual(publisher.publish.call_count, 3)
+        self.assertFalse(update_new_data_check_attachment.called)
+
+        # Persisted once publishing completes
+        DummyDataHandler._publish_data(publisher, self._granules(5), config, update_new_data_check_attachment)
+        update_new_data_check_attachment.assert_called_once_with('res_id', listing)
+
     def test__publish_data_no_generator(self):
         publisher = Mock()
         data_generator = Mock()
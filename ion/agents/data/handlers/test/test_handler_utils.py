@@ -2,7 +2,7 @@ from mock import MagicMock, patch
 from nose.plugins.attrib import attr
 from ion.agents.data.handlers.handler_utils import _get_type, list_file_info, \
     list_file_info_http, list_file_info_ftp, list_file_info_fs, \
-    get_time_from_filename, calculate_iteration_count, get_sbuffer
+    get_time_from_filename, calculate_iteration_count, get_sbuffer, get_new_file_info
 from pyon.util.unit_test import PyonTestCase
 
 import requests
@@ -122,6 +122,17 @@ class TestHandlerUtils(PyonTestCase):
                          date_extraction_pattern='RDLm_SEAB_([\d]{4})_([\d]{2})_([\d]{2})_([\d]{2})([\d]{2}).ruv',
                          date_pattern='%Y %m %d %H %M'), 1338998400.0)
 
+    def test_get_new_file_info(self):
+        # Persisted checks come back as lists
+        old_list = [['a.dat', 100.0, 10, 0], ['b.dat', 100.0, 10, 0], ['c.dat', 100.0, 10, 0]]
+        curr_list = [('a.dat', 100.0, 10, 0), ('b.dat', 200.0, 20, 0), ('d.dat', 300.0, 30, 0)]
+        self.assertEqual(get_new_file_info(curr_list, old_list), [('b.dat', 200.0, 20, 0), ('d.dat', 300.0, 30, 0)])
+        self.assertEqual(get_new_file_info(curr_list, curr_list), [])
+        self.assertEqual(get_new_file_info(curr_list, []), curr_list)
+
+        # Names only
+        self.assertEqual(get_new_file_info(['a.dat', 'b.dat'], ['a.dat']), ['b.dat'])
+
     def test_calculate_iteration_count(self):
         total_recs = 100
         max_rec = 10
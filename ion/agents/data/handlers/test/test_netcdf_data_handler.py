@@ -14,10 +14,12 @@ from mock import Mock, sentinel, MagicMock, patch
 
 from ion.services.dm.utility.granule.record_dictionary import RecordDictionaryTool
 from ion.agents.data.handlers.netcdf_data_handler import NetcdfDataHandler
+from ion.agents.data.handlers.base_data_handler import NoNewDataWarning
 from interface.objects import ContactInformation, UpdateDescription, DatasetDescription, ExternalDataset, Granule
 from netCDF4 import Dataset
 from pyon.core.interceptor.encode import encode_ion
 import msgpack
+import numpy as np
 
 
 @attr('UNIT', group='eoi')
@@ -101,7 +103,32 @@ class TestNetcdfDataHandlerUnit(PyonTestCase):
 
         ret = NetcdfDataHandler._constraints_for_new_request(config)
         #log.debug('test__constraints_for_new_request: {0}'.format(ret['temporal_slice']))
-        self.assertEqual(ret['temporal_slice'], slice(281, 295, None))
+        # Times 281 through 295 are new
+        self.assertEqual(ret['temporal_slice'], slice(281, 296, None))
+
+        # The next check is the compact fingerprint of the whole time array
+        fingerprint = config['set_new_data_check']
+        self.assertEqual(fingerprint['size'], 296)
+        self.assertRaises(NoNewDataWarning, NetcdfDataHandler._constraints_for_new_request,
+                          {'external_dataset_res': edres, 'dataset_object': config['dataset_object'], 'new_data_check': fingerprint})
+
+    def test__find_new_times(self):
+        t_old = np.arange(0, 100, dtype='float64')
+        fingerprint = NetcdfDataHandler._get_time_fingerprint(t_old)
+        self.assertEqual(fingerprint['last'], 99.)
+
+        # Appended
+        t_new = np.arange(0, 110, dtype='float64')
+        np.testing.assert_array_equal(NetcdfDataHandler._find_new_times(t_new, fingerprint), np.arange(100, 110))
+        self.assertEqual(NetcdfDataHandler._find_new_times(t_old, fingerprint).size, 0)
+
+        # Rewritten, only the times after the last one checked are new
+        t_new = np.arange(50, 105, dtype='float64')
+        np.testing.assert_array_equal(NetcdfDataHandler._find_new_times(t_new, fingerprint), np.arange(50, 55))
+
+        # Checks holding the whole time array
+        packed = msgpack.packb(range(0, 100, 2), default=encode_ion)
+        np.testing.assert_array_equal(NetcdfDataHandler._find_new_times(t_old[:10], packed), [1, 3, 5, 7, 9])
 
     def test__constrainst_for_historical_request(self):
         config = {}
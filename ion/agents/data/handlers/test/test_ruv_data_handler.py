@@ -14,9 +14,29 @@ from mock import Mock, patch
 
 from ion.agents.data.handlers.base_data_handler import NoNewDataWarning
 from ion.agents.data.handlers.handler_utils import list_file_info
-from ion.agents.data.handlers.ruv_data_handler import RuvDataHandler
+from ion.agents.data.handlers.ruv_data_handler import RuvDataHandler, RuvParser
 from interface.objects import ContactInformation, UpdateDescription, DatasetDescription, ExternalDataset
 
+from StringIO import StringIO
+import numpy as np
+import time
+
+
+def read_per_column(url):
+    '''
+    The parser used to read each table once per column type, the reference for the single pass parse
+    '''
+    with open(url) as f:
+        fstr = f.read()
+    tables = {}
+    for m in RuvParser._tbl_type_re.finditer(fstr):
+        tbl_str = fstr[m.start():RuvParser._tbl_end_re.search(fstr, m.start()).end()]
+        core = tbl_str[RuvParser._tbl_strt_re.search(tbl_str).end() + 1:RuvParser._tbl_end_re.search(tbl_str).start() - 1]
+        ctypes = RuvParser._tbl_col_types_re.search(tbl_str).group(1).split()
+        tables[m.group(1)] = dict((ctype, np.genfromtxt(StringIO(core.replace('%', '')), skip_header=len(RuvParser._tbl_hdrs_re.findall(core)), usecols=i, missing_values='999.000'))
+                                  for i, ctype in enumerate(ctypes))
+    return tables
+
 
 @attr('UNIT', group='eoi')
 class TestRuvDataHandlerUnit(PyonTestCase):
@@ -238,6 +258,19 @@ class TestRuvDataHandlerUnit(PyonTestCase):
         for x in RuvDataHandler._get_data(config):
             log.debug('test__get_data: {0}'.format(x))
 
+    def test_parser(self):
+        url = 'test_data/ruv/RDLm_SEAB_2012_06_06_1500.ruv'
+        parser = RuvParser(url)
+
+        self.assertEquals(set(parser.table_map), set(['LLUV RDL9', 'rads rad1', 'rcvr rcv2']))
+        self.assertEquals(parser.table_map['LLUV RDL9']['params']['VELU'], ('U comp', 'cm/s'))
+        self.assertEquals(len(parser.table_map['LLUV RDL9']['data']['VELU']), 542)
+
+        for table, columns in read_per_column(url).iteritems():
+            data_map = parser.table_map[table]['data']
+            for ctype, values in columns.iteritems():
+                np.testing.assert_array_equal(data_map[ctype], np.atleast_1d(values))
+
         #    def test__get_data_with_exception(self):
         #        config = {
         #            'constraints':{
@@ -281,3 +314,24 @@ class TestRuvDataHandlerUnit(PyonTestCase):
 #        log.debug('test__constraints_for_historical_request: NEW_FILES == {0}'.format(ret['new_files']))
 #        files = list_file_info(config['ds_params']['base_url'], config['ds_params']['list_pattern'])
 #        self.assertEqual(ret['new_files'], files)
+
+
+# Timings only, run with: bin/nosetests -a BENCHMARK
+@attr('BENCHMARK', group='eoi')
+class TestRuvParserBenchmark(PyonTestCase):
+
+    def test_parser_benchmark(self):
+        url = 'test_data/ruv/RDLm_SEAB_2012_06_06_1500.ruv'
+
+        then = time.time()
+        parser = RuvParser(url)
+        parser_time = time.time() - then
+
+        then = time.time()
+        expected = read_per_column(url)
+        per_column_time = time.time() - then
+
+        log.info('Parsing %s: per column %.4fs, single pass %.4fs', url, per_column_time, parser_time)
+        for table, columns in expected.iteritems():
+            for ctype, values in columns.iteritems():
+                np.testing.assert_array_equal(parser.table_map[table]['data'][ctype], np.atleast_1d(values))
@@ -12,9 +12,23 @@ from pyon.util.unit_test import PyonTestCase
 from nose.plugins.attrib import attr
 from mock import patch, Mock, MagicMock, sentinel
 from ion.agents.data.handlers.handler_utils import list_file_info
-from ion.agents.data.handlers.slocum_data_handler import SlocumDataHandler
+from ion.agents.data.handlers.slocum_data_handler import SlocumDataHandler, SlocumParser
 from ion.services.dm.utility.granule.record_dictionary import RecordDictionaryTool
-from interface.objects import ContactInformation, UpdateDescription, DatasetDescription, ExternalDataset, Granule
+from interface.objects import ContactInformation, UpdateDescription, DatasetDescription, ExternalDataset, Granule, StreamDefinition
+from coverage_model import ParameterContext, ParameterDictionary, QuantityType
+
+import numpy as np
+import time
+
+
+def read_per_column(url, parser):
+    '''
+    The parser used to read the file once per sensor, the reference for the single pass parse
+    '''
+    with open(url) as f:
+        sensor_names = f.readlines()[14].split()
+    return dict((name, np.genfromtxt(fname=url, skip_header=17, usecols=i, dtype=parser.sensor_map[name][1], missing_values='NaN'))
+                for i, name in enumerate(sensor_names))
 
 
 @attr('UNIT', group='eoi')
@@ -100,6 +114,45 @@ class TestSlocumDataHandlerUnit(PyonTestCase):
             retval.to_granule.assert_any_call()
             log.debug(x)
 
+    def test__get_data_granules(self):
+        url = 'test_data/slocum/ru05-2012-021-0-0-sbd.dat'
+        parser = SlocumParser(url)
+        pdict = ParameterDictionary()
+        for name in parser.sensor_map:
+            pdict.add_context(ParameterContext(name, param_type=QuantityType(value_encoding=parser.data_map[name].dtype)), name == 'm_present_time')
+        stream_def = StreamDefinition(parameter_dictionary=pdict.dump())
+        stream_def._id = 'slocum_stream_def_id'
+        config = {
+            'constraints': {
+                'new_files': [(url, 1337261358.0, 521081), ]
+            },
+            'max_records': 100,
+            'stream_def': 'slocum_stream_def_id'
+        }
+
+        with patch.object(RecordDictionaryTool, 'read_stream_def', return_value=stream_def) as read_stream_def:
+            granules = list(SlocumDataHandler._get_data(config))
+            # The stream definition is read once, the granules only reference it
+            self.assertEquals(read_stream_def.call_count, 1)
+            for g in granules:
+                self.assertIsNone(g.stream_definition)
+                self.assertEquals(g.stream_definition_id, 'slocum_stream_def_id')
+                self.assertEquals(g.param_dictionary, {})
+            rdt = RecordDictionaryTool.load_from_granule(granules[0])
+            np.testing.assert_array_equal(rdt['m_present_time'], parser.data_map['m_present_time'][:100])
+        self.assertEquals(sum(g.domain[0] for g in granules), len(parser.data_map['m_present_time']))
+
+    def test_parser(self):
+        url = 'test_data/slocum/ru05-2012-021-0-0-sbd.dat'
+        parser = SlocumParser(url)
+        expected = read_per_column(url, parser)
+
+        self.assertEquals(set(parser.data_map), set(expected))
+        self.assertEquals(parser.sensor_map['m_present_time'], ('timestamp', 'double'))
+        for name, values in expected.iteritems():
+            self.assertEquals(parser.data_map[name].dtype, values.dtype)
+            np.testing.assert_array_equal(parser.data_map[name], values)
+
     def test__constraints_for_historical_request(self):
         config = {
             'ds_params': {
@@ -118,3 +171,23 @@ class TestSlocumDataHandlerUnit(PyonTestCase):
         ret = SlocumDataHandler._constraints_for_historical_request(config)
         log.debug('test_constraints_for_historical_request: {0}'.format(config))
         self.assertEqual(ret['new_files'], list_file_info(config['ds_params']['base_url'], config['ds_params']['list_pattern']))
+
+
+# Timings only, run with: bin/nosetests -a BENCHMARK
+@attr('BENCHMARK', group='eoi')
+class TestSlocumParserBenchmark(PyonTestCase):
+
+    def test_parser_benchmark(self):
+        url = 'test_data/slocum/ru05-2012-021-0-0-sbd.dat'
+
+        then = time.time()
+        parser = SlocumParser(url)
+        parser_time = time.time() - then
+
+        then = time.time()
+        expected = read_per_column(url, parser)
+        per_column_time = time.time() - then
+
+        log.info('Parsing %s (%d sensors): per column %.4fs, single pass %.4fs', url, len(expected), per_column_time, parser_time)
+        for name, values in expected.iteritems():
+            np.testing.assert_array_equal(parser.data_map[name], values)
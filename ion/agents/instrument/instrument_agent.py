@@ -992,12 +992,10 @@ class InstrumentAgent(ResourceAgent):
         self._asp.on_sample(val)
         try:
             stream_name = val['stream_name']
-            values = val['values']
-            for v in values:
-                value = v['value']
-                value_id = v['value_id']
-                self._aam.process_alerts(stream_name=stream_name,
-                                         value=value, value_id=value_id)
+            values = {}
+            for v in val['values']:
+                values.setdefault(v['value_id'], []).append(v['value'])
+            self._aam.process_value_alerts(stream_name, values)
         except Exception as ex:
             log.error('Insturment agent %s could not process alerts for driver tomato %s',
                       self._proc_name, str(val))
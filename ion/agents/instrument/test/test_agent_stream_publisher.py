@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+'''
+@file ion/agents/instrument/test/test_agent_stream_publisher.py
+@brief Unit tests and a benchmark for the agent stream sample buffer
+'''
+
+from pyon.util.unit_test import PyonTestCase
+from pyon.util.log import log
+from pyon.util.containers import DotDict
+from ion.agents.agent_stream_publisher import StreamSampleBuffer, AgentStreamPublisher
+from ion.agents.populate_rdt import ParticleSchema
+from ion.services.dm.utility.granule import RecordDictionaryTool
+from interface.objects import StreamDefinition
+from coverage_model import ParameterContext, ParameterDictionary, QuantityType
+from nose.plugins.attrib import attr
+from mock import Mock, patch
+
+import base64
+import numpy
+import time
+
+
+FIELDS = ['time', 'driver_timestamp', 'preferred_timestamp', 'quality_flag', 'port_timestamp',
+          'internal_timestamp', 'lat', 'lon', 'temp', 'conductivity', 'pressure', 'raw']
+
+def sample(ts):
+    return {'driver_timestamp':ts, 'pkt_format_id':'JSON_Data', 'pkt_version':1, 'stream_name':'parsed',
+            'preferred_timestamp':'driver_timestamp', 'quality_flag':'ok',
+            'values':[{'value_id':'temp', 'value':ts + 1}, {'value_id':'conductivity', 'value':ts + 2},
+                      {'value_id':'pressure', 'value':ts + 3}, {'value_id':'unknown', 'value':0},
+                      {'value_id':'raw', 'value':base64.b64encode('raw %s' % ts), 'binary':True}]}
+
+
+class SampleSchemaTestCase(PyonTestCase):
+    def setUp(self):
+        dtypes = {'time':numpy.dtype('float64'), 'temp':numpy.dtype('float32'),
+                  'conductivity':numpy.dtype('float32'), 'pressure':numpy.dtype('float32')}
+        self.schema = ParticleSchema(FIELDS, 'time', dtypes, dict((k, -9999.) for k in dtypes))
+
+    def assert_same(self, data, expected):
+        self.assertEquals(set(data), set(expected))
+        for k, v in expected.iteritems():
+            self.assertEquals(data[k].dtype, v.dtype)
+            self.assertEquals(data[k].tolist(), v.tolist())
+
+
+@attr('UNIT', group='sa')
+class StreamSampleBufferTest(SampleSchemaTestCase):
+    def test_drain(self):
+        buf = StreamSampleBuffer(self.schema, capacity=10)
+        samples = [sample(float(i)) for i in xrange(4)]
+        # Pressure missing from one sample
+        samples[2]['values'] = [v for v in samples[2]['values'] if v['value_id'] != 'pressure']
+        for s in samples:
+            self.assertTrue(buf.append(s))
+        self.assertEquals(len(buf), 4)
+
+        count, data = buf.drain()
+        self.assertEquals(count, 4)
+        self.assertEquals(data['time'].tolist(), [0., 1., 2., 3.])
+        self.assertEquals(data['pressure'].tolist(), [3., 4., -9999., 6.])
+        self.assertEquals(data['temp'].dtype, numpy.dtype('float32'))
+        self.assertEquals(data['raw'].tolist(), ['raw 0.0', 'raw 1.0', 'raw 2.0', 'raw 3.0'])
+        self.assertNotIn('driver_timestamp', data)
+        self.assert_same(data, self.schema.convert(samples))
+
+        self.assertEquals(buf.drain(), (0, {}))
+
+    def test_wrapped_drain(self):
+        # Binary values are decoded in order after the ring wraps around
+        buf = StreamSampleBuffer(self.schema, capacity=3, policy='drop_oldest')
+        samples = [sample(float(i)) for i in xrange(5)]
+        for s in samples:
+            buf.append(s)
+        count, data = buf.drain()
+        self.assertEquals(data['raw'].tolist(), ['raw 2.0', 'raw 3.0', 'raw 4.0'])
+        self.assert_same(data, self.schema.convert(samples[2:]))
+
+    def test_policies(self):
+        buf = StreamSampleBuffer(self.schema, capacity=3, policy='drop_oldest')
+        for i in xrange(5):
+            buf.append(sample(float(i)))
+        self.assertTrue(buf.full())
+        self.assertEquals(buf.dropped, 2)
+        count, data = buf.drain()
+        self.assertEquals(data['time'].tolist(), [2., 3., 4.])
+
+        # A drained buffer starts over at the first slot
+        buf.append(sample(5.))
+        self.assertEquals(buf.drain()[1]['temp'].tolist(), [6.])
+
+        buf = StreamSampleBuffer(self.schema, capacity=3, policy='drop_newest')
+        results = [buf.append(sample(float(i))) for i in xrange(5)]
+        self.assertEquals(results, [True, True, True, False, False])
+        self.assertEquals(buf.drain()[1]['time'].tolist(), [0., 1., 2.])
+
+
+# Timings only, run with: bin/nosetests -a BENCHMARK
+@attr('BENCHMARK', group='sa')
+class StreamSampleBufferBenchmark(SampleSchemaTestCase):
+    def test_benchmark(self):
+        # Ten seconds of a 1 kHz instrument published once a second
+        rate, seconds = 1000, 10
+        samples = [sample(3564867147. + i / float(rate)) for i in xrange(rate * seconds)]
+
+        then = time.time()
+        for second in xrange(seconds):
+            pending = []
+            for s in samples[second * rate:(second + 1) * rate]:
+                pending.insert(0, s)
+            vals = [pending.pop() for i in xrange(len(pending))]
+            expected = self.schema.convert(vals)
+            # The granule was formatted for the log on every publish
+            ['%s: %s' % (k, v) for k, v in expected.iteritems()]
+        list_time = time.time() - then
+
+        buf = StreamSampleBuffer(self.schema, capacity=rate)
+        then = time.time()
+        for second in xrange(seconds):
+            for s in samples[second * rate:(second + 1) * rate]:
+                buf.append(s)
+            count, data = buf.drain()
+        buffer_time = time.time() - then
+
+        log.info('Staging %d samples at %d Hz: list, conversion and log %.4fs, ring buffer %.4fs',
+                 len(samples), rate, list_time, buffer_time)
+        self.assertEquals(count, rate)
+        self.assert_same(data, expected)
+
+
+@attr('UNIT', group='sa')
+class AgentStreamPublisherTest(PyonTestCase):
+    def setUp(self):
+        pdict = ParameterDictionary()
+        pdict.add_context(ParameterContext('time', param_type=QuantityType(value_encoding=numpy.dtype('float64'))), True)
+        pdict.add_context(ParameterContext('temp', param_type=QuantityType(value_encoding=numpy.dtype('float32'))))
+        self.stream_def = StreamDefinition(parameter_dictionary=pdict.dump())
+        self.stream_def._id = 'stream_def_id'
+
+        self.agent = Mock()
+        self.agent._proc_name = 'agent'
+        self.agent.resource_id = 'agent_id'
+        self.agent.aparam_streams = {}
+        self.agent.aparam_pubrate = {}
+        self.agent.CFG = DotDict({'stream_config' : {'parsed' : {'stream_definition_ref':'stream_def_id',
+            'exchange_point':'xp', 'routing_key':'parsed', 'stream_id':'stream_id'}}})
+
+    @patch('ion.agents.agent_stream_publisher.StreamPublisher')
+    def test_granule_references_stream_definition(self, stream_publisher):
+        with patch.object(RecordDictionaryTool, 'read_stream_def', return_value=self.stream_def) as read_stream_def:
+            publisher = AgentStreamPublisher(self.agent)
+            publisher.reset_connection()
+            publisher.on_sample(sample(0.))
+            publisher.on_sample(sample(1.))
+            # The definition is read once for the stream, not for every granule
+            self.assertEquals(read_stream_def.call_count, 1)
+
+            granules = [c[0][0] for c in stream_publisher.return_value.publish.call_args_list]
+            self.assertEquals(len(granules), 2)
+            for granule in granules:
+                self.assertIsNone(granule.stream_definition)
+                self.assertEquals(granule.stream_definition_id, 'stream_def_id')
+                self.assertEquals(granule.param_dictionary, {})
+            rdt = RecordDictionaryTool.load_from_granule(granules[-1])
+            self.assertEquals(rdt['temp'].tolist(), [2.])
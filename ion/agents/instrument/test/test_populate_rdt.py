@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+'''
+@file ion/agents/instrument/test/test_populate_rdt.py
+@brief Unit tests and a benchmark for the compiled particle to column conversion
+'''
+
+from pyon.util.unit_test import PyonTestCase
+from pyon.util.log import log
+from ion.agents.populate_rdt import populate_rdt, ParticleSchema
+from ion.services.dm.utility.granule import RecordDictionaryTool
+from coverage_model import ParameterContext, ParameterDictionary, QuantityType, ArrayType
+from nose.plugins.attrib import attr
+
+import base64
+import numpy as np
+import time
+
+
+def legacy_populate_rdt(rdt, vals):
+    '''
+    populate_rdt before the particle schema, the reference for the conversion
+    '''
+    array_size = len(vals)
+    data_arrays = {}
+    data_arrays[rdt.temporal_parameter] = [None] * array_size
+    for i, particle in enumerate(vals):
+        for k,v in particle.iteritems():
+            if k == 'values':
+                for value_dict in v:
+                    value_id = value_dict['value_id']
+                    value = value_dict['value']
+                    if value_id in rdt:
+                        if value_id not in data_arrays:
+                            data_arrays[value_id] = [None] * array_size
+                        if 'binary' in value_dict:
+                            value = base64.b64decode(value)
+                        data_arrays[value_id][i] = value
+            elif k == 'driver_timestamp':
+                data_arrays[rdt.temporal_parameter][i] = v
+            elif k in rdt:
+                if k not in data_arrays:
+                    data_arrays[k] = [None] * array_size
+                data_arrays[k][i] = v
+    for k,v in data_arrays.iteritems():
+        rdt[k] = np.array(v)
+    return rdt
+
+
+class ParticleTestCase(PyonTestCase):
+    def setUp(self):
+        self.pdict = ParameterDictionary()
+        self.pdict.add_context(ParameterContext('time', param_type=QuantityType(value_encoding=np.dtype('float64')), fill_value=-9999.), True)
+        for name in ('driver_timestamp', 'port_timestamp'):
+            self.pdict.add_context(ParameterContext(name, param_type=QuantityType(value_encoding=np.dtype('float64')), fill_value=-9999.))
+        for name in ('temp', 'conductivity', 'pressure'):
+            self.pdict.add_context(ParameterContext(name, param_type=QuantityType(value_encoding=np.dtype('float32')), fill_value=-9999.))
+        for name in ('quality_flag', 'raw'):
+            self.pdict.add_context(ParameterContext(name, param_type=ArrayType()))
+
+    def particles(self, count):
+        particles = []
+        for i in xrange(count):
+            ts = 3564867147. + i
+            values = [{'value_id':'temp', 'value':i + 0.5}, {'value_id':'conductivity', 'value':i + 1.5},
+                      {'value_id':'unknown', 'value':0},
+                      {'value_id':'raw', 'value':base64.b64encode('raw sample %s' % i), 'binary':True}]
+            # Pressure is only reported every other sample
+            if i % 2:
+                values.append({'value_id':'pressure', 'value':i + 2.5})
+            particles.append({'driver_timestamp':ts, 'port_timestamp':ts - 1, 'quality_flag':'ok',
+                              'pkt_format_id':'JSON_Data', 'stream_name':'parsed', 'values':values})
+        return particles
+
+    def assert_rdts_equal(self, rdt, expected):
+        self.assertEquals(set(rdt.iterkeys()), set(expected.iterkeys()))
+        for k, v in expected.iteritems():
+            np.testing.assert_array_equal(rdt[k], v)
+
+
+@attr('UNIT', group='sa')
+class PopulateRDTTest(ParticleTestCase):
+    def test_convert(self):
+        particles = self.particles(4)
+        rdt = populate_rdt(RecordDictionaryTool(param_dictionary=self.pdict), particles)
+        self.assert_rdts_equal(rdt, legacy_populate_rdt(RecordDictionaryTool(param_dictionary=self.pdict), particles))
+
+        np.testing.assert_array_equal(rdt['time'], [3564867147., 3564867148., 3564867149., 3564867150.])
+        np.testing.assert_array_equal(rdt['pressure'], [-9999., 3.5, -9999., 5.5])
+        self.assertEquals(list(rdt['raw']), ['raw sample 0', 'raw sample 1', 'raw sample 2', 'raw sample 3'])
+        self.assertIsNone(rdt['driver_timestamp'])
+
+        data = ParticleSchema.for_rdt(rdt).convert(particles)
+        self.assertEquals(data['temp'].dtype, np.dtype('float32'))
+        self.assertNotIn('unknown', data)
+
+    def test_schema_cache(self):
+        rdt = RecordDictionaryTool(param_dictionary=self.pdict)
+        schema = ParticleSchema.for_rdt(rdt)
+        self.assertIs(ParticleSchema.for_rdt(RecordDictionaryTool(param_dictionary=self.pdict)), schema)
+        self.assertEquals(schema.temporal_parameter, 'time')
+        self.assertEquals(schema.fill_values['temp'], -9999.)
+        self.assertNotIn('raw', schema.dtypes)
+
+
+# Timings only, run with: bin/nosetests -a BENCHMARK
+@attr('BENCHMARK', group='sa')
+class PopulateRDTBenchmark(ParticleTestCase):
+    def test_benchmark(self):
+        particles = self.particles(5000)
+
+        then = time.time()
+        expected = legacy_populate_rdt(RecordDictionaryTool(param_dictionary=self.pdict), particles)
+        legacy_time = time.time() - then
+
+        then = time.time()
+        rdt = populate_rdt(RecordDictionaryTool(param_dictionary=self.pdict), particles)
+        schema_time = time.time() - then
+
+        log.info('Populating %d particles: legacy %.4fs, compiled schema %.4fs', len(particles), legacy_time, schema_time)
+        self.assert_rdts_equal(rdt, expected)
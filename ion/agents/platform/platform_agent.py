@@ -940,17 +940,15 @@ class PlatformAgent(ResourceAgent):
     def _dispatch_value_alerts(self, stream_name, param_name, vals):
         """
         Dispatches alerts related with the values that were just generated.
-        Note: for convenience at the moment, the AgentAlertManager.process_alerts
-        call is done for each value in the vals list. A future version may include
-        a more elaborated algorithm to analyze the sequence for alert purposes.
-        """
-        for value in vals:
-            if value is not None:
-                log.trace('%r: to call process_alerts: stream_name=%r '
-                          'value_id=%r value=%s',
-                          self._platform_id, stream_name, param_name, value)
-                self._aam.process_alerts(stream_name=stream_name,
-                                         value=value, value_id=param_name)
+        The whole vals sequence is evaluated as one batch by
+        AgentAlertManager.process_value_alerts.
+        """
+        vals = [value for value in vals if value is not None]
+        if vals:
+            log.trace('%r: to call process_value_alerts: stream_name=%r '
+                      'value_id=%r values=%s',
+                      self._platform_id, stream_name, param_name, vals)
+            self._aam.process_value_alerts(stream_name, {param_name: vals})
 
     def _handle_external_event_driver_event(self, driver_event):
 
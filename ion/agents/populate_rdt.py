@@ -11,44 +11,138 @@ __author__ = 'Edward Hunter'
 __license__ = 'Apache 2.0'
 
 import numpy
-import base64
+import binascii
 
-def populate_rdt(rdt, vals):
-    
-    
-    array_size = len(vals)
-    data_arrays = {}    
-        
-    # Populate the temporal parameter.
-    data_arrays[rdt.temporal_parameter] = [None] * array_size
-        
-    
-    for i, particle in enumerate(vals):
-        for k,v in particle.iteritems():
-            if k == 'values':
-                for value_dict in v:
-                    value_id = value_dict['value_id']
-                    value = value_dict['value']
-                    if value_id in rdt:
-                        if value_id not in data_arrays:
-                            data_arrays[value_id] = [None] * array_size
+from coverage_model import QuantityType
+
+
+class ParticleSchema(object):
+    """
+    Particle to column mapping compiled once per stream definition: the
+    stream fields with the dtype and fill value of each quantity field, and
+    the temporal parameter the driver timestamp goes to.
+    """
+    # Compiled schemas, keyed by parameter dictionary and available fields.
+    _cache = {}
+    CACHE_LIMIT = 100
+
+    def __init__(self, fields, temporal_parameter, dtypes=None, fill_values=None):
+        self.fields = frozenset(fields)
+        self.temporal_parameter = temporal_parameter
+        self.dtypes = dtypes or {}
+        self.fill_values = fill_values or {}
+
+    @classmethod
+    def for_rdt(cls, rdt):
+        """
+        Returns the schema for the record dictionary's stream definition.
+        """
+        fields = rdt.fields
+        # The schema holds on to the parameter dictionary so its id stays unique.
+        key = (id(rdt._pdict), frozenset(fields))
+        entry = cls._cache.get(key)
+        if entry is not None and entry[0] is rdt._pdict:
+            return entry[1]
+
+        dtypes = {}
+        fill_values = {}
+        for field in fields:
+            context = rdt.context(field)
+            if isinstance(context.param_type, QuantityType):
+                dtypes[field] = numpy.dtype(context.param_type.value_encoding)
+                fill_values[field] = context.fill_value
+        schema = cls(fields, rdt.temporal_parameter, dtypes, fill_values)
+
+        if len(cls._cache) >= cls.CACHE_LIMIT:
+            cls._cache.clear()
+        cls._cache[key] = (rdt._pdict, schema)
+        return schema
+
+    def convert(self, vals):
+        """
+        Returns a dict of field to value array for the particles, holding the
+        fields the particles carry and the temporal parameter.
+        """
+        size = len(vals)
+        fields = self.fields
+        temporal = [None] * size
+        columns = {self.temporal_parameter:temporal}
+        binary = {}
+
+        for i, particle in enumerate(vals):
+            for k, v in particle.iteritems():
+                if k == 'values':
+                    for value_dict in v:
+                        value_id = value_dict['value_id']
+                        if value_id not in fields:
+                            continue
+                        column = columns.get(value_id)
+                        if column is None:
+                            column = columns[value_id] = [None] * size
+                        column[i] = value_dict['value']
                         if 'binary' in value_dict:
-                            value = base64.b64decode(value)
-                        data_arrays[value_id][i] = value
-            
-            elif k == 'driver_timestamp':
-                data_arrays[rdt.temporal_parameter][i] = v
-            
-            elif k in rdt:
-                if k not in data_arrays:
-                    data_arrays[k] = [None] * array_size
-                data_arrays[k][i] = v
-                
-    for k,v in data_arrays.iteritems():
-        rdt[k] = numpy.array(v)
-    
+                            binary.setdefault(value_id, []).append(i)
+
+                elif k == 'driver_timestamp':
+                    temporal[i] = v
+
+                elif k in fields:
+                    column = columns.get(k)
+                    if column is None:
+                        column = columns[k] = [None] * size
+                    column[i] = v
+
+        return self.to_arrays(columns, binary)
+
+    def to_arrays(self, columns, binary=None):
+        """
+        Returns a dict of field to value array for particle value columns.
+        binary maps a field to the positions of its base64 encoded values,
+        they are decoded a column at a time.
+        """
+        for field, indices in (binary or {}).iteritems():
+            column = columns[field]
+            for i, value in zip(indices, b64decode_batch([column[i] for i in indices])):
+                column[i] = value
+
+        return dict((field, self._to_array(field, column)) for field, column in columns.iteritems())
+
+    def _to_array(self, field, column):
+        dtype = self.dtypes.get(field)
+        if dtype is None:
+            return numpy.array(column)
+        fill_value = self.fill_values[field]
+        if None in column:
+            column = [fill_value if v is None else v for v in column]
+        try:
+            return numpy.array(column, dtype=dtype)
+        except (TypeError, ValueError):
+            # Leave values that do not cast to the record dictionary to reject.
+            return numpy.array(column)
+
+
+def b64decode_batch(encoded):
+    """
+    Decodes a list of base64 strings in one pass over the C decoder. The
+    strings are padded individually, so their concatenation cannot be
+    decoded as one.
+    """
+    try:
+        return map(binascii.a2b_base64, encoded)
+    except binascii.Error, e:
+        # Same error base64.b64decode raises.
+        raise TypeError(e)
+
+
+def populate_rdt(rdt, vals):
+    """
+    Populates the record dictionary with a list of particles.
+    """
+    for k, v in ParticleSchema.for_rdt(rdt).convert(vals).iteritems():
+        rdt[k] = v
+
     return rdt
-                
+
 """
 OLD
 def populate_rdt(rdt, vals):
@@ -55,6 +55,12 @@ class ScienceGranuleIngestionWorker(TransformStreamListener, BaseIngestionWorker
 
         self._bad_coverages = {}
 
+        #--------------------------------------------------------------------------------
+        # Micro-batching (group commit)
+        # - Pending granules per stream
+        #--------------------------------------------------------------------------------
+        self._batches = {}
+
         self.time_stats = Accumulator(format='%3f')
         # unique ID to identify this worker in log msgs
         self._id = uuid.uuid1()
@@ -96,14 +102,20 @@ class ScienceGranuleIngestionWorker(TransformStreamListener, BaseIngestionWorker
         self.qc_publisher = EventPublisher(event_type=OT.ParameterQCEvent)
         self.connection_id = ''
         self.connection_index = None
+
+        self.batch_granules = self.CFG.get_safe('service.ingestion.batch.max_granules', 1)
+        self.batch_bytes    = self.CFG.get_safe('service.ingestion.batch.max_bytes', 0)
+        self.batch_latency  = self.CFG.get_safe('service.ingestion.batch.max_latency', 0)
+        self.batch_lock     = RLock()
+        self.batch_flusher  = None
         
         self.start_listener()
 
     def on_quit(self): #pragma no cover
-        self.event_publisher.close()
-        self.qc_publisher.close()
         if self.subscriber_thread:
             self.stop_listener()
+        self.event_publisher.close()
+        self.qc_publisher.close()
         for stream, coverage in self._coverages.iteritems():
             try:
                 coverage.close(timeout=5)
@@ -118,12 +130,18 @@ class ScienceGranuleIngestionWorker(TransformStreamListener, BaseIngestionWorker
         # We use a lock here to prevent possible race conditions from starting multiple listeners and coverage clobbering
         with self.thread_lock:
             self.subscriber_thread = self._process.thread_manager.spawn(self.subscriber.listen, thread_name='%s-subscriber' % self.id)
+            if self.batching and self.batch_latency:
+                self.batch_flusher = self._process.thread_manager.spawn(self.flush_stale_batches, thread_name='%s-batch-flusher' % self.id)
 
     def stop_listener(self):
         # Avoid race conditions with coverage operations (Don't start a listener at the same time as closing one)
         with self.thread_lock:
             self.subscriber.close()
             self.subscriber_thread.join(timeout=10)
+            if self.batch_flusher is not None:
+                self.batch_flusher.kill()
+                self.batch_flusher = None
+            self.flush_all_batches()
             for stream, coverage in self._coverages.iteritems():
                 try:
                     coverage.close(timeout=5)
@@ -283,16 +301,96 @@ class ScienceGranuleIngestionWorker(TransformStreamListener, BaseIngestionWorker
             log.debug('Empty granule for stream %s', stream_id)
             return
 
-        self.persist_or_timeout(stream_id, rdt)
+        if self.batching:
+            self.buffer_granule(stream_id, rdt)
+        else:
+            self.persist_or_timeout(stream_id, rdt)
+
+    @property
+    def batching(self):
+        return self.batch_granules > 1 or self.batch_bytes > 0 or self.batch_latency > 0
+
+    def buffer_granule(self, stream_id, rdt):
+        '''
+        Adds the granule to the pending batch for the stream and commits the batch
+        once any of the granule count, byte size or latency limits are reached.
+        Gaps and changes in sparse values close the pending batch so that each
+        committed batch is equivalent to persisting its granules one at a time.
+        '''
+        with self.batch_lock:
+            gap_found = False
+            if not self.ignore_gaps:
+                gap_found = self.has_gap(rdt.connection_id, rdt.connection_index)
+
+            batch = self._batches.get(stream_id)
+            if batch is not None and (gap_found or not batch.accepts(rdt)):
+                self.flush_batch(stream_id)
+                batch = None
+
+            if gap_found:
+                # Persisted on its own so add_granule handles the new coverage and the splice
+                self.persist_or_timeout(stream_id, rdt)
+                return
+
+            if batch is None:
+                batch = GranuleBatch()
+                self._batches[stream_id] = batch
+            batch.add(rdt)
+            self.update_connection_index(rdt.connection_id, rdt.connection_index)
+
+            if batch.ready(self.batch_granules, self.batch_bytes, self.batch_latency):
+                self.flush_batch(stream_id)
+
+    def flush_batch(self, stream_id):
+        '''
+        Persists the pending batch for a stream as a single write, or one granule at a time if the
+        batch can't be concatenated. The batch stays pending until it has been persisted.
+        '''
+        with self.batch_lock:
+            batch = self._batches.get(stream_id)
+            if batch is None or not batch.rdts:
+                self._batches.pop(stream_id, None)
+                return
+            try:
+                rdt = RecordDictionaryTool.concatenate(batch.rdts)
+            except Exception:
+                log.exception('%s: could not concatenate the batch for stream %s, persisting its %d granules one at a time', self._id, stream_id, len(batch.rdts))
+                while batch.rdts:
+                    self.persist_or_timeout(stream_id, batch.rdts[0], check_gaps=False)
+                    batch.rdts.pop(0)
+            else:
+                log.debug('%s: committing batch of %d granules (%d records) for stream %s', self._id, len(batch.rdts), len(rdt), stream_id)
+                self.persist_or_timeout(stream_id, rdt, check_gaps=False)
+            self._batches.pop(stream_id, None)
 
-    def persist_or_timeout(self, stream_id, rdt):
+    def flush_all_batches(self):
+        with self.batch_lock:
+            for stream_id in self._batches.keys():
+                try:
+                    self.flush_batch(stream_id)
+                except:
+                    log.exception('Failed to commit pending batch for stream %s', stream_id)
+
+    def flush_stale_batches(self):
+        ''' Commits batches which have been pending longer than the configured latency '''
+        interval = min(1., self.batch_latency / 2.)
+        while True:
+            gevent.sleep(interval)
+            for stream_id, batch in self._batches.items():
+                if batch.ready(0, 0, self.batch_latency):
+                    try:
+                        self.flush_batch(stream_id)
+                    except:
+                        log.exception('Failed to commit pending batch for stream %s', stream_id)
+
+    def persist_or_timeout(self, stream_id, rdt, check_gaps=True):
         """ retry writing coverage multiple times and eventually time out """
         done = False
         timeout = 2
         start = time.time()
         while not done:
             try:
-                self.add_granule(stream_id, rdt)
+                self.add_granule(stream_id, rdt, check_gaps=check_gaps)
                 done = True
             except:
                 log.exception('An issue with coverage, retrying after a bit')
@@ -331,7 +429,7 @@ class ScienceGranuleIngestionWorker(TransformStreamListener, BaseIngestionWorker
         lookup_value_document_keys = self.lookup_docs
         for key in lookup_value_document_keys:
             try:
-                document = self.stored_value_manager.read_value(key)
+                document = self.stored_value_manager.read_cached_value(key)
                 if lookup_value in document:
                     return document[lookup_value] 
             except NotFound:
@@ -397,7 +495,7 @@ class ScienceGranuleIngestionWorker(TransformStreamListener, BaseIngestionWorker
             ntp_time = TimeUtils.ts_to_units(coverage.get_parameter_context('ingestion_timestamp').uom, t_now)
             coverage.set_parameter_values(param_name='ingestion_timestamp', tdoa=slice_, value=ntp_time)
     
-    def add_granule(self,stream_id, rdt):
+    def add_granule(self,stream_id, rdt, check_gaps=True):
         ''' Appends the granule's data to the coverage and persists it. '''
         debugging = log.isEnabledFor(DEBUG)
         timer = Timer() if debugging else None
@@ -408,7 +506,8 @@ class ScienceGranuleIngestionWorker(TransformStreamListener, BaseIngestionWorker
         #--------------------------------------------------------------------------------
         # Gap Analysis
         #--------------------------------------------------------------------------------
-        if not self.ignore_gaps:
+        gap_found = False
+        if check_gaps and not self.ignore_gaps:
             gap_found = self.has_gap(rdt.connection_id, rdt.connection_index)
             if gap_found:
                 log.error('Gap Found!   New connection: (%s,%s)\tOld Connection: (%s,%s)', rdt.connection_id, rdt.connection_index, self.connection_id, self.connection_index)
@@ -470,7 +569,7 @@ class ScienceGranuleIngestionWorker(TransformStreamListener, BaseIngestionWorker
         start_index = coverage.num_timesteps - elements
         self.dataset_changed(dataset_id,coverage.num_timesteps,(start_index,start_index+elements))
 
-        if not self.ignore_gaps and gap_found:
+        if gap_found:
             self.splice_coverage(dataset_id, coverage)
 
         self.evaluate_qc(rdt, dataset_id)
@@ -495,3 +594,57 @@ class ScienceGranuleIngestionWorker(TransformStreamListener, BaseIngestionWorker
         log.debug('%s total times: %s', self._id, self.time_stats)
 
 
+class GranuleBatch(object):
+    '''
+    Pending granules for a single stream awaiting a group commit.
+    Granules are only grouped when they carry the same set of fields and the
+    same value for every sparse constant field.
+    '''
+    def __init__(self):
+        self.rdts    = []
+        self.nbytes  = 0
+        self.created = time.time()
+        self._fields = None
+        self._sparse = None
+
+    @staticmethod
+    def sparse_values(rdt):
+        '''
+        Returns the value of each sparse constant field in the granule or None
+        if any of them changes within the granule.
+        '''
+        values = {}
+        for field in rdt.iterkeys():
+            if not isinstance(rdt.context(field).param_type, SparseConstantType):
+                continue
+            arr = np.atleast_1d(rdt[field])
+            if not (arr == arr[0]).all():
+                return None
+            values[field] = arr[0]
+        return values
+
+    def accepts(self, rdt):
+        if not self.rdts:
+            return True
+        if set(rdt.iterkeys()) != self._fields:
+            return False
+        sparse = self.sparse_values(rdt)
+        if sparse is None or sparse.keys() != self._sparse.keys():
+            return False
+        return all(np.all(sparse[k] == v) for k,v in self._sparse.iteritems())
+
+    def add(self, rdt):
+        if not self.rdts:
+            self._fields = set(rdt.iterkeys())
+            self._sparse = self.sparse_values(rdt) or {}
+        self.rdts.append(rdt)
+        self.nbytes += sum(getattr(rdt[k], 'nbytes', 0) for k in rdt.iterkeys())
+
+    def ready(self, max_granules, max_bytes, max_latency):
+        if max_granules and len(self.rdts) >= max_granules:
+            return True
+        if max_bytes and self.nbytes >= max_bytes:
+            return True
+        if max_latency and (time.time() - self.created) >= max_latency:
+            return True
+        return False
@@ -6,8 +6,15 @@
 '''
 
 from pyon.util.unit_test import PyonTestCase
-from ion.processes.data.ingestion.science_granule_ingestion_worker import ScienceGranuleIngestionWorker
+from pyon.core.exception import BadRequest
+from ion.processes.data.ingestion.science_granule_ingestion_worker import ScienceGranuleIngestionWorker, GranuleBatch
+from ion.services.dm.utility.granule.record_dictionary import RecordDictionaryTool
+from coverage_model import ParameterContext, ParameterDictionary, QuantityType, ArrayType
 from nose.plugins.attrib import attr
+from mock import Mock, patch
+from gevent.coros import RLock
+
+import numpy as np
 
 
 @attr('UNIT',group='dm')
@@ -41,3 +48,101 @@ class IngestionTest(PyonTestCase):
 
 
 
+
+    def test_ingestion_batching(self):
+
+        ingestion = ScienceGranuleIngestionWorker()
+        ingestion.connection_id = ''
+        ingestion.connection_index = None
+        ingestion.ignore_gaps = False
+        ingestion.batch_granules = 3
+        ingestion.batch_bytes = 0
+        ingestion.batch_latency = 0
+        ingestion.batch_lock = RLock()
+        ingestion.persist_or_timeout = Mock()
+        self.assertTrue(ingestion.batching)
+
+        def granule(index):
+            rdt = Mock()
+            rdt.connection_id = 'c1'
+            rdt.connection_index = str(index)
+            rdt.iterkeys.return_value = iter([])
+            return rdt
+
+        with patch('ion.processes.data.ingestion.science_granule_ingestion_worker.RecordDictionaryTool') as rdt_tool:
+            ingestion.buffer_granule('stream', granule(0))
+            ingestion.buffer_granule('stream', granule(1))
+            self.assertFalse(ingestion.persist_or_timeout.called)
+
+            ingestion.buffer_granule('stream', granule(2))
+            self.assertEquals(ingestion.persist_or_timeout.call_count, 1)
+            self.assertEquals(len(rdt_tool.concatenate.call_args[0][0]), 3)
+
+            # A gap commits the pending granule and persists the gapped one on its own
+            ingestion.buffer_granule('stream', granule(3))
+            ingestion.buffer_granule('stream', granule(7))
+            self.assertEquals(ingestion.persist_or_timeout.call_count, 3)
+            self.assertEquals(len(rdt_tool.concatenate.call_args[0][0]), 1)
+            self.assertEquals(ingestion._batches, {})
+
+    def batching_worker(self):
+        ingestion = ScienceGranuleIngestionWorker()
+        ingestion._id = 'ingestion'
+        ingestion.batch_lock = RLock()
+        ingestion._batches = {}
+        ingestion.persist_or_timeout = Mock()
+        return ingestion
+
+    def test_flush_batch_concatenate(self):
+        pdict = ParameterDictionary()
+        pdict.add_context(ParameterContext('time', param_type=QuantityType(value_encoding=np.dtype('float64')), fill_value=-9999.), True)
+        pdict.add_context(ParameterContext('temp', param_type=QuantityType(value_encoding=np.dtype('float32')), fill_value=-9999.))
+        pdict.add_context(ParameterContext('raw', param_type=ArrayType()))
+
+        def rdt(times, **fields):
+            rdt = RecordDictionaryTool(param_dictionary=pdict)
+            rdt['time'] = np.array(times, dtype='float64')
+            for k, v in fields.iteritems():
+                rdt[k] = v
+            return rdt
+
+        # Fields set in some of the granules only, and a field set to nothing but fill values
+        batch = GranuleBatch()
+        batch.rdts = [rdt([0, 1], temp=np.array([10., 11.])),
+                      rdt([2], raw=np.array(['a'], dtype=object)),
+                      rdt([3, 4], temp=np.array([-9999., -9999.]))]
+        ingestion = self.batching_worker()
+        ingestion._batches['stream'] = batch
+
+        ingestion.flush_batch('stream')
+        self.assertEquals(ingestion.persist_or_timeout.call_count, 1)
+        persisted = ingestion.persist_or_timeout.call_args[0][1]
+        np.testing.assert_array_equal(persisted['time'], [0., 1., 2., 3., 4.])
+        np.testing.assert_array_equal(persisted['temp'], [10., 11., -9999., -9999., -9999.])
+        self.assertEquals(persisted['temp'].dtype, np.dtype('float32'))
+        self.assertEquals(len(persisted['raw']), 5)
+        self.assertEquals(persisted['raw'][2], 'a')
+        self.assertEquals(ingestion._batches, {})
+
+    def test_flush_batch_failures(self):
+        ingestion = self.batching_worker()
+        rdts = [Mock(), Mock(), Mock()]
+        batch = GranuleBatch()
+        batch.rdts = list(rdts)
+        ingestion._batches['stream'] = batch
+
+        with patch('ion.processes.data.ingestion.science_granule_ingestion_worker.RecordDictionaryTool') as rdt_tool:
+            # A failed write keeps the granules pending
+            ingestion.persist_or_timeout.side_effect = IOError('coverage')
+            with self.assertRaises(IOError):
+                ingestion.flush_batch('stream')
+            self.assertIs(ingestion._batches['stream'], batch)
+            self.assertEquals(batch.rdts, rdts)
+
+            # Granules that can't be concatenated are persisted one at a time
+            ingestion.persist_or_timeout.side_effect = None
+            ingestion.persist_or_timeout.reset_mock()
+            rdt_tool.concatenate.side_effect = BadRequest('shape')
+            ingestion.flush_batch('stream')
+            self.assertEquals([c[0][1] for c in ingestion.persist_or_timeout.call_args_list], rdts)
+            self.assertEquals(ingestion._batches, {})
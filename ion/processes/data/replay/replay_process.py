@@ -11,9 +11,10 @@ from pyon.core.object import IonObjectDeserializer
 from pyon.core.bootstrap import get_obj_registry
 from pyon.util.arg_check import validate_is_instance
 from pyon.util.log import log
+from pyon.public import CFG
 
-from ion.services.dm.inventory.dataset_management_service import DatasetManagementService
 from ion.services.dm.utility.granule import RecordDictionaryTool
+from ion.services.dm.utility.coverage_pool import CoveragePool
 from ion.util.time_utils import TimeUtils
 
 from coverage_model import utils
@@ -27,6 +28,7 @@ from pyon.core.exception import CorruptionError
 
 from gevent.event import Event
 from numbers import Number
+import collections
 import gevent
 import numpy as np
 
@@ -58,6 +60,9 @@ class ReplayProcess(BaseReplayProcess):
     stream_id       = ''
     stream_def_id   = ''
 
+    # Temporal axis per coverage, keyed by (persistence directory, number of timesteps) (LRU)
+    _time_cache      = collections.OrderedDict()
+    TIME_CACHE_LIMIT = CFG.get_safe('container.replay.time_cache', 5)
 
     def __init__(self, *args, **kwargs):
         super(ReplayProcess,self).__init__(*args,**kwargs)
@@ -98,19 +103,57 @@ class ReplayProcess(BaseReplayProcess):
         self.pubsub = PubsubManagementServiceProcessClient(process=self)
 
 
+    @classmethod
+    def get_time_values(cls, coverage):
+        '''
+        Returns the coverage's temporal axis, cached until the coverage gains new timesteps
+        '''
+        key = (coverage.persistence_dir, coverage.num_timesteps)
+        try:
+            values = cls._time_cache.pop(key)
+        except KeyError:
+            values = np.atleast_1d(coverage.get_parameter_values(coverage.temporal_parameter_name))
+            values.flags.writeable = False
+            if len(cls._time_cache) >= cls.TIME_CACHE_LIMIT:
+                cls._time_cache.popitem(0)
+        cls._time_cache[key] = values
+        return values
+
     @classmethod
     def get_time_idx(cls, coverage, timeval):
         temporal_variable = coverage.temporal_parameter_name
         uom = coverage.get_parameter_context(temporal_variable).uom
+        if 'iso' in uom:
+            return None
         
         units = TimeUtils.ts_to_units(uom, timeval)
 
-        idx = TimeUtils.get_relative_time(coverage, units)
+        idx = TimeUtils.find_nearest(cls.get_time_values(coverage), units)
         return idx
 
+    @classmethod
+    def get_time_idxs(cls, coverage, timevals):
+        '''
+        Vectorized get_time_idx, resolves every timestamp with a single search of the temporal axis
+        '''
+        temporal_variable = coverage.temporal_parameter_name
+        uom = coverage.get_parameter_context(temporal_variable).uom
+        if 'iso' in uom:
+            return None
+
+        units = TimeUtils.ts_to_units_array(uom, timevals)
+        values = cls.get_time_values(coverage)
+        if values.shape[0] > 1 and not (np.diff(values) >= 0).all():
+            # Out of order temporal axis, search each value
+            return np.array([TimeUtils.find_nearest(values, i) for i in units])
+        return TimeUtils.find_nearest_sorted(values, units)
+
 
     @classmethod
-    def _coverage_to_granule(cls, coverage, start_time=None, end_time=None, stride_time=None, fuzzy_stride=True, parameters=None, stream_def_id=None, tdoa=None):
+    def _get_slice(cls, coverage, start_time=None, end_time=None, stride_time=None, fuzzy_stride=True, tdoa=None):
+        '''
+        Resolves the query into the temporal domain of the coverage, either a slice or a list of indices wrapped in a list
+        '''
         slice_ = slice(None) # Defaults to all values
 
 
@@ -122,15 +165,14 @@ class ReplayProcess(BaseReplayProcess):
         if stride_time is not None:
             validate_is_instance(stride_time, Number, 'stride_time must be a number for striding.')
 
-        if tdoa is not None and isinstance(tdoa,slice):
+        if tdoa is not None and isinstance(tdoa,(slice,list)):
             slice_ = tdoa
         
-        elif stride_time is not None and not fuzzy_stride: # SLOW 
-            ugly_range = np.arange(start_time, end_time, stride_time)
-            idx_values = [cls.get_time_idx(coverage,i) for i in ugly_range]
-            idx_values = list(set(idx_values)) # Removing duplicates - also mixes the order of the list!!!
-            idx_values.sort()
-            slice_ = [idx_values]
+        elif stride_time is not None and not fuzzy_stride:
+            idx_values = cls.get_time_idxs(coverage, np.arange(start_time, end_time, stride_time))
+            if idx_values is None:
+                raise BadRequest('Striding is not supported for ISO time units')
+            slice_ = [np.unique(idx_values).tolist()]
 
 
         elif not (start_time is None and end_time is None):
@@ -141,6 +183,11 @@ class ReplayProcess(BaseReplayProcess):
 
             slice_ = slice(start_time,end_time,stride_time)
             log.info('Slice: %s', slice_)
+        return slice_
+
+    @classmethod
+    def _coverage_to_granule(cls, coverage, start_time=None, end_time=None, stride_time=None, fuzzy_stride=True, parameters=None, stream_def_id=None, tdoa=None):
+        slice_ = cls._get_slice(coverage, start_time=start_time, end_time=end_time, stride_time=stride_time, fuzzy_stride=fuzzy_stride, tdoa=tdoa)
 
         if stream_def_id:
             rdt = RecordDictionaryTool(stream_definition_id=stream_def_id)
@@ -152,7 +199,7 @@ class ReplayProcess(BaseReplayProcess):
         else:
             fields = rdt.fields
 
-        if slice_.start == slice_.stop and slice_.start is not None:
+        if isinstance(slice_, slice) and slice_.start == slice_.stop and slice_.start is not None:
             log.warning('Requested empty set of data.  %s', slice_)
             return rdt
         
@@ -193,18 +240,21 @@ class ReplayProcess(BaseReplayProcess):
         execute_retrieve Executes a retrieval and returns the result 
         as a value in lieu of publishing it on a stream
         '''
+        coverage = None
         try: 
-            coverage = DatasetManagementService._get_coverage(self.dataset_id,mode='r')
+            coverage = CoveragePool.acquire(self.dataset_id)
             if coverage.num_timesteps == 0:
                 log.info('Reading from an empty coverage')
                 rdt = RecordDictionaryTool(param_dictionary=coverage.parameter_dictionary)
             else: 
                 rdt = self._coverage_to_granule(coverage=coverage,start_time=self.start_time, end_time=self.end_time, stride_time=self.stride_time, parameters=self.parameters,tdoa=self.tdoa)
         except:
+            CoveragePool.invalidate(self.dataset_id)
             log.exception('Problems reading from the coverage')
             raise BadRequest('Problems reading from the coverage')
         finally:
-            coverage.close(timeout=5)
+            if coverage is not None:
+                CoveragePool.release(self.dataset_id, coverage)
         return rdt.to_granule()
 
 
@@ -220,13 +270,15 @@ class ReplayProcess(BaseReplayProcess):
 
     def replay(self):
         self.publishing.set() # Minimal state, supposed to prevent two instances of the same process from replaying on the same stream
-        for rdt in self._replay():
-            if self.end.is_set():
-                return
-            self.play.wait()
-            self.output.publish(rdt.to_granule())
-
-        self.publishing.clear()
+        chunks = self._replay()
+        try:
+            for rdt in chunks:
+                if self.end.is_set():
+                    return
+                self.output.publish(rdt.to_granule())
+        finally:
+            chunks.close()
+            self.publishing.clear()
         return 
 
     def pause(self):
@@ -237,38 +289,54 @@ class ReplayProcess(BaseReplayProcess):
 
     def stop(self):
         self.end.set()
+        # A paused replay has to wake up to see it was stopped and release its coverage
+        self.play.set()
 
 
 
 
     @classmethod
     def get_last_values(cls, dataset_id, number_of_points, delivery_format):
-        coverage = DatasetManagementService._get_coverage(dataset_id,mode='r')
-        if coverage.num_timesteps < number_of_points:
-            if coverage.num_timesteps == 0:
-                rdt = RecordDictionaryTool(param_dictionary=coverage.parameter_dictionary)
-                return rdt.to_granule()
-            number_of_points = coverage.num_timesteps
-        rdt = cls._coverage_to_granule(coverage,tdoa=slice(-number_of_points,None),stream_def_id=delivery_format)
-        coverage.close(timeout=5)
+        with CoveragePool.read(dataset_id) as coverage:
+            if coverage.num_timesteps < number_of_points:
+                if coverage.num_timesteps == 0:
+                    rdt = RecordDictionaryTool(param_dictionary=coverage.parameter_dictionary)
+                    return rdt.to_granule()
+                number_of_points = coverage.num_timesteps
+            rdt = cls._coverage_to_granule(coverage,tdoa=slice(-number_of_points,None),stream_def_id=delivery_format)
         
         return rdt.to_granule()
 
-    def _replay(self):
-        coverage = DatasetManagementService._get_coverage(self.dataset_id,mode='r')
-        rdt = self._coverage_to_granule(coverage=coverage, start_time=self.start_time, end_time=self.end_time, stride_time=self.stride_time, parameters=self.parameters, stream_def_id=self.stream_def_id)
-        elements = len(rdt)
-        
-        for i in xrange(elements / self.publish_limit):
-            outgoing = RecordDictionaryTool(stream_definition_id=self.stream_def_id)
-            fields = self.parameters or outgoing.fields
-            for field in fields:
-                v = rdt[field]
-                if v is not None:
-                    outgoing[field] = v[(i*self.publish_limit) : ((i+1)*self.publish_limit)]
-            yield outgoing
-        coverage.close(timeout=5)
-        return 
+    def _replay_windows(self, coverage):
+        '''
+        Yields the temporal domain of the query in windows of at most publish_limit records
+        '''
+        slice_ = self._get_slice(coverage, start_time=self.start_time, end_time=self.end_time, stride_time=self.stride_time)
+        if isinstance(slice_, list):
+            indices = slice_[0]
+            for i in xrange(0, len(indices), self.publish_limit):
+                yield [indices[i:i+self.publish_limit]]
+            return
 
+        start, stop, step = slice_.indices(coverage.num_timesteps)
+        window = self.publish_limit * step
+        for i in xrange(start, stop, window):
+            yield slice(i, min(i + window, stop), step)
 
+    def _replay(self):
+        '''
+        Reads and yields the requested data one window at a time, the next window is only read once the previous
+        one has been consumed and playback is not paused.
+        '''
+        coverage = CoveragePool.acquire(self.dataset_id)
+        try:
+            if not coverage.num_timesteps:
+                return
+            for tdoa in self._replay_windows(coverage):
+                self.play.wait()
+                if self.end.is_set():
+                    return
+                yield self._coverage_to_granule(coverage=coverage, parameters=self.parameters, stream_def_id=self.stream_def_id, tdoa=tdoa)
+        finally:
+            CoveragePool.release(self.dataset_id, coverage)
 
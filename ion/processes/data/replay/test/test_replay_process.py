@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+'''
+@file ion/processes/data/replay/test/test_replay_process.py
+@brief Unit tests for the replay process
+'''
+
+from pyon.util.unit_test import PyonTestCase
+from ion.processes.data.replay.replay_process import ReplayProcess
+from nose.plugins.attrib import attr
+from mock import Mock, patch
+
+import numpy as np
+
+
+@attr('UNIT',group='dm')
+class ReplayProcessUnitTest(PyonTestCase):
+    def setUp(self):
+        self.replay = ReplayProcess()
+        self.replay.dataset_id = 'dataset'
+        self.replay.stream_def_id = 'stream_def'
+        self.replay.publish_limit = 10
+        self.replay.play.set()
+        self.coverage = Mock()
+        self.coverage.num_timesteps = 95
+
+    def test_replay_windows(self):
+        windows = list(self.replay._replay_windows(self.coverage))
+        self.assertEquals(len(windows), 10)
+        self.assertEquals(windows[0], slice(0, 10, 1))
+        # The trailing remainder is replayed too
+        self.assertEquals(windows[-1], slice(90, 95, 1))
+
+        # Without a start or end time the stride is ignored
+        self.replay.stride_time = 3
+        self.replay.start_time = None
+        self.replay.end_time = None
+        windows = list(self.replay._replay_windows(self.coverage))
+        self.assertEquals(windows[0], slice(0, 10, 1))
+
+        self.replay.start_time = 0
+        self.replay.end_time = 95
+        with patch.object(ReplayProcess, 'get_time_idx', side_effect=lambda coverage, t: int(t)):
+            windows = list(self.replay._replay_windows(self.coverage))
+        self.assertEquals(windows[0], slice(0, 30, 3))
+        self.assertEquals(windows[-1], slice(90, 95, 3))
+
+        # Index lists are windowed by record count
+        with patch.object(ReplayProcess, '_get_slice', return_value=[range(0, 95, 4)]):
+            windows = list(self.replay._replay_windows(self.coverage))
+        self.assertEquals(len(windows), 3)
+        self.assertEquals(windows[0], [range(0, 40, 4)])
+        self.assertEquals(windows[-1], [range(80, 95, 4)])
+
+    @patch('ion.processes.data.replay.replay_process.CoveragePool')
+    def test_replay_chunks(self, pool):
+        pool.acquire.return_value = self.coverage
+        self.replay._coverage_to_granule = Mock(side_effect=lambda **kwargs: kwargs['tdoa'])
+
+        chunks = self.replay._replay()
+        self.assertEquals(chunks.next(), slice(0, 10, 1))
+        # Windows are only read as they are consumed
+        self.assertEquals(self.replay._coverage_to_granule.call_count, 1)
+
+        # Stopping a paused replay ends it and returns the coverage to the pool
+        self.replay.pause()
+        self.replay.stop()
+        self.assertEquals(list(chunks), [])
+        pool.release.assert_called_once_with('dataset', self.coverage)
+
+    def test_time_idxs(self):
+        ReplayProcess._time_cache.clear()
+        self.coverage.persistence_dir = '/tmp/coverage'
+        self.coverage.temporal_parameter_name = 'time'
+        self.coverage.get_parameter_context.return_value.uom = 'seconds'
+        self.coverage.get_parameter_values.return_value = np.arange(0, 950, 10, dtype='float64')
+
+        timevals = np.arange(0, 900, 33)
+        idxs = ReplayProcess.get_time_idxs(self.coverage, timevals)
+        np.testing.assert_array_equal(idxs, [ReplayProcess.get_time_idx(self.coverage, i) for i in timevals])
+
+        # The temporal axis is read once per coverage extent
+        self.assertEquals(self.coverage.get_parameter_values.call_count, 1)
+        self.coverage.num_timesteps = 96
+        ReplayProcess.get_time_idx(self.coverage, 10)
+        self.assertEquals(self.coverage.get_parameter_values.call_count, 2)
+
+        slice_ = ReplayProcess._get_slice(self.coverage, start_time=0, end_time=100, stride_time=5, fuzzy_stride=False)
+        self.assertEquals(slice_, [range(10)])
@@ -8,15 +8,14 @@
 '''
 
 from pyon.public import log, RT
-from pyon.util.async import spawn
-from pyon.core.exception import BadRequest, NotFound
+from pyon.core.exception import NotFound
 from ion.core.process.transform import TransformEventListener
 from pyon.event.event import EventSubscriber
-from ion.services.dm.utility.uns_utility_methods import send_email, calculate_reverse_user_info
-from ion.services.dm.utility.uns_utility_methods import setting_up_smtp_client, check_user_notification_interest
+from ion.services.dm.utility.uns_utility_methods import calculate_reverse_user_info, SubscriptionIndex
+from ion.services.dm.utility.email_delivery import EmailDelivery
 from interface.services.coi.iresource_registry_service import ResourceRegistryServiceClient
 
-import gevent, time
+import gevent
 from gevent import queue
 
 class NotificationWorker(TransformEventListener):
@@ -41,6 +40,11 @@ class NotificationWorker(TransformEventListener):
 
         self.reverse_user_info = None
         self.user_info = None
+        self.subscriptions = None
+
+        # Emails go out from a bounded queue over pooled SMTP connections, see service.user_notification.delivery
+        self.delivery = EmailDelivery()
+        self.delivery.start()
 
         #------------------------------------------------------------------------------------
         # Start by loading the user info and reverse user info dictionaries
@@ -49,6 +53,7 @@ class NotificationWorker(TransformEventListener):
         try:
             self.user_info = self.load_user_info()
             self.reverse_user_info =  calculate_reverse_user_info(self.user_info)
+            self.subscriptions = SubscriptionIndex(self.reverse_user_info)
 
             log.debug("On start up, notification workers loaded the following user_info dictionary: %s" % self.user_info)
             log.debug("The calculated reverse user info: %s" % self.reverse_user_info )
@@ -77,6 +82,7 @@ class NotificationWorker(TransformEventListener):
                 log.warning("ElasticSearch has not yet loaded the user_index.")
 
             self.reverse_user_info =  calculate_reverse_user_info(self.user_info)
+            self.subscriptions = SubscriptionIndex(self.reverse_user_info)
             self.test_hook(self.user_info, self.reverse_user_info)
 
             log.debug("After a reload, the user_info: %s" % self.user_info)
@@ -91,6 +97,10 @@ class NotificationWorker(TransformEventListener):
 
         self.add_endpoint(self.reload_user_info_subscriber)
 
+    def on_quit(self):
+        self.delivery.stop()
+        log.debug("Notification worker email delivery: %s", self.delivery.stats())
+        super(NotificationWorker, self).on_quit()
 
     def process_event(self, msg, headers):
         """
@@ -102,19 +112,17 @@ class NotificationWorker(TransformEventListener):
 
         user_ids = []
         if self.reverse_user_info:
-            user_ids = check_user_notification_interest(event = msg, reverse_user_info = self.reverse_user_info)
+            user_ids = self.subscriptions.match(msg)
 
             log.debug("Notification worker found interested users %s" % user_ids)
 
         #------------------------------------------------------------------------------------
-        # Send email to the users
+        # Queue the email to the users
         #------------------------------------------------------------------------------------
 
         for user_id in user_ids:
             msg_recipient = self.user_info[user_id]['user_contact'].email
-            self.smtp_client = setting_up_smtp_client()
-            send_email(message = msg, msg_recipient = msg_recipient, smtp_client = self.smtp_client )
-            self.smtp_client.quit()
+            self.delivery.deliver(msg, msg_recipient)
 
 
     def load_user_info(self):
@@ -5,10 +5,13 @@
 @date Tue May  7 15:34:54 EDT 2013
 '''
 
-from pyon.core.exception import BadRequest
+from pyon.core.exception import BadRequest, NotFound
 from pyon.ion.process import ImmediateProcess, SimpleProcess
-from interface.services.dm.idata_retriever_service import DataRetrieverServiceProcessClient
-from ion.services.dm.utility.granule import RecordDictionaryTool
+from ion.processes.data.replay.replay_process import ReplayProcess
+from ion.services.dm.utility.coverage_pool import CoveragePool
+from ion.util.stored_values import StoredValueManager
+from coverage_model.parameter_functions import ParameterFunctionException
+from gevent.pool import Pool
 import time
 from pyon.ion.event import EventPublisher
 from pyon.public import OT, RT,PRED
@@ -22,65 +25,134 @@ class QCPostProcessing(SimpleProcess):
     QC Post Processing Process
 
     This process provides the capability to ION clients and operators to evaluate the automated quality control flags on
-    various data products. This process should be run periodically with overlapping spans of data to ensure complete
-    dataset QC verification.
+    various data products. Each run only evaluates the timesteps added to a dataset since the previous run, tracked by a
+    watermark stored per dataset. Every window is read with a few timesteps on either side so the windowed tests (spike,
+    stuck value) have context at the window boundaries. The first run for a dataset goes back run_interval + 1 hours.
 
     This parameters that this process accepts as configurations are:
-        - dataset_id: The dataset identifier, required.
-        - start_time: Unix timestamp, defaults to 24 hours in the past
-        - end_time: Unix timestamp, defaults to current time
+        - interval_key: origin of the timer events that trigger a run, required.
         - qc_params: a list of qc functions to evaluate, currently supported functions are: ['glblrng_qc',
           'spketst_qc', 'stuckvl_qc'], defaults to all
 
+    Tuning, under service.qc_processing:
+        - workers: number of datasets processed concurrently, defaults to 4
+        - window: number of timesteps read from the coverage at a time, defaults to 3600
+        - context: number of timesteps read on either side of each window, defaults to 10
+
     '''
 
     qc_suffixes = ['glblrng_qc', 'spketst_qc', 'stuckvl_qc']
     def on_start(self):
         SimpleProcess.on_start(self)
-        self.data_retriever = DataRetrieverServiceProcessClient(process=self)
         self.interval_key = self.CFG.get_safe('process.interval_key',None)
         self.qc_params    = self.CFG.get_safe('process.qc_params',[])
         validate_is_not_none(self.interval_key, 'An interval key is necessary to paunch this process')
         self.event_subscriber = EventSubscriber(event_type=OT.TimerEvent, origin=self.interval_key, callback=self._event_callback, auto_delete=True)
         self.add_endpoint(self.event_subscriber)
         self.resource_registry = self.container.resource_registry
+        self.stored_values = StoredValueManager(self.container)
+        self.qc_publisher = EventPublisher(event_type=OT.ParameterQCEvent)
         self.run_interval = self.CFG.get_safe('service.qc_processing.run_interval', 24)
+        self.workers      = self.CFG.get_safe('service.qc_processing.workers', 4)
+        self.window       = self.CFG.get_safe('service.qc_processing.window', 3600)
+        self.context      = self.CFG.get_safe('service.qc_processing.context', 10)
     
     def _event_callback(self, *args, **kwargs):
         log.info('QC Post Processing Triggered')
         dataset_ids, _ = self.resource_registry.find_resources(restype=RT.Dataset, id_only=True)
+        then = time.time()
+        pool = Pool(self.workers)
         for dataset_id in dataset_ids:
-            log.info('QC Post Processing for dataset %s', dataset_id)
-            self.process(dataset_id)
+            pool.spawn(self._process_dataset, dataset_id)
+        pool.join()
+        log.info('QC Post Processing of %d datasets took %.2fs', len(dataset_ids), time.time() - then)
+
+    def _process_dataset(self, dataset_id):
+        then = time.time()
+        try:
+            timesteps = self.process(dataset_id)
+        except Exception:
+            log.exception('QC Post Processing failed for dataset %s', dataset_id)
+            return
+        log.info('QC Post Processing for dataset %s: %d timesteps in %.2fs', dataset_id, timesteps, time.time() - then)
 
     def process(self, dataset_id, start_time=0, end_time=0):
+        '''
+        Evaluates the QC of the dataset and publishes a ParameterQCEvent for any failures. Without a start and end time
+        only the timesteps since the last run are evaluated and the watermark is advanced.
+
+        @retval the number of timesteps evaluated
+        '''
         if not dataset_id:
             raise BadRequest('No dataset id specified.')
-        now = time.time()
-        start_time = start_time or (now - (3600*(self.run_interval+1))) # Every N hours with 1 of overlap
-        end_time   = end_time or now
-        
+
         qc_params  = [i for i in self.qc_params if i in self.qc_suffixes] or self.qc_suffixes
-        
-        self.qc_publisher = EventPublisher(event_type=OT.ParameterQCEvent)
 
-        for st,et in self.chop(int(start_time),int(end_time)):
-            log.debug('Chopping %s:%s', st, et)
-            granule = self.data_retriever.retrieve(dataset_id, query={'start_time':st, 'end_time':et})
-            rdt = RecordDictionaryTool.load_from_granule(granule)
-            qc_fields = [i for i in rdt.fields if any([i.endswith(j) for j in qc_params])]
+        incremental = not (start_time or end_time)
+
+        with CoveragePool.read(dataset_id) as coverage:
+            num_timesteps = coverage.num_timesteps
+            if not num_timesteps: # Nothing to evaluate or to look up the times in
+                return 0
+            if incremental:
+                start = self.read_watermark(dataset_id)
+                if start is None or start > num_timesteps: # No previous run, or the coverage was rebuilt
+                    start = ReplayProcess.get_time_idx(coverage, time.time() - 3600*(self.run_interval+1)) or 0
+                stop = num_timesteps
+            else:
+                start = (ReplayProcess.get_time_idx(coverage, start_time) or 0) if start_time else 0
+                stop  = ReplayProcess.get_time_idx(coverage, end_time) + 1 if end_time else num_timesteps
+
+            if start >= stop:
+                return 0
+
+            qc_fields = [i for i in coverage.list_parameters() if any([i.endswith(j) for j in qc_params])]
             log.debug('QC Fields: %s', qc_fields)
+            if qc_fields:
+                self.evaluate(dataset_id, coverage, qc_fields, start, stop)
+
+        if incremental:
+            self.write_watermark(dataset_id, stop)
+        return stop - start
+
+    def evaluate(self, dataset_id, coverage, qc_fields, start, stop):
+        '''
+        Reads the QC fields for timesteps [start, stop) a window at a time and flags the failures
+        '''
+        num_timesteps = coverage.num_timesteps
+        for st in xrange(start, stop, self.window):
+            et = min(st + self.window, stop)
+            # Read some timesteps on either side of the window so the windowed tests see their neighbours,
+            # only the window itself is flagged
+            read_start = max(st - self.context, 0)
+            read_end   = min(et + self.context, num_timesteps)
+            log.debug('Reading timesteps %s:%s', read_start, read_end)
+            tdoa = slice(read_start, read_end)
+            times = None
             for field in qc_fields:
-                val = rdt[field]
+                try:
+                    val = coverage.get_parameter_values(field, tdoa=tdoa)
+                except ParameterFunctionException:
+                    continue
                 if val is None:
                     continue
+                val = np.atleast_1d(val)[st - read_start:et - read_start]
                 if not np.all(val):
                     log.debug('Found QC Alerts')
+                    if times is None:
+                        times = np.atleast_1d(coverage.get_parameter_values(coverage.temporal_parameter_name, tdoa=slice(st, et)))
                     indexes = np.where(val==0)
-                    timestamps = rdt[rdt.temporal_parameter][indexes[0]]
-                    self.flag_qc_parameter(dataset_id, field, timestamps.tolist(),{})
+                    self.flag_qc_parameter(dataset_id, field, times[indexes[0]].tolist(),{})
 
+    def read_watermark(self, dataset_id):
+        try:
+            return self.stored_values.read_value('qc_watermark_%s' % dataset_id)['timestep']
+        except (NotFound, KeyError):
+            return None
 
+    def write_watermark(self, dataset_id, timestep):
+        # The watermark is not read through the stored value cache, no need to tell the other processes
+        self.stored_values.stored_value_cas('qc_watermark_%s' % dataset_id, {'timestep':timestep, 'updated':time.time()}, notify=False)
 
     def flag_qc_parameter(self, dataset_id, parameter, temporal_values, configuration):
         log.info('Flagging QC for %s', parameter)
@@ -88,11 +160,3 @@ class QCPostProcessing(SimpleProcess):
         for data_product_id in data_product_ids:
             self.qc_publisher.publish_event(origin=data_product_id, qc_parameter=parameter, temporal_values=temporal_values, configuration=configuration)
 
-    @classmethod
-    def chop(cls, start_time, end_time):
-        while start_time < end_time:
-            yield (start_time, min(start_time+3600, end_time))
-            start_time = min(start_time+3600, end_time)
-        return
-
-
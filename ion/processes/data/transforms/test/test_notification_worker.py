@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+'''
+@file ion/processes/data/transforms/test/test_notification_worker.py
+@brief Unit tests for the pooled notification email delivery
+'''
+
+from pyon.util.unit_test import PyonTestCase
+from pyon.util.containers import DotDict
+from ion.services.dm.utility.email_delivery import EmailDelivery
+from nose.plugins.attrib import attr
+from gevent.server import StreamServer
+from mock import patch
+
+import gevent
+import smtplib
+
+
+class FakeSMTPServer(StreamServer):
+    '''
+    Just enough of an SMTP server to accept mail from smtplib, records each message and connection
+    '''
+    def __init__(self):
+        StreamServer.__init__(self, ('127.0.0.1', 0), self.session)
+        self.messages = []
+        self.connections = 0
+
+    def session(self, sock, address):
+        self.connections += 1
+        stream = sock.makefile()
+        def reply(line):
+            stream.write(line + '\r\n')
+            stream.flush()
+
+        reply('220 localhost fake SMTP')
+        while True:
+            line = stream.readline()
+            if not line:
+                break
+            command = line[:4].upper()
+            if command == 'DATA':
+                reply('354 End data with <CR><LF>.<CR><LF>')
+                data = []
+                for line in iter(stream.readline, ''):
+                    if line.rstrip('\r\n') == '.':
+                        break
+                    data.append(line)
+                self.messages.append(''.join(data))
+                reply('250 OK')
+            elif command == 'QUIT':
+                reply('221 Bye')
+                break
+            elif command in ('EHLO', 'HELO', 'MAIL', 'RCPT', 'RSET', 'NOOP'):
+                reply('250 OK')
+            else:
+                reply('502 Not implemented')
+        sock.close()
+
+
+@attr('UNIT',group='dm')
+@patch('ion.services.dm.utility.uns_utility_methods.get_sys_name', lambda: 'test')
+class EmailDeliveryUnitTest(PyonTestCase):
+    def setUp(self):
+        self.server = FakeSMTPServer()
+        self.server.start()
+        self.addCleanup(self.server.stop)
+
+    def connect(self):
+        return smtplib.SMTP('127.0.0.1', self.server.server_port)
+
+    def stale(self):
+        client = self.connect()
+        client.close()
+        return client
+
+    def event(self, origin):
+        return DotDict(type_='ResourceEvent', origin=origin, description='', ts_created='1000')
+
+    def test_pooled_connections(self):
+        delivery = EmailDelivery(workers=4, pool_size=2, coalesce_window=0, connect=self.connect)
+        delivery.start()
+        for i in xrange(20):
+            delivery.deliver(self.event('origin_%s' % i), 'user_%s@example.com' % i)
+        delivery.stop()
+
+        self.assertEquals(len(self.server.messages), 20)
+        self.assertLessEqual(self.server.connections, 2)
+        self.assertEquals(delivery.stats()['sent'], 20)
+
+    def test_coalesce_burst(self):
+        delivery = EmailDelivery(workers=1, pool_size=1, coalesce_window=0.2, connect=self.connect)
+        delivery.start()
+        for i in xrange(5):
+            delivery.deliver(self.event('origin_%s' % i), 'user@example.com')
+        gevent.sleep(0.5)
+        delivery.stop()
+
+        self.assertEquals(len(self.server.messages), 1)
+        self.assertIn('5 ION events from origin_0, origin_1', self.server.messages[0])
+        stats = delivery.stats()
+        self.assertEquals((stats['queued'], stats['coalesced'], stats['events_sent']), (1, 4, 5))
+
+    def test_backpressure(self):
+        # Nothing drains the queue until start, so the third recipient does not fit
+        delivery = EmailDelivery(workers=1, pool_size=1, queue_size=2, coalesce_window=0, put_timeout=0.01, connect=self.connect)
+        self.assertTrue(delivery.deliver(self.event('a'), 'a@example.com'))
+        self.assertTrue(delivery.deliver(self.event('b'), 'b@example.com'))
+        self.assertFalse(delivery.deliver(self.event('c'), 'c@example.com'))
+        self.assertEquals(delivery.stats()['dropped'], 1)
+        self.assertEquals(delivery.stats()['queue_depth'], 2)
+
+        delivery.start()
+        delivery.stop()
+        self.assertEquals(len(self.server.messages), 2)
+
+    def test_stale_connections(self):
+        # Every idle connection has been dropped, the retry has to open a new one
+        delivery = EmailDelivery(workers=1, pool_size=2, coalesce_window=0, connect=self.connect)
+        delivery.pool._idle.put(self.stale())
+        delivery.pool._idle.put(self.stale())
+        delivery.start()
+        delivery.deliver(self.event('origin'), 'user@example.com')
+        delivery.stop()
+
+        self.assertEquals(len(self.server.messages), 1)
+        stats = delivery.stats()
+        self.assertEquals((stats['sent'], stats['failed']), (1, 0))
@@ -7,7 +7,7 @@
 
 from ion.services.dm.test.dm_test_case import DMTestCase
 from interface.objects import ProcessDefinition
-from pyon.core.exception import BadRequest
+from pyon.core.exception import BadRequest, NotFound
 from nose.plugins.attrib import attr
 from ion.services.dm.utility.granule import RecordDictionaryTool
 from ion.services.dm.test.test_dm_end_2_end import DatasetMonitor
@@ -24,6 +24,77 @@ from pyon.public import OT
 import time
 import numpy as np
 from gevent.queue import Queue, Empty
+from pyon.util.unit_test import PyonTestCase
+from ion.processes.data.transforms.qc_post_processing import QCPostProcessing
+from mock import Mock, MagicMock, patch
+
+@attr('UNIT',group='dm')
+class TestQCPostProcessingUnit(PyonTestCase):
+    def setUp(self):
+        self.qc = QCPostProcessing()
+        self.qc.qc_params = ['glblrng_qc']
+        self.qc.run_interval = 24
+        self.qc.window = 40
+        self.qc.context = 5
+        self.qc.stored_values = Mock()
+        self.qc.flag_qc_parameter = Mock()
+
+        self.values = {'time' : np.arange(100, dtype='float64') + 1000.,
+                       'temp_glblrng_qc' : np.ones(100, dtype='int8')}
+        self.values['temp_glblrng_qc'][[3, 50, 95]] = 0
+        self.coverage = Mock()
+        self.coverage.num_timesteps = 100
+        self.coverage.temporal_parameter_name = 'time'
+        self.coverage.list_parameters.return_value = ['time', 'temp', 'temp_glblrng_qc']
+        self.coverage.get_parameter_values.side_effect = lambda field, tdoa: self.values[field][tdoa]
+
+    def flagged(self):
+        return [c[0][2] for c in self.qc.flag_qc_parameter.call_args_list]
+
+    @patch('ion.processes.data.transforms.qc_post_processing.ReplayProcess')
+    @patch('ion.processes.data.transforms.qc_post_processing.CoveragePool')
+    def test_watermark(self, pool, replay):
+        pool.read.return_value = MagicMock()
+        pool.read.return_value.__enter__.return_value = self.coverage
+        replay.get_time_idx.return_value = 0
+
+        # First run, nothing stored yet
+        self.qc.stored_values.read_value.side_effect = NotFound
+        self.assertEquals(self.qc.process('dataset_id'), 100)
+        self.assertEquals(self.flagged(), [[1003.], [1050.], [1095.]])
+        doc_key, document = self.qc.stored_values.stored_value_cas.call_args[0]
+        self.assertEquals((doc_key, document['timestep']), ('qc_watermark_dataset_id', 100))
+
+        # Nothing new
+        self.qc.flag_qc_parameter.reset_mock()
+        self.qc.stored_values.read_value.side_effect = None
+        self.qc.stored_values.read_value.return_value = {'timestep':100}
+        self.assertEquals(self.qc.process('dataset_id'), 0)
+        self.assertFalse(self.qc.flag_qc_parameter.called)
+
+        # Only the new timesteps are flagged, the context before them is read but not flagged again
+        self.qc.stored_values.read_value.return_value = {'timestep':52}
+        self.assertEquals(self.qc.process('dataset_id'), 48)
+        self.assertEquals(self.flagged(), [[1095.]])
+        # Every window is read with context on either side
+        reads = [c[1]['tdoa'] for c in self.coverage.get_parameter_values.call_args_list if c[0][0] == 'temp_glblrng_qc']
+        self.assertEquals(reads[-2:], [slice(47, 97), slice(87, 100)])
+
+    @patch('ion.processes.data.transforms.qc_post_processing.ReplayProcess')
+    @patch('ion.processes.data.transforms.qc_post_processing.CoveragePool')
+    def test_empty_dataset(self, pool, replay):
+        pool.read.return_value = MagicMock()
+        pool.read.return_value.__enter__.return_value = self.coverage
+        # There are no times to look anything up in
+        replay.get_time_idx.side_effect = ValueError
+        self.coverage.num_timesteps = 0
+        self.qc.stored_values.read_value.side_effect = NotFound
+
+        self.assertEquals(self.qc.process('dataset_id'), 0)
+        self.assertEquals(self.qc.process('dataset_id', start_time=1000, end_time=2000), 0)
+        self.assertFalse(self.qc.flag_qc_parameter.called)
+        self.assertFalse(self.qc.stored_values.stored_value_cas.called)
+
 
 @attr('INT',group='dm')
 class TestQCPostProcessing(DMTestCase):
@@ -205,7 +276,7 @@ class TestQCPostProcessing(DMTestCase):
 
 
         timer_id = self.scheduler_service.create_interval_timer(start_time=time.time(),
-                end_time=time.time()+13,
+                end_time=time.time()+30,
                 interval=5,
                 event_origin=interval_key)
 
@@ -215,9 +286,19 @@ class TestQCPostProcessing(DMTestCase):
         #--------------------------------------------------------------------------------
 
         try:
-            for i in xrange(2):
-                async_queue.get(timeout=10)
+            async_queue.get(timeout=10)
         except Empty:
             raise AssertionError('QC Events not raised')
-            
+
+        # Later runs only evaluate the new data, so the next violation is flagged once
+        for rdt in self.populate_vectors(stream_def_id, 1, lambda x : [41] + [39] * (x-1)):
+            ph.publish_rdt_to_data_product(dp_id, rdt)
+
+        try:
+            async_queue.get(timeout=20)
+        except Empty:
+            raise AssertionError('QC Events not raised for the new data')
+
+        with self.assertRaises(Empty):
+            async_queue.get(timeout=10)
 
@@ -20,7 +20,58 @@ import numpy as np
 import unittest
 import os
 from gevent.event import Event
-from ion.processes.data.transforms.transform_prime import TransformPrime
+from ion.processes.data.transforms.transform_prime import TransformPrime, TransformRoute
+from pyon.util.unit_test import PyonTestCase
+from mock import Mock, patch
+
+
+class FakeRecordDictionary(dict):
+    def __init__(self, *args, **kwargs):
+        dict.__init__(self)
+
+    def fetch_lookup_values(self):
+        pass
+
+    @classmethod
+    def load_from_granule(cls, msg):
+        return cls()
+
+
+@attr('UNIT',group='dm')
+class TestTransformPrimeUnit(PyonTestCase):
+    def test_actor_route_params(self):
+        transform = TransformPrime()
+        transform.CFG = DotDict({'process' : {
+            'params' : {'qc' : True},
+            'routes' : {'stream_in' : {'stream_a' : {'module':'m', 'class':'A'},
+                                       'stream_b' : {'module':'m', 'class':'B'}}}}})
+        transform.read_stream_def = Mock(side_effect=lambda stream_id: DotDict(_id='def_%s' % stream_id))
+        transform._load_actor = Mock()
+
+        transform.compile_routes()
+        routes = dict((route.stream_out_id, route) for route in transform._routes['stream_in'])
+        self.assertEquals(routes['stream_a'].params, {'qc':True, 'stream_def':'def_stream_a'})
+        self.assertEquals(routes['stream_b'].params, {'qc':True, 'stream_def':'def_stream_b'})
+        # The configured params are left alone
+        self.assertEquals(transform.CFG.get_safe('process.params'), {'qc':True})
+
+    @patch('ion.processes.data.transforms.transform_prime.RecordDictionaryTool', FakeRecordDictionary)
+    def test_lookup_values_per_message(self):
+        documents = {'coefficients' : {'offset_a' : 1.0}}
+        transform = TransformPrime()
+        transform.lookup_docs = ['coefficients']
+        transform.stored_values = Mock()
+        transform.stored_values.read_cached_value.side_effect = lambda key: documents[key]
+
+        route = TransformRoute('stream_in', 'stream_out')
+        route.stream_def_out = DotDict(_id='def_stream_out')
+        route.lookup_fields = {'offset' : 'offset_a'}
+        route.output_fields = ['offset']
+
+        self.assertEquals(transform._execute_transform(None, route)['offset'], 1.0)
+        # A value changed after start is used by the next granule
+        documents['coefficients'] = {'offset_a' : 2.0}
+        self.assertEquals(transform._execute_transform(None, route)['offset'], 2.0)
 
 
 @attr('INT',group='dm')
@@ -20,6 +20,24 @@ from pyon.public import OT
 
 from gevent.event import Event
 from gevent.queue import Queue
+
+class TransformRoute(object):
+    '''
+    Compiled plan for one (stream_in_id, stream_out_id) route of a TransformPrime
+    '''
+    def __init__(self, stream_in_id, stream_out_id):
+        self.stream_in_id    = stream_in_id
+        self.stream_out_id   = stream_out_id
+        self.executor        = None # Actor's execute method, None for parameter function routes
+        self.config          = None
+        self.params          = None
+        self.merged_pdict    = None
+        self.stream_def_out  = None
+        self.input_fields    = []   # Copied from the incoming granule
+        self.function_fields = []   # Evaluated in the merged record dictionary
+        self.output_fields   = []
+        self.lookup_fields   = {}   # lookup field -> lookup value name, resolved on every message
+
 class TransformPrime(TransformDataProcess):
     binding=['output']
     '''
@@ -43,6 +61,8 @@ class TransformPrime(TransformDataProcess):
         self.new_lookups = Queue()
         self.lookup_monitor = EventSubscriber(event_type=OT.ExternalReferencesUpdatedEvent,callback=self._add_lookups, auto_delete=True)
         self.lookup_monitor.start()
+        self._merged_pdicts = {}
+        self.compile_routes()
 
     def on_quit(self):
         self.lookup_monitor.stop()
@@ -59,17 +79,58 @@ class TransformPrime(TransformDataProcess):
         return self.pubsub_management.read_stream_definition(stream_id=stream_id)
 
     
-    def recv_packet(self, msg, stream_route, stream_id):
+    def compile_routes(self):
+        '''
+        Builds the transform plan for every route in process.routes, keyed by the incoming stream id.
+        Called on start, the lookup values themselves are resolved for every message.
+        '''
+        self._routes = {}
         process_routes = self.CFG.get_safe('process.routes', {})
         for stream_in_id,routes in process_routes.iteritems():
-            if stream_id == stream_in_id:
-                for stream_out_id, actor in routes.iteritems():
-                    if actor is None:
-                        rdt_out = self._execute_transform(msg, (stream_in_id, stream_out_id))
-                        self.publish(rdt_out.to_granule(), stream_out_id)
-                    else:
-                        outgoing = self._execute_actor(msg, actor, (stream_in_id, stream_out_id))
-                        self.publish(outgoing, stream_out_id)
+            for stream_out_id, actor in routes.iteritems():
+                route = self._compile_route(stream_in_id, stream_out_id, actor)
+                self._routes.setdefault(stream_in_id, []).append(route)
+
+    def _compile_route(self, stream_in_id, stream_out_id, actor):
+        route = TransformRoute(stream_in_id, stream_out_id)
+        stream_def_out = self.read_stream_def(stream_out_id)
+        route.stream_def_out = stream_def_out
+        if actor is not None:
+            route.executor = self._load_actor(actor)
+            route.config = self.CFG.get_safe('process')
+            # Each route gets its own params, stream_def differs per outgoing stream
+            route.params = dict(self.CFG.get_safe('process.params', {}))
+            route.params['stream_def'] = stream_def_out._id
+            return route
+
+        rdt_temp = self._merge_rdt(self.read_stream_def(stream_in_id), stream_def_out)
+        route.merged_pdict = rdt_temp._pdict
+        for field in rdt_temp.fields:
+            if isinstance(rdt_temp._pdict.get_context(field).param_type, ParameterFunctionType):
+                route.function_fields.append(field)
+            else:
+                route.input_fields.append(field)
+        route.output_fields = RecordDictionaryTool(stream_definition_id=stream_def_out._id).fields
+        route.lookup_fields = dict((field, rdt_temp.context(field).lookup_value) for field in rdt_temp.lookup_values())
+        return route
+
+    def _refresh_lookups(self):
+        '''
+        Picks up new lookup documents
+        '''
+        while not self.new_lookups.empty():
+            self.lookup_docs = self.new_lookups.get() + self.lookup_docs
+
+    def recv_packet(self, msg, stream_route, stream_id):
+        if not self.new_lookups.empty():
+            self._refresh_lookups()
+        for route in self._routes.get(stream_id, ()):
+            if route.executor is None:
+                rdt_out = self._execute_transform(msg, route)
+                self.publish(rdt_out.to_granule(), route.stream_out_id)
+            else:
+                outgoing = self._execute_actor(msg, route)
+                self.publish(outgoing, route.stream_out_id)
 
     def publish(self, msg, stream_out_id):
         publisher = getattr(self, stream_out_id)
@@ -97,16 +158,9 @@ class TransformPrime(TransformDataProcess):
         return execute
 
    
-    def _execute_actor(self, msg, actor, streams):
-        stream_in_id,stream_out_id = streams
-        stream_def_out = self.read_stream_def(stream_out_id)
-        params = self.CFG.get_safe('process.params', {})
-        config = self.CFG.get_safe('process')
-        #do the stuff with the actor
-        params['stream_def'] = stream_def_out._id
-        executor = self._load_actor(actor)
+    def _execute_actor(self, msg, route):
         try:
-            rdt_out = executor(msg, None, config, params, None)
+            rdt_out = route.executor(msg, None, route.config, route.params, None)
         except:
             log.exception('Error running actor for %s', self.id)
             raise
@@ -128,23 +182,26 @@ class TransformPrime(TransformDataProcess):
         return merged_pdict
 
     def _merge_rdt(self, stream_def_in, stream_def_out):
-        incoming_pdict_dump = stream_def_in.parameter_dictionary
-        outgoing_pdict_dump = stream_def_out.parameter_dictionary
-
-        merged_pdict = self._merge_pdicts(incoming_pdict_dump, outgoing_pdict_dump)
+        '''
+        Returns an empty record dictionary over the union of both stream definitions' parameters.
+        The merged parameter dictionary is built once per route and reused for every message.
+        '''
+        route = (stream_def_in._id, stream_def_out._id)
+        merged_pdict = self._merged_pdicts.get(route)
+        if merged_pdict is None:
+            incoming_pdict_dump = stream_def_in.parameter_dictionary
+            outgoing_pdict_dump = stream_def_out.parameter_dictionary
+            merged_pdict = self._merge_pdicts(incoming_pdict_dump, outgoing_pdict_dump)
+            self._merged_pdicts[route] = merged_pdict
         rdt_temp = RecordDictionaryTool(param_dictionary=merged_pdict)
         return rdt_temp
 
 
     def _get_lookup_value(self, lookup_value):
-        if not self.new_lookups.empty():
-            new_values = self.new_lookups.get()
-            self.lookup_docs = new_values + self.lookup_docs
-
         lookup_value_document_keys = self.lookup_docs
         for key in lookup_value_document_keys:
             try:
-                document = self.stored_values.read_value(key)
+                document = self.stored_values.read_cached_value(key)
                 if lookup_value in document:
                     return document[lookup_value]
             except NotFound:
@@ -152,39 +209,31 @@ class TransformPrime(TransformDataProcess):
 
         return None
 
-    def _execute_transform(self, msg, streams):
-        stream_in_id,stream_out_id = streams
-        stream_def_in = self.read_stream_def(stream_in_id)
-        stream_def_out = self.read_stream_def(stream_out_id)
-
-        rdt_temp = self._merge_rdt(stream_def_in, stream_def_out)
+    def _execute_transform(self, msg, route):
+        rdt_temp = RecordDictionaryTool(param_dictionary=route.merged_pdict)
         
         rdt_in = RecordDictionaryTool.load_from_granule(msg)
-        for field in rdt_temp.fields:
-            if not isinstance(rdt_temp._pdict.get_context(field).param_type, ParameterFunctionType):
-                try:
-                    rdt_temp[field] = rdt_in[field]
-                except KeyError:
-                    pass
+        for field in route.input_fields:
+            try:
+                rdt_temp[field] = rdt_in[field]
+            except KeyError:
+                pass
 
         rdt_temp.fetch_lookup_values()
 
-        for lookup_field in rdt_temp.lookup_values():
-            s = lookup_field
-            stored_value = self._get_lookup_value(rdt_temp.context(s).lookup_value)
+        # Read through the stored value cache so changed values are picked up
+        for lookup_field, lookup_value in route.lookup_fields.iteritems():
+            stored_value = self._get_lookup_value(lookup_value)
             if stored_value is not None:
-                rdt_temp[s] = stored_value
+                rdt_temp[lookup_field] = stored_value
         
-        for field in rdt_temp.fields:
-            if isinstance(rdt_temp._pdict.get_context(field).param_type, ParameterFunctionType):
-                rdt_temp[field] = rdt_temp[field]
+        for field in route.function_fields:
+            rdt_temp[field] = rdt_temp[field]
 
         
-        rdt_out = RecordDictionaryTool(stream_definition_id=stream_def_out._id)
+        rdt_out = RecordDictionaryTool(stream_definition_id=route.stream_def_out._id)
 
-        for field in rdt_out.fields:
+        for field in route.output_fields:
             rdt_out[field] = rdt_temp[field]
         
-        return rdt_out 
-
-
+        return rdt_out
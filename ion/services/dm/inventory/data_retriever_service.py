@@ -6,42 +6,23 @@
 
 from ion.core.function.transform_function import TransformFunction
 from ion.processes.data.replay.replay_process import ReplayProcess
-from ion.services.dm.inventory.dataset_management_service import DatasetManagementService
 from ion.services.dm.utility.granule import RecordDictionaryTool
+from ion.services.dm.utility.coverage_pool import CoveragePool
 
 from pyon.core.exception import BadRequest 
 from pyon.public import PRED, RT
 from pyon.util.arg_check import validate_is_instance, validate_true
 from pyon.util.containers import for_name
 from pyon.util.log import log
-from pyon.event.event import EventSubscriber
 
 from interface.objects import Replay 
 from interface.services.dm.idata_retriever_service import BaseDataRetrieverService
 
-import collections
-import time
-import gevent
-
 class DataRetrieverService(BaseDataRetrieverService):
     REPLAY_PROCESS = 'replay_process'
 
-    _refresh_interval = 10
-    _cache_limit      = 5
-    _retrieve_cache   = collections.OrderedDict()
-    _cache_lock       = gevent.coros.RLock()
-
     def on_start(self):
-        self.event_subscriber = EventSubscriber(event_type='DatasetModified', callback=lambda event,m : self._eject_cache(event.origin), auto_delete=True)
-        self.add_endpoint(self.event_subscriber)
-
-    @classmethod
-    def _eject_cache(cls, dataset_id):
-        with cls._cache_lock:
-            try:
-                cls._retrieve_cache.pop(dataset_id)
-            except KeyError:
-                pass
+        CoveragePool.start_monitor()
     
     def define_replay(self, dataset_id='', query=None, delivery_format='', stream_id=''):
         ''' Define the stream that will contain the data from data store by streaming to an exchange name.
@@ -118,33 +99,12 @@ class DataRetrieverService(BaseDataRetrieverService):
 
         self.clients.resource_registry.delete(replay_id)
 
-    @classmethod
-    def _get_coverage(cls,dataset_id):
-        '''
-        Memoized coverage instantiation and management
-        '''
-        # Cached get
-        retval = None
-        with cls._cache_lock:
-            try:
-                retval, age = cls._retrieve_cache.pop(dataset_id)
-                if (time.time() - age) > cls._refresh_interval:
-                    raise KeyError(dataset_id)
-            except KeyError: # Cache miss
-                #@TODO: Add in LRU logic (maybe some mem checking too!)
-                if len(cls._retrieve_cache) > cls._cache_limit:
-                    cls._retrieve_cache.popitem(0)
-                retval = DatasetManagementService._get_coverage(dataset_id, mode='r') 
-            age = time.time()
-            cls._retrieve_cache[dataset_id] = (retval, age)
-        return retval
-
     @classmethod
     def retrieve_oob(cls, dataset_id='', query=None, delivery_format=''):
         query = query or {}
         coverage = None
         try:
-            coverage = cls._get_coverage(dataset_id)
+            coverage = CoveragePool.acquire(dataset_id)
             if coverage is None:
                 raise BadRequest('no such coverage')
             if coverage.num_timesteps == 0:
@@ -153,9 +113,12 @@ class DataRetrieverService(BaseDataRetrieverService):
             else:
                 rdt = ReplayProcess._coverage_to_granule(coverage=coverage, start_time=query.get('start_time', None), end_time=query.get('end_time',None), stride_time=query.get('stride_time',None), parameters=query.get('parameters',None), stream_def_id=delivery_format, tdoa=query.get('tdoa',None))
         except:
-            cls._eject_cache(dataset_id)
+            CoveragePool.invalidate(dataset_id)
             log.exception('Problems reading from the coverage')
             raise BadRequest('Problems reading from the coverage')
+        finally:
+            if coverage is not None:
+                CoveragePool.release(dataset_id, coverage)
         return rdt.to_granule()
 
   
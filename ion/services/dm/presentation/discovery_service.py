@@ -8,6 +8,7 @@
 
 from interface.objects import View, Catalog, ElasticSearchIndex
 from interface.services.dm.idiscovery_service import BaseDiscoveryService
+from interface.services.coi.iresource_registry_service import ResourceRegistryServiceClient
 from pyon.util.containers import DotDict, get_safe
 from pyon.util.arg_check import validate_true, validate_is_instance
 from pyon.public import PRED, CFG, RT, log
@@ -17,8 +18,10 @@ from pyon.core.bootstrap import get_obj_registry, get_sys_name
 from pyon.core.object import IonObjectDeserializer
 from ion.services.dm.inventory.index_management_service import IndexManagementService
 from ion.processes.bootstrap.index_bootstrap import STD_INDEXES
-from collections import deque
 from ion.services.dm.utility.query_language import QueryLanguage
+from ion.services.dm.utility.local_index import LocalSearchIndex
+
+from gevent.pool import Pool
 
 import dateutil.parser
 import calendar
@@ -29,6 +32,9 @@ import heapq
 
 class DiscoveryService(BaseDiscoveryService):
     SEARCH_BUFFER_SIZE=CFG.get_safe('service.discovery.search_buffer_size', 1048576)
+    TRAVERSAL_BATCH_SIZE=CFG.get_safe('service.discovery.traversal_batch_size', 500)
+    FANOUT_POOL_SIZE=CFG.get_safe('service.discovery.fanout_pool_size', 8)
+    use_local_index = False
 
     """
     class docstring
@@ -45,6 +51,20 @@ class DiscoveryService(BaseDiscoveryService):
         self.ep = EventPublisher(event_type = 'SearchBufferExceededEvent')
         self.heuristic_cutoff = 4
 
+        # Without ElasticSearch the queries can be answered by embedded indexes
+        self.use_local_index = not self.use_es and CFG.get_safe('service.discovery.local_index', False)
+        if self.use_local_index:
+            indexes = dict(STD_INDEXES)
+            indexes['%s_resources_index' % get_sys_name().lower()] = None
+            # The indexes outlive this worker when other discovery workers share them, so they read
+            # through a client of the container rather than this process
+            LocalSearchIndex.start(ResourceRegistryServiceClient(), indexes)
+
+    def on_quit(self): # pragma no cover
+        if self.use_local_index:
+            LocalSearchIndex.stop()
+        super(DiscoveryService,self).on_quit()
+
     
    
     @staticmethod
@@ -190,34 +210,55 @@ class DiscoveryService(BaseDiscoveryService):
 #
 #        return db.query_view(view_name,opts=opts)
 
+    def iter_traverse(self, resource_id='', reverse=False, depth=None, predicates=None, resource_types=None):
+        '''
+        Breadth-first traversal of the association graph, yields resource ids as each level is expanded.
+
+        Only the newest level (the frontier) is expanded, in batches of find_objects_mult/find_subjects_mult
+        calls. Visited resources are tracked in a set so every resource is yielded and expanded at most once.
+
+        @param resource_id    Resource to start from (it is not yielded unless the graph cycles back to it)
+        @param reverse        Follow associations from object to subject instead of subject to object
+        @param depth          Maximum number of levels to expand, None for the complete graph
+        @param predicates     Only follow associations with one of these predicates
+        @param resource_types Only yield resources of these types, other resources are still traversed
+        '''
+        predicates = set(predicates) if predicates else None
+        resource_types = set(resource_types) if resource_types else None
+        rr = self.clients.resource_registry
+
+        visited  = set()
+        frontier = [resource_id]
+        level    = 0
+        while frontier and (depth is None or level < depth):
+            level += 1
+            next_frontier = []
+            for i in xrange(0, len(frontier), self.TRAVERSAL_BATCH_SIZE):
+                batch = frontier[i:i+self.TRAVERSAL_BATCH_SIZE]
+                if reverse:
+                    resource_ids, assocs = rr.find_subjects_mult(objects=batch, id_only=True)
+                else:
+                    resource_ids, assocs = rr.find_objects_mult(subjects=batch, id_only=True)
+
+                for rid, assoc in zip(resource_ids, assocs):
+                    if predicates is not None and assoc.p not in predicates:
+                        continue
+                    if rid in visited:
+                        continue
+                    visited.add(rid)
+                    if rid != resource_id: # The origin has already been expanded
+                        next_frontier.append(rid)
+                    if resource_types is None or (assoc.st if reverse else assoc.ot) in resource_types:
+                        yield rid
+            frontier = next_frontier
+
     def traverse(self, resource_id=''):
         """Breadth-first traversal of the association graph for a specified resource.
 
         @param resource_id    str
         @retval resources    list
         """
-        
-        def edges(resource_ids=[]):
-            if not isinstance(resource_ids, list):
-                resource_ids = list(resource_ids)
-            return self.clients.resource_registry.find_objects_mult(subjects=resource_ids,id_only=True)[0]
-            
-        visited_resources = deque(edges([resource_id]))
-        traversal_queue = deque()
-        done = False
-        t = None
-        while not done:
-            t = traversal_queue or deque(visited_resources)
-            traversal_queue = deque()
-            for e in edges(t):
-                if not e in visited_resources:
-                    visited_resources.append(e)
-                    traversal_queue.append(e)
-            if not len(traversal_queue): done = True
-
-
-
-        return list(visited_resources)
+        return list(self.iter_traverse(resource_id))
 
     def reverse_traverse(self, resource_id=''):
         """Breadth-first traversal of the association graph for a specified resource.
@@ -225,88 +266,20 @@ class DiscoveryService(BaseDiscoveryService):
         @param resource_id    str
         @retval resources    list
         """
-        
-        def edges(resource_ids=[]):
-            if not isinstance(resource_ids,list):
-                resource_ids = list(resource_ids)
-            return self.clients.resource_registry.find_subjects_mult(objects=resource_ids,id_only=True)[0]
-            
-        visited_resources = deque(edges([resource_id]))
-        traversal_queue = deque()
-        done = False
-        t = None
-        while not done:
-            t = traversal_queue or deque(visited_resources)
-            traversal_queue = deque()
-            for e in edges(t):
-                if not e in visited_resources:
-                    visited_resources.append(e)
-                    traversal_queue.append(e)
-            if not len(traversal_queue): done = True
-
-
-
-        return list(visited_resources)
-    
+        return list(self.iter_traverse(resource_id, reverse=True))
 
     def iterative_traverse(self, resource_id='', limit=-1):
         '''
         Iterative breadth first traversal of the resource associations
         '''
-        #--------------------------------------------------------------------------------
-        # Retrieve edges for this resource
-        #--------------------------------------------------------------------------------
-        def edges(resource_ids=[]):
-            if not isinstance(resource_ids, list):
-                resource_ids = list(resource_ids)
-            return self.clients.resource_registry.find_objects_mult(subjects=resource_ids,id_only=True)[0]
-            
-        gathered = deque()
-        visited_resources = deque(edges([resource_id]))
-        while limit>0:
-            t = gathered or deque(visited_resources)
-            for e in edges(t):
-                if not e in visited_resources:
-                    visited_resources.append(e)
-                    gathered.append(e)
-            if not len(gathered): break
-
-            t = deque(gathered)
-            gathered = deque()
-            limit -= 1
-
-        return list(visited_resources)
+        # limit is the number of levels expanded beyond the first one
+        return list(self.iter_traverse(resource_id, depth=max(limit,0)+1))
 
     def iterative_reverse_traverse(self, resource_id='', limit=-1):
         '''
         Iterative breadth first traversal of the resource associations
         '''
-        #--------------------------------------------------------------------------------
-        # Retrieve edges for this resource
-        #--------------------------------------------------------------------------------
-        def edges(resource_ids=[]):
-            if not isinstance(resource_ids, list):
-                resource_ids = list(resource_ids)
-            return self.clients.resource_registry.find_subjects_mult(objects=resource_ids,id_only=True)[0]
-            
-        gathered = deque()
-        visited_resources = deque(edges([resource_id]))
-        while limit>0:
-            t = gathered or deque(visited_resources)
-            for e in edges(t):
-                if not e in visited_resources:
-                    visited_resources.append(e)
-                    gathered.append(e)
-            if not len(gathered): break
-
-            t = deque(gathered)
-            gathered = deque()
-            limit -= 1
-
-        return list(visited_resources)
-
-
-            
+        return list(self.iter_traverse(resource_id, reverse=True, depth=max(limit,0)+1))
 
 
     def intersect(self, left=[], right=[]):
@@ -322,8 +295,7 @@ class DiscoveryService(BaseDiscoveryService):
         return list(set(left).union(right))
 
     def parse(self, search_request='', id_only=True):
-        parser = QueryLanguage()
-        query_request = parser.parse(search_request)
+        query_request = QueryLanguage.parse_cached(search_request)
         return self.request(query_request, id_only=id_only)
 
     def query_request(self, query=None, limit=0, id_only=False):
@@ -579,29 +551,53 @@ class DiscoveryService(BaseDiscoveryService):
         Expand the resource into it's components and call the callback for each subcategory
         '''
         if isinstance(source, View):
-            catalogs = self.list_catalogs(source._id)
-            result_queue = list()
-            for catalog in catalogs:
-                result_queue.extend(cb(catalog, *args, **kwargs))
-            if kwargs.has_key('limit') and kwargs['limit']:
-                return result_queue[:kwargs['limit']]
-            return result_queue
-
-        if isinstance(source, Catalog):
-            indexes = self.clients.catalog_management.list_indexes(source._id, id_only=True)
-            result_queue = list()
-            for index in indexes:
-                result_queue.extend(cb(index, *args, **kwargs))
-            if kwargs.has_key('limit') and kwargs['limit']:
-                return result_queue[:kwargs['limit']]
-            return result_queue
-        return None
+            sources = self.list_catalogs(source._id)
+        elif isinstance(source, Catalog):
+            sources = self.clients.catalog_management.list_indexes(source._id, id_only=True)
+        else:
+            return None
+
+        limit = kwargs.get('limit')
+        result_queue = list()
+        for results in self._fan_out([(cb, (s,) + args, kwargs) for s in sources], limit=limit):
+            result_queue.extend(results)
+        if limit:
+            return result_queue[:limit]
+        return result_queue
+
+    def _fan_out(self, calls, limit=0):
+        '''
+        Issues the calls, a list of (callback, args, kwargs), concurrently on a bounded greenlet pool and yields
+        the results in call order. Once limit results have been yielded the outstanding calls are killed.
+        '''
+        pool = Pool(self.FANOUT_POOL_SIZE)
+        greenlets = list()
+        try:
+            # Pool.spawn blocks while the pool is full
+            for cb, args, kwargs in calls:
+                greenlets.append(pool.spawn(cb, *args, **kwargs))
+            count = 0
+            for greenlet in greenlets:
+                results = greenlet.get()
+                yield results
+                count += len(results or [])
+                if limit and count >= limit:
+                    break
+        finally:
+            pool.kill()
 
     def query_term(self, source_id='', field='', value='', fuzzy=False, match=False, order=None, limit=0, offset=0, id_only=False):
         '''
         Elasticsearch Query against an index
         > discovery.query_index('indexID', 'name', '*', order={'name':'asc'}, limit=20, id_only=False)
         '''
+        local_index = self._local_index(source_id)
+        if local_index is not None:
+            validate_true(field, 'Unspecified field')
+            validate_true(value, 'Unspecified value')
+            resource_ids = local_index.term(field, value, fuzzy=fuzzy, match=match)
+            return self._local_results(local_index, resource_ids, order, limit, offset, id_only)
+
         if not self.use_es:
             raise BadRequest('Can not make queries without ElasticSearch, enable system.elasticsearch to make queries.')
 
@@ -656,15 +652,20 @@ class DiscoveryService(BaseDiscoveryService):
 
     def query_range(self, source_id='', field='', from_value=None, to_value=None, order=None, limit=0, offset=0, id_only=False):
         
-        if not self.use_es:
-            raise BadRequest('Can not make queries without ElasticSearch, enable in res/config/pyon.yml')
-
         if from_value is not None:
             validate_true(isinstance(from_value,int) or isinstance(from_value,float), 'from_value is not a valid number')
         if to_value is not None:
             validate_true(isinstance(to_value,int) or isinstance(to_value,float), 'to_value is not a valid number')
         validate_true(source_id, 'source_id not specified')
 
+        local_index = self._local_index(source_id)
+        if local_index is not None:
+            resource_ids = local_index.range(field, from_value, to_value)
+            return self._local_results(local_index, resource_ids, order, limit, offset, id_only)
+
+        if not self.use_es:
+            raise BadRequest('Can not make queries without ElasticSearch, enable in res/config/pyon.yml')
+
         es = ep.ElasticSearch(host=self.elasticsearch_host, port=self.elasticsearch_port)
 
 
@@ -701,15 +702,20 @@ class DiscoveryService(BaseDiscoveryService):
         return self._results_from_response(response, id_only)
 
     def query_time(self, source_id='', field='', from_value=None, to_value=None, order=None, limit=0, offset=0, id_only=False):
-        if not self.use_es:
-            raise BadRequest('Can not make queries without ElasticSearch, enable in res/config/pyon.yml')
-
         if from_value is not None:
             validate_is_instance(from_value,basestring,'"From" is not a valid string (%s)' % from_value)
 
         if to_value is not None:
             validate_is_instance(to_value,basestring,'"To" is not a valid string')
 
+        local_index = self._local_index(source_id)
+        if local_index is not None:
+            resource_ids = local_index.range(field, self._ts_millis(from_value), self._ts_millis(to_value))
+            return self._local_results(local_index, resource_ids, order, limit, offset, id_only)
+
+        if not self.use_es:
+            raise BadRequest('Can not make queries without ElasticSearch, enable in res/config/pyon.yml')
+
         es = ep.ElasticSearch(host=self.elasticsearch_host, port=self.elasticsearch_port)
 
         source = self.clients.resource_registry.read(source_id)
@@ -759,6 +765,12 @@ class DiscoveryService(BaseDiscoveryService):
         if to_value is not None:
             validate_is_instance(to_value,basestring,'"To" is not a valid string')
 
+        local_index = self._local_index(source_id)
+        if local_index is not None:
+            prefix = '' if field == '*' else '%s.' % field
+            resource_ids = local_index.bounds(prefix + 'start_datetime', prefix + 'end_datetime', self._ts_millis(from_value), self._ts_millis(to_value))
+            return self._local_results(local_index, resource_ids, order, limit, offset, id_only)
+
         es = ep.ElasticSearch(host=self.elasticsearch_host, port=self.elasticsearch_port)
 
         source = self.clients.resource_registry.read(source_id)
@@ -854,6 +866,12 @@ class DiscoveryService(BaseDiscoveryService):
         if to_value is not None:
             validate_is_instance(to_value,float,'"To" is not a valid float')
 
+        local_index = self._local_index(source_id)
+        if local_index is not None:
+            prefix = '' if field == '*' else '%s.' % field
+            resource_ids = local_index.bounds(prefix + 'geospatial_vertical_min', prefix + 'geospatial_vertical_max', from_value, to_value)
+            return self._local_results(local_index, resource_ids, order, limit, offset, id_only)
+
         es = ep.ElasticSearch(host=self.elasticsearch_host, port=self.elasticsearch_port)
 
         source = self.clients.resource_registry.read(source_id)
@@ -952,7 +970,7 @@ class DiscoveryService(BaseDiscoveryService):
     def query_owner(self, resource_id='', depth=0, id_only=False):
         validate_true(resource_id, 'Unspecified resource')
         if depth:
-            resource_ids = self.iterative_traverse(resource_id, depth-1)
+            resource_ids = self.iterative_reverse_traverse(resource_id, depth-1)
         else:
             resource_ids = self.reverse_traverse(resource_id)
         if id_only:
@@ -979,6 +997,14 @@ class DiscoveryService(BaseDiscoveryService):
         validate_true(isinstance(origin,(tuple,list)) , 'Origin is not a list or tuple.')
         validate_true(len(origin)==2, 'Origin is not of the right size: (2)')
 
+        local_index = self._local_index(source_id)
+        if local_index is not None:
+            # Nearest first, like the ElasticSearch geo_distance sort
+            resource_ids = local_index.geo_distance(field, origin, distance, units)
+            if order:
+                resource_ids = local_index.sort(resource_ids, order)
+            return self._local_results(local_index, resource_ids, None, limit, offset, id_only, ordered=True)
+
         if not self.use_es:
             raise BadRequest('Can not make queries without ElasticSearch, enable in res/config/pyon.yml')
 
@@ -1031,6 +1057,11 @@ class DiscoveryService(BaseDiscoveryService):
         validate_true(isinstance(bottom_right, (list,tuple)), 'Bottom Right is not a list or a tuple')
         validate_true(len(bottom_right)==2, 'Bottom Right is not of the right size: (2)')
 
+        local_index = self._local_index(source_id)
+        if local_index is not None:
+            resource_ids = local_index.geo_bbox(field, top_left, bottom_right)
+            return self._local_results(local_index, resource_ids, order, limit, offset, id_only)
+
         if not self.use_es:
             raise BadRequest('Can not make queries without ElasticSearch, enable in res/config/pyon.yml')
 
@@ -1107,8 +1138,6 @@ class DiscoveryService(BaseDiscoveryService):
         if not (query.has_key('query') and query.has_key('and') and query.has_key('or')):
             raise BadRequest('Improper query request: %s' % query)
 
-        query_queue = list()
-
         query = DotDict(query)
         #================================================
         # Tier-1 Query
@@ -1123,35 +1152,86 @@ class DiscoveryService(BaseDiscoveryService):
         #================================================
         # Tier-2 Query
         #================================================
-        
-        query_queue.append(self.query_request(query.query,limit=self.SEARCH_BUFFER_SIZE, id_only=True))
-        
-        #==================
-        # Intersection
-        #==================
-        for q in query['and']:
-            query_queue.append(self.query_request(q, limit=self.SEARCH_BUFFER_SIZE, id_only=True))
-        while len(query_queue) > 1:
-            tmp = self.intersect(query_queue.pop(), query_queue.pop())
-            query_queue.append(tmp)
-        
-        #==================
-        # Union
-        #==================
-        for q in query['or']:
-            query_queue.append(self.query_request(q, limit=self.SEARCH_BUFFER_SIZE, id_only=True))
-        while len(query_queue) > 1:
-            tmp = self.union(query_queue.pop(), query_queue.pop())
-            query_queue.append(tmp)
-        
+        # The sub-queries are issued concurrently, an optional top-level limit caps the merged results
+        sub_queries = [query.query] + list(query['and']) + list(query['or'])
+        calls = [(self.query_request, (q,), {'limit':self.SEARCH_BUFFER_SIZE, 'id_only':True}) for q in sub_queries]
+        results = [r or [] for r in self._fan_out(calls)]
+
+        and_count = len(query['and']) + 1
+        resource_ids = self._merge_intersection(results[:and_count], limit=query.get('limit'))
+        if query['or']:
+            resource_ids = self._merge_union([resource_ids] + results[and_count:], limit=query.get('limit'))
+
         if id_only:
-            return query_queue[0]
+            return resource_ids
 
-        objects = self.clients.resource_registry.read_mult(query_queue[0])
+        objects = self.clients.resource_registry.read_mult(resource_ids)
         return objects
 
+    @staticmethod
+    def _merge_intersection(result_lists, limit=0):
+        '''
+        Ids of the first result list found in every other list, in the order of the first list.
+        Membership is checked against the smallest result set first so most misses fail on the first check.
+        '''
+        primary = result_lists[0]
+        others = sorted((set(r) for r in result_lists[1:]), key=len)
+        if others and not others[0]:
+            return []
+        merged = list()
+        seen = set()
+        for rid in primary:
+            if rid in seen or not all(rid in other for other in others):
+                continue
+            seen.add(rid)
+            merged.append(rid)
+            if limit and len(merged) >= limit:
+                break
+        return merged
 
+    @staticmethod
+    def _merge_union(result_lists, limit=0):
+        '''
+        Ids found in any result list, in order of appearance
+        '''
+        merged = list()
+        seen = set()
+        for results in result_lists:
+            for rid in results:
+                if rid in seen:
+                    continue
+                seen.add(rid)
+                merged.append(rid)
+                if limit and len(merged) >= limit:
+                    return merged
+        return merged
+
+
+    def _local_index(self, source_id):
+        '''
+        The embedded index answering for source_id, None when queries go to ElasticSearch
+        '''
+        if not self.use_local_index:
+            return None
+        return LocalSearchIndex.get_index(source_id)
+
+    def _local_results(self, local_index, resource_ids, order=None, limit=0, offset=0, id_only=False, ordered=False):
+        if not ordered:
+            if order:
+                validate_is_instance(order,dict,'Order is incorrect.')
+            resource_ids = local_index.sort(resource_ids, order)
+        resource_ids = resource_ids[offset:]
+        if limit:
+            resource_ids = resource_ids[:limit]
+        if id_only:
+            return resource_ids
+        return self.clients.resource_registry.read_mult(resource_ids)
 
+    @staticmethod
+    def _ts_millis(value):
+        if value is None:
+            return None
+        return calendar.timegm(dateutil.parser.parse(value).timetuple()) * 1000
 
     def raise_search_buffer_exceeded(self):
         self.ep.publish_event(origin='Discovery Service', description='Search buffer was exceeded, results may not contain all the possible results.')
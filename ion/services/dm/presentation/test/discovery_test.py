@@ -23,6 +23,7 @@ from interface.services.coi.iresource_registry_service import ResourceRegistrySe
 from ion.services.dm.presentation.discovery_service import DiscoveryService
 from ion.services.dm.inventory.index_management_service import IndexManagementService
 from ion.services.dm.utility.granule_utils import time_series_domain
+from ion.services.dm.utility.local_index import LocalIndex, LocalSearchIndex
 from ion.processes.bootstrap.index_bootstrap import STD_INDEXES
 from nose.plugins.attrib import attr
 from mock import Mock, patch, sentinel
@@ -146,21 +147,37 @@ class DiscoveryUnitTest(PyonTestCase):
         pass
         
 
-    @skip('Needs to be adjusted for new traversal')
     def test_traverse(self):
-        edge_list = ['B','C','D']
+        # A -> B -> C -> A (cycle), A -> D, B -> E (hasModel)
+        graph = {
+            'A' : [('B', PRED.hasTransform, RT.Transform), ('D', PRED.hasTransform, RT.Transform)],
+            'B' : [('C', PRED.hasProcessDefinition, RT.ProcessDefinition), ('E', PRED.hasModel, RT.InstrumentModel)],
+            'C' : [('A', PRED.hasTransform, RT.DataProcess)],
+        }
         callers = []
-        def pop_edge(*args, **kwargs):
-            callers.append(args[0])
-            if len(edge_list):
-                val = edge_list.pop(0)
-                return [val], 'blah'
-            return [], 'blah'
-        self.rr_find_obj.side_effect = pop_edge
+        def find_objects_mult(subjects=[], id_only=False):
+            callers.append(list(subjects))
+            objects, assocs = [], []
+            for s in subjects:
+                for o, p, ot in graph.get(s, []):
+                    objects.append(o)
+                    assocs.append(DotDict(s=s, p=p, o=o, ot=ot))
+            return objects, assocs
+        self.rr_find_assocs_mult.side_effect = find_objects_mult
 
         retval = self.discovery.traverse('A')
-        retval.sort()
-        self.assertTrue(retval == ['B','C','D'], '%s' % retval)
+        self.assertEquals(sorted(retval), ['A','B','C','D','E'])
+        # Only the frontier is expanded and no resource is expanded twice
+        self.assertEquals(callers, [['A'], ['B','D'], ['C','E']])
+
+        self.assertEquals(sorted(self.discovery.iterative_traverse('A')), ['B','D'])
+        self.assertEquals(sorted(self.discovery.iterative_traverse('A', 1)), ['B','C','D','E'])
+
+        retval = self.discovery.iter_traverse('A', predicates=[PRED.hasTransform, PRED.hasProcessDefinition])
+        self.assertEquals(sorted(retval), ['A','B','C','D'])
+
+        retval = self.discovery.iter_traverse('A', resource_types=[RT.ProcessDefinition])
+        self.assertEquals(list(retval), ['C'])
 
     def test_intersect(self):
         test_vals = [0,1,2,3]
@@ -177,7 +194,7 @@ class DiscoveryUnitTest(PyonTestCase):
         self.assertTrue(retval == [0,1,2,3,4,5], '%s' % retval)
     @patch('ion.services.dm.presentation.discovery_service.QueryLanguage')
     def test_parse(self, mock_parser):
-        mock_parser().parse.return_value = 'arg'
+        mock_parser.parse_cached.return_value = 'arg'
         self.discovery.request = Mock()
         self.discovery.request.return_value = 'correct_value'
         retval = self.discovery.parse('blah blah', id_only=sentinel.id_only)
@@ -336,6 +353,45 @@ class DiscoveryUnitTest(PyonTestCase):
 
         self.assertTrue(retval == [0,1,2,3,4])
 
+    def test_tier2_merge(self):
+        results = {'a':[5,4,3,2,1], 'b':[1,2,3,4], 'c':[4,2], 'd':[9,8,2]}
+        self.discovery.query_request = Mock(side_effect=lambda q, **kwargs: results[q['index']])
+
+        # Intersections keep the order of the primary query
+        request = {'and':[{'index':'b'}, {'index':'c'}], 'or':[], 'query':{'index':'a'}}
+        self.assertEquals(self.discovery.request(request), [4,2])
+        self.assertEquals(self.discovery.query_request.call_count, 3)
+
+        request = {'and':[{'index':'b'}], 'or':[{'index':'d'}], 'query':{'index':'a'}}
+        self.assertEquals(self.discovery.request(request), [4,3,2,1,9,8])
+
+        request['limit'] = 5
+        self.assertEquals(self.discovery.request(request), [4,3,2,1,9])
+
+        self.assertEquals(DiscoveryService._merge_intersection([[1,2,3], [], [1,2]]), [])
+        self.assertEquals(DiscoveryService._merge_intersection([[1,2,3], [3,2,1]], limit=2), [1,2])
+
+    def test_local_index_request(self):
+        index = LocalIndex('sys_data_products_index', [RT.DataProduct])
+        index.add('dp1', DotDict(type_=RT.DataProduct, name='ctd parsed', ts_created='1000'))
+        index.add('dp2', DotDict(type_=RT.DataProduct, name='ctd raw', ts_created='2000'))
+        self.discovery.use_es = False
+        self.discovery.use_local_index = True
+        self.discovery._match_query_sources = Mock(return_value=None)
+
+        with patch.dict(LocalSearchIndex._indexes, {index.name:index}):
+            retval = self.discovery.parse("search 'name' is 'ctd*' from 'data_products_index' order by 'ts_created' limit 1")
+            self.assertEquals(retval, ['dp1'])
+
+            retval = self.discovery.parse("search 'ts_created' values from 1500 from 'data_products_index'")
+            self.assertEquals(retval, ['dp2'])
+
+            self.rr_read_mult = self.discovery.clients.resource_registry.read_mult
+            self.rr_read_mult.return_value = ['resource']
+            retval = self.discovery.query_term('data_products_index', 'name', 'raw', id_only=False)
+            self.assertEquals(retval, ['resource'])
+            self.rr_read_mult.assert_called_once_with(['dp2'])
+
     def test_bad_requests(self):
         #================================
         # Battery of broken requests
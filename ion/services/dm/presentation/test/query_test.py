@@ -196,3 +196,23 @@ class QueryLanguageUnitTest(PyonTestCase):
         test_string = "search 'geospatial_bounds' vertical from 0.5 to 10.2 from 'index'"
         retval = self.parser.parse(test_string)
         self.assertEquals(retval, {'and':[], 'or':[], 'query':{'field':'geospatial_bounds', 'vertical_bounds':{'from':0.5, 'to':10.2}, 'index':'index'}})
+
+    def test_parse_cached(self):
+        QueryLanguage.clear_query_cache()
+        test_string = "search 'description' match 'products' from 'index'"
+        retval = QueryLanguage.parse_cached(test_string)
+        self.assertEquals(retval, self.parser.parse(test_string))
+
+        # Keywords and whitespace are normalized, quoted strings are not
+        retval['query']['index'] = 'mutated'
+        retval = QueryLanguage.parse_cached("  SEARCH 'description'   MATCH 'products' FROM 'index'")
+        self.assertEquals(retval['query']['index'], 'index')
+        self.assertEquals(QueryLanguage.cache_stats(), {'hits':1, 'misses':1, 'size':1})
+
+        retval = QueryLanguage.parse_cached("search 'description' match 'Products' from 'index'")
+        self.assertEquals(retval['query']['match'], 'Products')
+        self.assertEquals(QueryLanguage.cache_stats(), {'hits':1, 'misses':2, 'size':2})
+
+        with self.assertRaises(BadRequest):
+            QueryLanguage.parse_cached('BAD STRING')
+        self.assertEquals(QueryLanguage.cache_stats()['size'], 2)
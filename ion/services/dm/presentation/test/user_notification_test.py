@@ -7,7 +7,7 @@ __author__ = 'Bill Bollenbacher, Swarbhanu Chatterjee, David Stuebe'
 from nose.plugins.attrib import attr
 import unittest
 import gevent
-from mock import Mock, mocksignature
+from mock import Mock, mocksignature, patch
 import os, time, uuid
 from gevent import event, queue
 from gevent.timeout import Timeout
@@ -247,6 +247,49 @@ class UserNotificationTest(PyonTestCase):
         notification_request.temporal_bounds.end_datetime = get_ion_ts()
         self.mock_rr_client.update.assert_called_once_with(notification_request)
 
+    @patch('ion.services.dm.presentation.user_notification_service.CFG_ELASTIC_SEARCH', False)
+    @patch('ion.services.dm.presentation.user_notification_service.setting_up_smtp_client')
+    def test_process_batch(self, mock_smtp):
+        # Test that the digest reads the window once, a page at a time, and fans the events out to the users
+
+        def notification(origin='', origin_type='', event_type=''):
+            return NotificationRequest(name='digest', origin=origin, origin_type=origin_type, event_type=event_type,
+                                       temporal_bounds=TemporalBounds())
+
+        def user(notifications, daily_digest=True):
+            return {'user_contact':DotDict(email='user@example.com'), 'notifications':notifications,
+                    'notifications_daily_digest':daily_digest, 'notifications_disabled':False}
+
+        self.user_notification.user_info = {
+            'user_1' : user([notification(origin='instrument_1'), notification(event_type='DeviceEvent')]),
+            'user_2' : user([notification(origin='instrument_2', origin_type='PlatformDevice')]),
+            'user_3' : user([notification(origin='instrument_1')], daily_digest=False),
+        }
+
+        events = [DotDict(_id='event_%s' % i, ts_created=str(1000 + i / 2), type_='DeviceEvent',
+                          origin='instrument_%s' % (i % 3), origin_type='PlatformDevice') for i in xrange(7)]
+
+        def find_events(start_ts=None, end_ts=None, limit=None, skip=0):
+            first = [i for i, event in enumerate(events) if event.ts_created >= start_ts][0]
+            return [(event._id, None, event) for event in events[first + skip:first + skip + limit]]
+
+        self.user_notification.container.event_repository = Mock()
+        self.user_notification.container.event_repository.find_events.side_effect = find_events
+        self.user_notification.format_and_send_email = Mock()
+
+        with patch.dict(CFG, {'service':{'user_notification':{'digest':{'page_size':3}}}}):
+            self.user_notification.process_batch(start_time='1000', end_time='2000')
+
+        self.assertEquals(self.user_notification.container.event_repository.find_events.call_count, 3)
+
+        sent = dict((kwargs['user_id'], [event._id for event in kwargs['events_for_message']])
+                    for args, kwargs in self.user_notification.format_and_send_email.call_args_list)
+        # Each event shows up once even when more than one notification matches it
+        self.assertEquals(sent['user_1'], ['event_%s' % i for i in xrange(7)])
+        self.assertEquals(sent['user_2'], ['event_2', 'event_5'])
+        self.assertNotIn('user_3', sent)
+        mock_smtp.return_value.quit.assert_called_once_with()
+
 
 @attr('UNIT', group='evt')
 class UserNotificationEventsTest(PyonTestCase):
@@ -16,7 +16,7 @@ from pyon.util.containers import get_ion_ts
 from pyon.public import RT, PRED, get_sys_name, OT, IonObject
 from pyon.event.event import EventPublisher, EventSubscriber
 from ion.services.dm.utility.uns_utility_methods import setting_up_smtp_client
-from ion.services.dm.utility.uns_utility_methods import calculate_reverse_user_info, _convert_to_human_readable
+from ion.services.dm.utility.uns_utility_methods import calculate_reverse_user_info, _convert_to_human_readable, DigestIndex
 
 from interface.services.dm.idiscovery_service import DiscoveryServiceClient
 from interface.services.coi.iresource_registry_service import ResourceRegistryServiceClient
@@ -97,12 +97,16 @@ class UserNotificationService(BaseUserNotificationService):
     """
     A service that provides users with an API for CRUD methods for notifications.
     """
+    # Which share of the digest users this instance sends to, out of service.user_notification.digest.shards
+    digest_shard = 0
+
     def __init__(self, *args, **kwargs):
         self._schedule_ids = []
         BaseUserNotificationService.__init__(self, *args, **kwargs)
 
     def on_start(self):
         self.ION_NOTIFICATION_EMAIL_ADDRESS = CFG.get_safe('server.smtp.sender')
+        self.digest_shard = self.CFG.get_safe('process.digest_shard', 0)
 
         # Create an event processor
         self.event_processor = EmailEventProcessor()
@@ -721,76 +725,64 @@ class UserNotificationService(BaseUserNotificationService):
         @param start_time int milliseconds
         @param end_time int milliseconds
         """
-        self.smtp_client = setting_up_smtp_client()
-
         if end_time <= start_time:
             return
 
-        for user_id, value in self.user_info.iteritems():
-
-            notifications = value['notifications']
-            notifications_disabled = value['notifications_disabled']
-            notifications_daily_digest = value['notifications_daily_digest']
-
-
-            # Ignore users who do NOT want batch notifications or who have disabled the delivery switch
-            # However, if notification preferences have not been set for the user, use the default mechanism and do not bother
-            if notifications_disabled or not notifications_daily_digest:
-                    continue
+        digests = DigestIndex(self.user_info, shards=CFG.get_safe('service.user_notification.digest.shards', 1),
+                              shard=self.digest_shard)
+        if not len(digests):
+            return
 
-            events_for_message = []
+        # One pass over the window, matching every event against all the digest subscriptions at once
+        for event in self._iter_window_events(start_time, end_time):
+            digests.add(event)
 
-            search_time = "SEARCH 'ts_created' VALUES FROM %s TO %s FROM 'events_index'" % (start_time, end_time)
+        self.smtp_client = setting_up_smtp_client()
 
-            for notification in notifications:
-                # If the notification request has expired, then do not use it in the search
-                if notification.temporal_bounds.end_datetime:
-                    continue
+        for user_id, events_for_message in digests.results.iteritems():
+            log.debug("Found following events of interest to user, %s: %s", user_id, events_for_message)
 
-                if CFG_ELASTIC_SEARCH:
-                    if notification.origin:
-                        search_origin = 'search "origin" is "%s" from "events_index"' % notification.origin
-                    else:
-                        search_origin = 'search "origin" is "*" from "events_index"'
+            # send a notification email to each user using a _send_email() method
+            self.format_and_send_email(events_for_message = events_for_message,
+                                        user_id = user_id,
+                                        smtp_client=self.smtp_client)
 
-                    if notification.origin_type:
-                        search_origin_type= 'search "origin_type" is "%s" from "events_index"' % notification.origin_type
-                    else:
-                        search_origin_type= 'search "origin_type" is "*" from "events_index"'
+        self.smtp_client.quit()
 
-                    if notification.event_type:
-                        search_event_type = 'search "type_" is "%s" from "events_index"' % notification.event_type
-                    else:
-                        search_event_type = 'search "type_" is "*" from "events_index"'
+    def _iter_window_events(self, start_time, end_time):
+        """
+        Yields the events created between start_time and end_time, read a page at a time
 
-                    search_string = search_time + ' and ' + search_origin + ' and ' + search_origin_type + ' and ' + search_event_type
+        @param start_time int milliseconds
+        @param end_time int milliseconds
+        """
+        page_size = CFG.get_safe('service.user_notification.digest.page_size', 1000)
 
-                    # get the list of ids corresponding to the events
-                    log.debug('process_batch  search_string: %s', search_string)
-                    ret_vals = self.discovery.parse(search_string)
+        if CFG_ELASTIC_SEARCH:
+            search_string = "SEARCH 'ts_created' VALUES FROM %s TO %s FROM 'events_index'" % (start_time, end_time)
+            log.debug('process_batch  search_string: %s', search_string)
+            event_ids = self.discovery.parse(search_string)
 
-                    events_for_message.extend(self.datastore.read_mult(ret_vals))
+            for i in xrange(0, len(event_ids), page_size):
+                for event in self.datastore.read_mult(event_ids[i:i + page_size]):
+                    yield event
+            return
 
+        # Each page starts from the last timestamp seen, skipping the events already read at that timestamp
+        page_start, skip = start_time, 0
+        while True:
+            event_tuples = self.container.event_repository.find_events(start_ts=page_start, end_ts=end_time,
+                                                                       limit=page_size, skip=skip)
+            for item in event_tuples:
+                event = item[2]
+                if event.ts_created == page_start:
+                    skip += 1
                 else:
-                    # Adding a branch
-                    event_tuples = self.container.event_repository.find_events(
-                        origin=notification.origin,
-                        event_type=notification.event_type,
-                        start_ts=start_time,
-                        end_ts=end_time)
-                    events = [item[2] for item in event_tuples]
-
-                    events_for_message.extend(events)
+                    page_start, skip = event.ts_created, 1
+                yield event
 
-            log.debug("Found following events of interest to user, %s: %s", user_id, events_for_message)
-
-            # send a notification email to each user using a _send_email() method
-            if events_for_message:
-                self.format_and_send_email(events_for_message = events_for_message,
-                                            user_id = user_id,
-                                            smtp_client=self.smtp_client)
-
-        self.smtp_client.quit()
+            if len(event_tuples) < page_size:
+                return
 
 
     def format_and_send_email(self, events_for_message = None, user_id = None, smtp_client = None):
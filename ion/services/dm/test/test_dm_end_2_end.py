@@ -18,6 +18,7 @@ from ion.processes.data.replay.replay_client import ReplayClient
 from ion.services.dm.ingestion.test.ingestion_management_test import IngestionManagementIntTest
 from ion.services.dm.inventory.dataset_management_service import DatasetManagementService
 from ion.services.dm.inventory.data_retriever_service import DataRetrieverService
+from ion.services.dm.utility.coverage_pool import CoveragePool
 from ion.services.dm.utility.granule_utils import RecordDictionaryTool, CoverageCraft, time_series_domain
 from ion.services.dm.utility.test.parameter_helper import ParameterHelper
 from ion.util.stored_values import StoredValueManager
@@ -617,7 +618,9 @@ class TestDMEnd2End(IonIntegrationTestCase):
     @attr('LOCOINT')
     @unittest.skipIf(os.getenv('CEI_LAUNCH_TEST', False), 'Host requires file-system access to coverage files, CEI mode does not support.')
     def test_retrieve_cache(self):
-        DataRetrieverService._refresh_interval = 1
+        CoveragePool.refresh_interval = 1
+        self.addCleanup(setattr, CoveragePool, 'refresh_interval', 10)
+        self.addCleanup(CoveragePool.clear)
         datasets = [self.make_simple_dataset() for i in xrange(10)]
         for stream_id, route, stream_def_id, dataset_id in datasets:
             coverage = DatasetManagementService._get_simplex_coverage(dataset_id)
@@ -627,30 +630,38 @@ class TestDMEnd2End(IonIntegrationTestCase):
 
         # Verify cache hit and refresh
         dataset_ids = [i[3] for i in datasets]
-        self.assertTrue(dataset_ids[0] not in DataRetrieverService._retrieve_cache)
-        DataRetrieverService._get_coverage(dataset_ids[0]) # Hit the chache
-        cov, age = DataRetrieverService._retrieve_cache[dataset_ids[0]]
-        # Verify that it was hit and it's now in there
-        self.assertTrue(dataset_ids[0] in DataRetrieverService._retrieve_cache)
-
-        gevent.sleep(DataRetrieverService._refresh_interval + 0.2)
-
-        DataRetrieverService._get_coverage(dataset_ids[0]) # Hit the chache
-        cov, age2 = DataRetrieverService._retrieve_cache[dataset_ids[0]]
+        self.assertTrue(dataset_ids[0] not in CoveragePool._handles)
+        with CoveragePool.read(dataset_ids[0]) as cov:
+            # Verify that it was hit and it's now in there
+            self.assertTrue(dataset_ids[0] in CoveragePool._handles)
+            with CoveragePool.read(dataset_ids[0]) as cov2:
+                self.assertIs(cov, cov2)
+                self.assertEquals(CoveragePool._handles[dataset_ids[0]].refs, 2)
+        self.assertEquals(CoveragePool._handles[dataset_ids[0]].refs, 0)
+        age = CoveragePool._handles[dataset_ids[0]].opened
+
+        gevent.sleep(CoveragePool.refresh_interval + 0.2)
+
+        with CoveragePool.read(dataset_ids[0]):
+            pass
+        age2 = CoveragePool._handles[dataset_ids[0]].opened
         self.assertTrue(age2 != age)
 
         for dataset_id in dataset_ids:
-            DataRetrieverService._get_coverage(dataset_id)
+            with CoveragePool.read(dataset_id):
+                pass
         
-        self.assertTrue(dataset_ids[0] not in DataRetrieverService._retrieve_cache)
+        self.assertTrue(dataset_ids[0] not in CoveragePool._handles)
+        self.assertEquals(len(CoveragePool._handles), CoveragePool.limit)
 
         stream_id, route, stream_def, dataset_id = datasets[0]
         self.start_ingestion(stream_id, dataset_id)
-        DataRetrieverService._get_coverage(dataset_id)
+        with CoveragePool.read(dataset_id):
+            pass
         
-        self.assertTrue(dataset_id in DataRetrieverService._retrieve_cache)
+        self.assertTrue(dataset_id in CoveragePool._handles)
 
-        DataRetrieverService._refresh_interval = 100
+        CoveragePool.refresh_interval = 100
         self.publish_hifi(stream_id,route,1)
         self.wait_until_we_have_enough_granules(dataset_id, data_size=20)
             
@@ -658,7 +669,7 @@ class TestDMEnd2End(IonIntegrationTestCase):
         event = gevent.event.Event()
         with gevent.Timeout(20):
             while not event.wait(0.1):
-                if dataset_id not in DataRetrieverService._retrieve_cache:
+                if dataset_id not in CoveragePool._handles:
                     event.set()
 
 
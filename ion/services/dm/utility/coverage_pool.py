@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+'''
+@file ion/services/dm/utility/coverage_pool.py
+@description Container-wide pool of read-only coverage handles
+'''
+
+from ion.services.dm.inventory.dataset_management_service import DatasetManagementService
+
+from pyon.container.cc import Container
+from pyon.ion.event import EventSubscriber
+from pyon.public import CFG, OT
+from pyon.util.log import log
+
+from contextlib import contextmanager
+from gevent.coros import RLock
+
+import collections
+import time
+
+
+class CoverageHandle(object):
+    '''
+    A pooled coverage and the number of callers currently reading from it
+    '''
+    def __init__(self, coverage):
+        self.coverage = coverage
+        self.refs     = 0
+        self.opened   = time.time()
+
+
+class CoveragePool(object):
+    '''
+    Read-only coverage handles shared by the retrieval paths of every process in the container.
+
+    Handles are reference counted: a handle is only closed once no caller holds it, whether it was evicted
+    (LRU, beyond the pool size), outlived the refresh interval or was invalidated by a DatasetModified event.
+
+    Usage:
+        with CoveragePool.read(dataset_id) as coverage:
+            coverage.get_parameter_values('time')
+    '''
+    refresh_interval = CFG.get_safe('container.coverage_pool.refresh_interval', 10)
+    limit            = CFG.get_safe('container.coverage_pool.size', 5)
+
+    _handles    = collections.OrderedDict() # dataset_id -> CoverageHandle (LRU)
+    _retired    = {}                        # id(coverage) -> CoverageHandle, closed on last release
+    _lock       = RLock()
+    _subscriber = None
+
+    @classmethod
+    def acquire(cls, dataset_id):
+        '''
+        Returns a read-only coverage for the dataset, it must be given back with release
+        '''
+        cls.start_monitor()
+        with cls._lock:
+            handle = cls._handles.pop(dataset_id, None)
+            if handle is not None and (time.time() - handle.opened) > cls.refresh_interval:
+                cls._retire(handle)
+                handle = None
+            if handle is None:
+                cls._evict()
+                handle = CoverageHandle(DatasetManagementService._get_coverage(dataset_id, mode='r'))
+            handle.refs += 1
+            cls._handles[dataset_id] = handle
+            return handle.coverage
+
+    @classmethod
+    def release(cls, dataset_id, coverage):
+        with cls._lock:
+            handle = cls._handles.get(dataset_id)
+            if handle is not None and handle.coverage is coverage:
+                handle.refs -= 1
+                return
+            handle = cls._retired.get(id(coverage))
+            if handle is not None:
+                handle.refs -= 1
+                if handle.refs <= 0:
+                    cls._retired.pop(id(coverage))
+                    cls._close(handle)
+
+    @classmethod
+    @contextmanager
+    def read(cls, dataset_id):
+        coverage = cls.acquire(dataset_id)
+        try:
+            yield coverage
+        finally:
+            cls.release(dataset_id, coverage)
+
+    @classmethod
+    def invalidate(cls, dataset_id):
+        '''
+        Drops the pooled handle for the dataset, subsequent reads open the coverage again
+        '''
+        with cls._lock:
+            handle = cls._handles.pop(dataset_id, None)
+            if handle is not None:
+                cls._retire(handle)
+
+    @classmethod
+    def clear(cls):
+        with cls._lock:
+            for dataset_id in cls._handles.keys():
+                cls.invalidate(dataset_id)
+
+    @classmethod
+    def start_monitor(cls):
+        '''
+        Invalidates pooled handles whenever their dataset is modified
+        '''
+        if cls._subscriber is not None or Container.instance is None:
+            return
+        cls._subscriber = EventSubscriber(event_type=OT.DatasetModified, callback=lambda event, m: cls.invalidate(event.origin), auto_delete=True)
+        cls._subscriber.start()
+
+    @classmethod
+    def stop_monitor(cls):
+        if cls._subscriber is not None:
+            cls._subscriber.stop()
+            cls._subscriber = None
+
+    @classmethod
+    def _evict(cls):
+        while len(cls._handles) >= cls.limit:
+            idle = [dataset_id for dataset_id, handle in cls._handles.iteritems() if handle.refs <= 0]
+            if not idle:
+                break # Every handle is in use, grow past the limit until they are released
+            cls._close(cls._handles.pop(idle[0]))
+
+    @classmethod
+    def _retire(cls, handle):
+        if handle.refs <= 0:
+            cls._close(handle)
+        else:
+            cls._retired[id(handle.coverage)] = handle
+
+    @classmethod
+    def _close(cls, handle):
+        try:
+            handle.coverage.close(timeout=5)
+        except:
+            log.exception('Problems closing the coverage')
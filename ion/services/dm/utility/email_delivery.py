@@ -0,0 +1,170 @@
+#!/usr/bin/env python
+'''
+@file ion/services/dm/utility/email_delivery.py
+@description Pooled, asynchronous delivery of notification emails
+'''
+
+from pyon.public import CFG
+from pyon.util.async import spawn
+from pyon.util.log import log
+from ion.services.dm.utility.uns_utility_methods import setting_up_smtp_client, compose_email
+
+from contextlib import contextmanager
+from gevent.coros import BoundedSemaphore
+from gevent.queue import Queue, Empty, Full
+
+import gevent
+import time
+
+
+class SMTPConnectionPool(object):
+    '''
+    Persistent SMTP connections, at most size of them are in use at once.
+    A connection that fails while in use is closed instead of being returned to the pool.
+    '''
+    def __init__(self, size=2, connect=None):
+        self.size      = size
+        self.connect   = connect or setting_up_smtp_client
+        self.opened    = 0
+        self._idle     = Queue()
+        self._in_use   = BoundedSemaphore(size)
+
+    @contextmanager
+    def connection(self, fresh=False):
+        '''
+        Yields an idle connection, or a new one if there is none or fresh is set
+        '''
+        self._in_use.acquire()
+        try:
+            try:
+                if fresh:
+                    raise Empty()
+                client = self._idle.get_nowait()
+            except Empty:
+                client = self.connect()
+                self.opened += 1
+            try:
+                yield client
+            except:
+                self._quit(client)
+                raise
+            self._idle.put(client)
+        finally:
+            self._in_use.release()
+
+    def close(self):
+        while True:
+            try:
+                self._quit(self._idle.get_nowait())
+            except Empty:
+                break
+
+    def _quit(self, client):
+        try:
+            client.quit()
+        except:
+            log.debug('Problems closing an SMTP connection', exc_info=True)
+
+
+class EmailDelivery(object):
+    '''
+    Outbound queue of notification emails drained by worker greenlets over pooled SMTP connections.
+
+    Events for a recipient that already has a message waiting are coalesced into that message, so a burst
+    within coalesce_window seconds becomes a single email. The queue is bounded: when it is full deliver
+    blocks for up to put_timeout seconds and then drops the email.
+
+    Usage:
+        delivery = EmailDelivery()
+        delivery.start()
+        delivery.deliver(event, 'user@example.com')
+        delivery.stop()
+    '''
+    def __init__(self, workers=None, pool_size=None, queue_size=None, coalesce_window=None, put_timeout=None, connect=None):
+        cfg = CFG.get_safe('service.user_notification.delivery', {}) or {}
+        self.workers         = workers or cfg.get('workers', 2)
+        self.coalesce_window = cfg.get('coalesce_window', 1.0) if coalesce_window is None else coalesce_window
+        self.put_timeout     = cfg.get('put_timeout', 5.0) if put_timeout is None else put_timeout
+
+        self.pool = SMTPConnectionPool(pool_size or cfg.get('pool_size', 2), connect)
+        self.metrics = {'queued':0, 'coalesced':0, 'dropped':0, 'sent':0, 'events_sent':0, 'failed':0}
+
+        self._queue    = Queue(maxsize=queue_size or cfg.get('queue_size', 1000)) # recipients with a waiting email
+        self._pending  = {}                                                      # recipient -> (queued at, [events])
+        self._greenlets = []
+        self._stopping = False
+
+    def start(self):
+        self._stopping = False
+        self._greenlets = [spawn(self._work) for i in xrange(self.workers)]
+
+    def stop(self, timeout=10):
+        '''
+        Sends everything queued so far, then closes the SMTP connections
+        '''
+        self._stopping = True
+        for greenlet in self._greenlets:
+            self._queue.put(None)
+        gevent.joinall(self._greenlets, timeout=timeout)
+        gevent.killall(self._greenlets)
+        self._greenlets = []
+        self.pool.close()
+
+    def deliver(self, event, recipient):
+        '''
+        Queues an email about event for recipient, returns False if the email was dropped
+        '''
+        burst = self._pending.get(recipient)
+        if burst is not None:
+            burst[1].append(event)
+            self.metrics['coalesced'] += 1
+            return True
+
+        self._pending[recipient] = (time.time(), [event])
+        try:
+            self._queue.put(recipient, timeout=self.put_timeout)
+        except Full:
+            self._pending.pop(recipient, None)
+            self.metrics['dropped'] += 1
+            log.warning('Email delivery queue is full (%s waiting), dropped a notification to %s', self._queue.qsize(), recipient)
+            return False
+        self.metrics['queued'] += 1
+        return True
+
+    def stats(self):
+        stats = dict(self.metrics)
+        stats['queue_depth'] = self._queue.qsize()
+        stats['connections_opened'] = self.pool.opened
+        return stats
+
+    def _work(self):
+        while True:
+            recipient = self._queue.get()
+            if recipient is None:
+                return
+            queued_at, _ = self._pending.get(recipient, (None, None))
+            if queued_at is None:
+                continue
+            # Items are queued in time order, so waiting on the head never delays later ones past their window
+            wait = queued_at + self.coalesce_window - time.time()
+            if wait > 0 and not self._stopping:
+                gevent.sleep(wait)
+            _, events = self._pending.pop(recipient)
+            self._send(recipient, events)
+
+    def _send(self, recipient, events):
+        smtp_sender, msg = compose_email(events, recipient)
+        # A pooled connection may have been dropped by the server, retry once on a new connection,
+        # the other idle ones are likely to have been dropped as well
+        for attempt in xrange(2):
+            try:
+                with self.pool.connection(fresh=attempt > 0) as smtp_client:
+                    smtp_client.sendmail(smtp_sender, [recipient], msg)
+            except Exception:
+                if attempt:
+                    log.exception('Failed to send a notification email to %s', recipient)
+                continue
+            self.metrics['sent'] += 1
+            self.metrics['events_sent'] += len(events)
+            return
+        self.metrics['failed'] += 1
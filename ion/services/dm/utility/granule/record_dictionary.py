@@ -15,6 +15,7 @@ from pyon.core.interceptor.encode import encode_ion
 from pyon.util.arg_check import validate_equal
 from pyon.util.log import log
 from pyon.util.memoize import memoize_lru
+from pyon.public import CFG
 
 from ion.util.stored_values import StoredValueManager
 
@@ -27,9 +28,20 @@ from coverage_model.parameter_values import AbstractParameterValue, ConstantValu
 from coverage_model.parameter_types import ParameterFunctionType
 
 import numpy as np
+import collections
+import hashlib
 import msgpack
 import time
 
+# Granule encodings, negotiated through the stream definition's stream_configuration['granule_encoding']
+GRANULE_ENCODING_COLUMNAR = 'columnar'
+COLUMNAR_KEY              = '__columnar__'
+COLUMN_ALIGNMENT          = 8
+
+# Estimated serialization overhead (bytes) of a granule's fixed fields and of each record dictionary entry
+GRANULE_OVERHEAD          = 256
+FIELD_OVERHEAD            = 64
+
 class RecordDictionaryTool(object):
     """
     A record dictionary is a key/value store which contains records for a particular dataset. The keys are specified by
@@ -58,15 +70,19 @@ class RecordDictionaryTool(object):
     _creation_timestamp = None
     _stream_config      = {}
     _definition         = None
+    _pdict_size         = None
     connection_id       = ''
     connection_index    = ''
 
+    # Process-wide cache of compiled parameter dictionaries (LRU)
+    _pdict_cache        = collections.OrderedDict()
+    PDICT_CACHE_LIMIT   = CFG.get_safe('container.pdict_cache', 100)
 
     def __init__(self,param_dictionary=None, stream_definition_id='', locator=None, stream_definition=None):
         """
         """
         if type(param_dictionary) == dict:
-            self._pdict = ParameterDictionary.load(param_dictionary)
+            self._pdict = self.load_param_dictionary(param_dictionary)
         
         elif isinstance(param_dictionary,ParameterDictionary):
             self._pdict = param_dictionary
@@ -75,13 +91,18 @@ class RecordDictionaryTool(object):
             if stream_definition:
                 if not isinstance(stream_definition,StreamDefinition):
                     raise BadRequest('Improper StreamDefinition object')
-                self._definition = stream_definition
+                # Given with its id the definition only saves the read, granules still reference the id
+                if not stream_definition_id:
+                    self._definition = stream_definition
 
             stream_def_obj = stream_definition or RecordDictionaryTool.read_stream_def(stream_definition_id)
             pdict = stream_def_obj.parameter_dictionary
             self._available_fields = stream_def_obj.available_fields or None
             self._stream_config = stream_def_obj.stream_configuration
-            self._pdict = ParameterDictionary.load(pdict)
+            cache_key = None
+            if getattr(stream_def_obj, '_id', None):
+                cache_key = '%s:%s' % (stream_def_obj._id, getattr(stream_def_obj, '_rev', ''))
+            self._pdict = self.load_param_dictionary(pdict, cache_key)
             self._stream_def = stream_definition_id
 
         else:
@@ -96,12 +117,38 @@ class RecordDictionaryTool(object):
 
         self._setup_params()
 
+    @classmethod
+    def load_param_dictionary(cls, pdict_dump, cache_key=None):
+        '''
+        Returns the compiled ParameterDictionary for a parameter dictionary dump. Compiled dictionaries are
+        cached process-wide, keyed by the stream definition (id and revision) or by a hash of the dump's
+        content, and shared between record dictionaries so they must be treated as read-only.
+        '''
+        if cache_key is None:
+            cache_key = hashlib.sha1(msgpack.packb(pdict_dump, default=encode_ion)).hexdigest()
+        try:
+            pdict = cls._pdict_cache.pop(cache_key)
+        except KeyError:
+            pdict = ParameterDictionary.load(pdict_dump)
+            if len(cls._pdict_cache) >= cls.PDICT_CACHE_LIMIT:
+                cls._pdict_cache.popitem(0)
+        cls._pdict_cache[cache_key] = pdict
+        return pdict
+
+    @classmethod
+    def clear_param_dictionary_cache(cls):
+        cls._pdict_cache.clear()
+
     def _pval_callback(self, name, slice_):
         retval = np.atleast_1d(self[name])
         return retval[slice_]
 
     @classmethod
-    def get_paramval(cls, ptype, domain, values):
+    def get_paramval(cls, ptype, domain, values, copy=True):
+        '''
+        Builds the parameter value for the values. If copy is False and the values already match the storage
+        layout of a quantity the array is used as the storage directly.
+        '''
         paramval = get_value_class(ptype, domain_set=domain)
         if isinstance(ptype,ParameterFunctionType):
             paramval.memoized_values = values
@@ -109,6 +156,9 @@ class RecordDictionaryTool(object):
             values = np.atleast_1d(values)
             spans = cls.spanify(values)
             paramval.storage._storage = np.array([spans],dtype='object')
+        elif not copy and isinstance(ptype, QuantityType) and isinstance(values, np.ndarray) \
+                and values.dtype == paramval.storage._storage.dtype and values.shape == paramval.storage._storage.shape:
+            paramval.storage._storage = values
         else:
             paramval[:] = values
         paramval.storage._storage.flags.writeable = False
@@ -126,6 +176,30 @@ class RecordDictionaryTool(object):
     
     @classmethod
     def spanify(cls,arr):
+        '''
+        Run-length encodes the values into Spans, change points are located with a single vectorized comparison
+        of each record against the previous one.
+        '''
+        arr = np.asanyarray(arr)
+        if not arr.shape or not arr.shape[0]:
+            return cls._spanify_loop(np.atleast_1d(arr))
+        try:
+            changed = np.atleast_1d(arr[1:] != arr[:-1])
+            if changed.ndim > 1:
+                changed = changed.reshape(changed.shape[0], -1).any(axis=1)
+            if changed.dtype != np.bool_ or changed.shape[0] != arr.shape[0] - 1:
+                raise ValueError('Records can not be compared element-wise')
+        except (ValueError, TypeError):
+            return cls._spanify_loop(arr)
+
+        spans = [Span(None,None,0,arr[0])]
+        for i in (np.flatnonzero(changed) + 1).tolist():
+            spans[-1].upper_bound = i
+            spans.append(Span(i,None,-i,arr[i]))
+        return spans
+
+    @classmethod
+    def _spanify_loop(cls,arr):
         spans = []
         lastval = None
         for i,val in enumerate(arr):
@@ -144,15 +218,16 @@ class RecordDictionaryTool(object):
 
 
     def fetch_lookup_values(self):
+        svm = None
         for lv in self._lookup_values():
             context = self.context(lv)
             if context.document_key:
                 document_key = context.document_key
                 if '$designator' in context.document_key and 'reference_designator' in self._stream_config:
                     document_key = document_key.replace('$designator',self._stream_config['reference_designator'])
-                svm = StoredValueManager(Container.instance)
+                svm = svm or StoredValueManager(Container.instance)
                 try:
-                    doc = svm.read_value(document_key)
+                    doc = svm.read_cached_value(document_key)
                 except NotFound:
                     log.debug('Reference Document for %s not found', document_key)
                     continue
@@ -176,6 +251,9 @@ class RecordDictionaryTool(object):
             instance._creation_timestamp = g.creation_timestamp
 
         for k,v in g.record_dictionary.iteritems():
+            if k == COLUMNAR_KEY:
+                instance._decode_columns(v)
+                continue
             key = instance._pdict.key_from_ord(k)
             if v is not None:
                 ptype = instance._pdict.get_context(key).param_type
@@ -187,15 +265,107 @@ class RecordDictionaryTool(object):
 
         return instance
 
-    def to_granule(self, data_producer_id='',provider_metadata_update={}, connection_id='', connection_index=''):
+    @classmethod
+    def concatenate(cls, rdts):
+        '''
+        Concatenates a sequence of record dictionaries sharing the same parameter dictionary column-wise into a
+        single record dictionary. A field missing from some of them is filled with its fill value there,
+        parameter functions are left to be evaluated on the result.
+        '''
+        if not rdts:
+            raise BadRequest('No record dictionaries to concatenate')
+        first = rdts[0]
+        if len(rdts) == 1:
+            return first
+
+        instance = first._copy_empty()
+        instance._shp = (sum(len(rdt) for rdt in rdts),)
+
+        keys = []
+        for rdt in rdts:
+            keys.extend(key for key in rdt.iterkeys() if key not in keys)
+
+        for key in keys:
+            if isinstance(first.context(key).param_type, ParameterFunctionType):
+                continue
+            values = []
+            for rdt in rdts:
+                value = rdt[key]
+                if value is None:
+                    value = rdt._fill_values(key, len(rdt))
+                values.append(np.atleast_1d(value))
+            instance._set(key, np.concatenate(values))
+
+        instance._creation_timestamp = first._creation_timestamp
+        instance.connection_id = rdts[-1].connection_id
+        instance.connection_index = rdts[-1].connection_index
+        return instance
+
+    def _fill_values(self, name, size):
+        context = self._pdict.get_context(name)
+        if isinstance(context.param_type, QuantityType):
+            values = np.empty(size, dtype=context.param_type.value_encoding)
+        else:
+            values = np.empty(size, dtype=object)
+        values.fill(context.fill_value)
+        return values
+
+    def _copy_empty(self):
+        '''
+        Returns an empty record dictionary sharing this one's parameter dictionary and stream definition
+        '''
+        instance = RecordDictionaryTool(param_dictionary=self._pdict, locator=self._locator)
+        instance._stream_def       = self._stream_def
+        instance._definition       = self._definition
+        instance._available_fields = self._available_fields
+        instance._stream_config    = self._stream_config
+        return instance
+
+    def split(self, max_bytes):
+        '''
+        Splits the record dictionary into record dictionaries whose estimated granule size is at most
+        max_bytes (a chunk always holds at least one record).
+        '''
+        elements = len(self)
+        size = self.size()
+        if not elements or size <= max_bytes:
+            return [self]
+
+        values_size = self._values_size()
+        fixed = size - values_size
+        per_record = max(float(values_size) / elements, 1.)
+        chunk = max(int((max_bytes - fixed) / per_record), 1)
+
+        chunks = []
+        for start in xrange(0, elements, chunk):
+            slice_ = slice(start, start+chunk)
+            rdt = self._copy_empty()
+            rdt._shp = (len(xrange(*slice_.indices(elements))),)
+            for key in self.iterkeys():
+                rdt._set(key, np.atleast_1d(self[key])[slice_])
+            rdt._creation_timestamp = self._creation_timestamp
+            rdt.connection_id = self.connection_id
+            rdt.connection_index = self.connection_index
+            chunks.append(rdt)
+        return chunks
+
+    def to_granule(self, data_producer_id='',provider_metadata_update={}, connection_id='', connection_index='', encoding=None):
+        '''
+        Builds a granule from the record dictionary. The encoding defaults to the 'granule_encoding' of the
+        stream definition's stream configuration.
+        '''
         granule = Granule()
         granule.record_dictionary = {}
-        
-        for key,val in self._rd.iteritems():
-            if val is not None:
-                granule.record_dictionary[self._pdict.ord_from_key(key)] = self[key]
-            else:
-                granule.record_dictionary[self._pdict.ord_from_key(key)] = None
+
+        encoding = encoding or (self._stream_config or {}).get('granule_encoding')
+        if encoding == GRANULE_ENCODING_COLUMNAR:
+            self._encode_columns(granule.record_dictionary)
+        else:
+            for key,val in self._rd.iteritems():
+                if val is not None:
+                    granule.record_dictionary[self._pdict.ord_from_key(key)] = self[key]
+                else:
+                    granule.record_dictionary[self._pdict.ord_from_key(key)] = None
         
         granule.param_dictionary = {} if self._stream_def else self._pdict.dump()
         if self._definition:
@@ -213,6 +383,46 @@ class RecordDictionaryTool(object):
         return granule
 
 
+    def _encode_columns(self, record_dictionary):
+        '''
+        Packs every numeric field into one contiguous buffer described by a (dtype, shape, offset) header per
+        ordinal. Fields holding objects are kept as regular record dictionary entries.
+        '''
+        columns = {}
+        chunks  = []
+        offset  = 0
+        for key,val in self._rd.iteritems():
+            ordinal = self._pdict.ord_from_key(key)
+            values = self[key] if val is not None else None
+            if values is None or np.asanyarray(values).dtype.hasobject:
+                record_dictionary[ordinal] = values
+                continue
+            values = np.ascontiguousarray(values)
+            padding = -offset % COLUMN_ALIGNMENT
+            if padding:
+                chunks.append('\0' * padding)
+                offset += padding
+            columns[ordinal] = (values.dtype.str, values.shape, offset)
+            chunks.append(values.tostring())
+            offset += values.nbytes
+        record_dictionary[COLUMNAR_KEY] = {'columns':columns, 'buffer':''.join(chunks)}
+
+    def _decode_columns(self, columnar):
+        '''
+        Maps each column onto the granule's buffer with np.frombuffer, the resulting values are read-only views.
+        '''
+        buf = columnar['buffer']
+        for ordinal, (dtype, shape, offset) in columnar['columns'].iteritems():
+            key = self._pdict.key_from_ord(ordinal)
+            shape = tuple(shape)
+            count = int(np.prod(shape))
+            if count:
+                values = np.frombuffer(buf, dtype=np.dtype(dtype), count=count, offset=offset).reshape(shape)
+            else:
+                values = np.empty(shape, dtype=np.dtype(dtype))
+            ptype = self._pdict.get_context(key).param_type
+            self._rd[key] = self.get_paramval(ptype, self.domain, values, copy=False)
+
     def _setup_params(self):
         for param in self._pdict.keys():
             self._rd[param] = None
@@ -413,16 +623,35 @@ class RecordDictionaryTool(object):
     def __ne__(self, comp):
         return not (self == comp)
 
-    def size(self):
+    def size(self, exact=False):
         '''
-        Truly poor way to calculate the size of a granule...
-        returns the size in bytes.
+        Returns the size of the granule in bytes. By default the size is estimated from the bytes held by each
+        field plus a fixed overhead per granule and per field, exact serializes the granule and measures it.
         '''
-        granule = self.to_granule()
-        serializer = IonObjectSerializer()
-        flat = serializer.serialize(granule)
-        byte_stream = msgpack.packb(flat, default=encode_ion)
-        return len(byte_stream)
+        if exact:
+            granule = self.to_granule()
+            serializer = IonObjectSerializer()
+            flat = serializer.serialize(granule)
+            byte_stream = msgpack.packb(flat, default=encode_ion)
+            return len(byte_stream)
+
+        size = GRANULE_OVERHEAD + FIELD_OVERHEAD * len(self._rd) + self._values_size()
+        if not self._stream_def:
+            # The parameter dictionary travels with the granule
+            if self._pdict_size is None:
+                self._pdict_size = len(msgpack.packb(self._pdict.dump(), default=encode_ion))
+            size += self._pdict_size
+        return size
+
+    def _values_size(self):
+        size = 0
+        for key in self.iterkeys():
+            values = np.asanyarray(self[key])
+            if values.dtype.hasobject:
+                size += sum(len(str(v)) for v in values.flat)
+            else:
+                size += values.nbytes
+        return size
 
     
     @staticmethod
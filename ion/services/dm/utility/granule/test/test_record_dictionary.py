@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+'''
+@file ion/services/dm/utility/granule/test/test_record_dictionary.py
+@brief Unit tests and benchmarks for the RecordDictionaryTool helpers
+'''
+
+from pyon.util.unit_test import PyonTestCase
+from pyon.util.log import log
+from ion.services.dm.utility.granule.record_dictionary import RecordDictionaryTool
+from nose.plugins.attrib import attr
+
+import numpy as np
+import time
+
+
+class SpanAssertions(object):
+    def assert_spans_equal(self, spans, expected):
+        self.assertEquals(len(spans), len(expected))
+        for span, other in zip(spans, expected):
+            self.assertEquals(span.lower_bound, other.lower_bound)
+            self.assertEquals(span.upper_bound, other.upper_bound)
+            self.assertEquals(span.offset, other.offset)
+            np.testing.assert_array_equal(span.value, other.value)
+
+
+@attr('UNIT',group='dm')
+class RecordDictionaryToolTest(PyonTestCase, SpanAssertions):
+
+    def test_spanify(self):
+        cases = [
+            np.array([1]),
+            np.array([1, 1, 1, 1]),
+            np.array([1, 1, 2, 2, 2, 3, 1, 1]),
+            np.array([0.5, np.nan, np.nan, 0.5]),
+            np.array(['a', 'a', 'b', 'b', 'a']),
+            np.array([[1, 2], [1, 2], [1, 3], [1, 3]]),
+            np.array([], dtype='int32'),
+        ]
+        for arr in cases:
+            self.assert_spans_equal(RecordDictionaryTool.spanify(arr), RecordDictionaryTool._spanify_loop(arr))
+
+        spans = RecordDictionaryTool.spanify(np.array([4, 4, 7]))
+        self.assertEquals([(s.lower_bound, s.upper_bound, s.offset) for s in spans], [(None, 2, 0), (2, None, -2)])
+
+
+# Timings only, run with: bin/nosetests -a BENCHMARK
+@attr('BENCHMARK',group='dm')
+class RecordDictionaryToolBenchmark(PyonTestCase, SpanAssertions):
+
+    def test_spanify_benchmark(self):
+        # Sparse constant: long runs with a handful of changes
+        arr = np.repeat(np.arange(10, dtype='float64'), 10000)
+
+        then = time.time()
+        expected = RecordDictionaryTool._spanify_loop(arr)
+        loop_time = time.time() - then
+
+        then = time.time()
+        spans = RecordDictionaryTool.spanify(arr)
+        vector_time = time.time() - then
+
+        log.info('spanify over %d records: loop %.4fs, vectorized %.4fs', arr.shape[0], loop_time, vector_time)
+        self.assert_spans_equal(spans, expected)
@@ -0,0 +1,416 @@
+#!/usr/bin/env python
+'''
+@file ion/services/dm/utility/local_index.py
+@description Embedded in-process search indexes for discovery deployments without ElasticSearch
+'''
+
+from pyon.container.cc import Container
+from pyon.ion.event import EventSubscriber
+from pyon.public import OT
+from pyon.util.log import log
+
+import bisect
+import collections
+import difflib
+import fnmatch
+import math
+import re
+
+
+class LocalIndex(object):
+    '''
+    An in-process index over the resources of one discovery index.
+
+    - Term and wildcard queries use an inverted index: field -> term -> resource ids
+    - Range and time queries use sorted value arrays per numeric field
+    - Geo queries use a fixed grid of GRID_SIZE degree cells per geo field
+
+    Field names are the dotted attribute paths of the resource (e.g. temporal_domain.start_datetime),
+    every term is also indexed under '_all'.
+    '''
+    GRID_SIZE       = 1.0  # Degrees per geo cell
+    FUZZY_RATIO     = 0.7  # Minimum similarity for fuzzy term matches
+    NUMERIC_STRINGS = ('ts_created', 'ts_updated', 'start_datetime', 'end_datetime')
+
+    _token = re.compile(r'\w+', re.UNICODE)
+
+    def __init__(self, name, resource_types=None):
+        self.name           = name
+        self.resource_types = set(resource_types) if resource_types else None
+        self._docs   = {}                                                         # resource_id -> indexed entries
+        self._terms  = collections.defaultdict(lambda : collections.defaultdict(set)) # field -> term -> ids
+        self._values = collections.defaultdict(list)                              # field -> sorted values
+        self._ids    = collections.defaultdict(list)                              # field -> ids aligned with _values
+        self._cells  = collections.defaultdict(lambda : collections.defaultdict(set)) # field -> cell -> ids
+        self._points = collections.defaultdict(dict)                              # field -> resource_id -> (lon, lat)
+
+    def __len__(self):
+        return len(self._docs)
+
+    def __contains__(self, resource_id):
+        return resource_id in self._docs
+
+    def accepts(self, resource_type):
+        return self.resource_types is None or resource_type in self.resource_types
+
+    #--------------------------------------------------------------------------------
+    # Maintenance
+    #--------------------------------------------------------------------------------
+
+    def add(self, resource_id, resource):
+        '''
+        Indexes (or re-indexes) a resource
+        '''
+        self.remove(resource_id)
+        doc = {'terms':set(), 'numbers':[], 'points':[], 'sort':{}}
+        leaves, points = self._extract(resource)
+
+        for field, values in leaves.iteritems():
+            doc['sort'][field] = values[0]
+            for value in values:
+                for term in self._terms_for(value):
+                    doc['terms'].add((field, term))
+                    doc['terms'].add(('_all', term))
+                number = self._number_for(field, value)
+                if number is not None:
+                    doc['numbers'].append((field, number))
+
+        for field, term in doc['terms']:
+            self._terms[field][term].add(resource_id)
+        for field, number in doc['numbers']:
+            i = bisect.bisect_right(self._values[field], number)
+            self._values[field].insert(i, number)
+            self._ids[field].insert(i, resource_id)
+        for field, lon, lat in points:
+            doc['points'].append((field, lon, lat))
+            self._points[field][resource_id] = (lon, lat)
+            self._cells[field][self._cell(lon, lat)].add(resource_id)
+
+        self._docs[resource_id] = doc
+
+    def remove(self, resource_id):
+        doc = self._docs.pop(resource_id, None)
+        if doc is None:
+            return
+        for field, term in doc['terms']:
+            ids = self._terms[field][term]
+            ids.discard(resource_id)
+            if not ids:
+                del self._terms[field][term]
+        for field, number in doc['numbers']:
+            values, ids = self._values[field], self._ids[field]
+            i = bisect.bisect_left(values, number)
+            while i < len(values) and ids[i] != resource_id:
+                i += 1
+            if i < len(values):
+                del values[i]
+                del ids[i]
+        for field, lon, lat in doc['points']:
+            self._points[field].pop(resource_id, None)
+            self._cells[field][self._cell(lon, lat)].discard(resource_id)
+
+    #--------------------------------------------------------------------------------
+    # Queries, each returns a set of resource ids
+    #--------------------------------------------------------------------------------
+
+    def term(self, field, value, fuzzy=False, match=False):
+        terms = self._terms.get(self._field(field), {})
+        value = unicode(value).lower()
+
+        if fuzzy:
+            results = set()
+            for token in self._token.findall(value):
+                for term in difflib.get_close_matches(token, terms.keys(), n=len(terms) or 1, cutoff=self.FUZZY_RATIO):
+                    results.update(terms[term])
+            return results
+
+        if '*' in value or '?' in value:
+            results = set()
+            for term in fnmatch.filter(terms.keys(), value):
+                results.update(terms[term])
+            return results
+
+        if value in terms:
+            return set(terms[value])
+
+        tokens = self._token.findall(value)
+        if not tokens:
+            return set()
+        matches = [terms.get(token, set()) for token in tokens]
+        if match:
+            # Phrase prefix, the last token may be incomplete
+            prefix = tokens[-1]
+            matches[-1] = set()
+            for term in terms.iterkeys():
+                if term.startswith(prefix):
+                    matches[-1].update(terms[term])
+        matches.sort(key=len)
+        return set(matches[0]).intersection(*matches[1:])
+
+    def range(self, field, from_value=None, to_value=None):
+        results = set()
+        for name in self._numeric_fields(field):
+            values = self._values[name]
+            lower = 0 if from_value is None else bisect.bisect_left(values, from_value)
+            upper = len(values) if to_value is None else bisect.bisect_right(values, to_value)
+            results.update(self._ids[name][lower:upper])
+        return results
+
+    def bounds(self, lower_field, upper_field, from_value=None, to_value=None):
+        '''
+        Resources whose [lower, upper] bounds satisfy the discovery bounds filter:
+        (lower >= from or upper >= from) and (lower <= to or upper <= to)
+        '''
+        after  = self.range(lower_field, from_value=from_value) | self.range(upper_field, from_value=from_value)
+        before = self.range(lower_field, to_value=to_value) | self.range(upper_field, to_value=to_value)
+        return after & before
+
+    def geo_bbox(self, field, top_left, bottom_right):
+        '''
+        Corners are [lon, lat] like ElasticSearch geo points
+        '''
+        west, north = top_left
+        east, south = bottom_right
+        return set(rid for rid, (lon, lat) in self._candidates(field, west, south, east, north)
+                   if west <= lon <= east and south <= lat <= north)
+
+    def geo_distance(self, field, origin, distance, units='mi'):
+        '''
+        Resources within distance of origin [lon, lat], ordered nearest first
+        '''
+        radius = 3958.8 if units == 'mi' else 6371.0
+        distance = float(distance)
+        lon0, lat0 = origin
+        dlat = math.degrees(distance / radius)
+        dlon = dlat / max(math.cos(math.radians(lat0)), 1e-6)
+
+        nearest = []
+        for rid, (lon, lat) in self._candidates(field, lon0 - dlon, lat0 - dlat, lon0 + dlon, lat0 + dlat):
+            d = self.haversine(lon0, lat0, lon, lat, radius)
+            if d <= distance:
+                nearest.append((d, rid))
+        nearest.sort()
+        return [rid for d, rid in nearest]
+
+    def sort(self, resource_ids, order=None):
+        '''
+        Orders resource ids by the first value of the order field, {field : 'asc'|'desc'}
+        '''
+        if not order:
+            return sorted(resource_ids)
+        field, direction = order.items()[0]
+        docs = self._docs
+        def key(rid):
+            value = docs[rid]['sort'].get(field) if rid in docs else None
+            return (value is None, value)
+        return sorted(resource_ids, key=key, reverse=(direction == 'desc'))
+
+    @staticmethod
+    def haversine(lon0, lat0, lon1, lat1, radius):
+        lon0, lat0, lon1, lat1 = map(math.radians, (lon0, lat0, lon1, lat1))
+        a = math.sin((lat1 - lat0) / 2) ** 2 + math.cos(lat0) * math.cos(lat1) * math.sin((lon1 - lon0) / 2) ** 2
+        return 2 * radius * math.asin(math.sqrt(min(a, 1.0)))
+
+    #--------------------------------------------------------------------------------
+    # Helpers
+    #--------------------------------------------------------------------------------
+
+    @staticmethod
+    def _field(field):
+        return '_all' if field in ('*', '') else field
+
+    def _numeric_fields(self, field):
+        field = self._field(field)
+        if field in self._values:
+            return [field]
+        # Bare names (e.g. with '*') match the nested attribute of the same name
+        return [name for name in self._values if name.endswith('.%s' % field) or field == '_all']
+
+    def _candidates(self, field, west, south, east, north):
+        field = self._field(field)
+        fields = self._points.keys() if field == '_all' else [field]
+        for name in fields:
+            points = self._points.get(name, {})
+            x0, y0 = self._cell(west, south)
+            x1, y1 = self._cell(east, north)
+            if (x1 - x0 + 1) * (y1 - y0 + 1) > len(points):
+                # Fewer points than cells, a scan is cheaper
+                candidates = points.iterkeys()
+            else:
+                candidates = set()
+                cells = self._cells.get(name, {})
+                for x in xrange(x0, x1 + 1):
+                    for y in xrange(y0, y1 + 1):
+                        candidates.update(cells.get((x, y), ()))
+            for rid in candidates:
+                yield rid, points[rid]
+
+    def _cell(self, lon, lat):
+        return int(math.floor(lon / self.GRID_SIZE)), int(math.floor(lat / self.GRID_SIZE))
+
+    def _terms_for(self, value):
+        if isinstance(value, bool):
+            return [str(value).lower()]
+        if isinstance(value, (int, long, float)):
+            return [str(value)]
+        if isinstance(value, basestring):
+            value = value.lower()
+            return set([value] + self._token.findall(value))
+        return []
+
+    def _number_for(self, field, value):
+        if isinstance(value, bool):
+            return None
+        if isinstance(value, (int, long, float)):
+            return float(value)
+        if isinstance(value, basestring) and field.rsplit('.', 1)[-1] in self.NUMERIC_STRINGS:
+            try:
+                return float(value)
+            except ValueError:
+                return None
+        return None
+
+    @classmethod
+    def _extract(cls, resource):
+        '''
+        Flattens a resource into {dotted field : [leaf values]} and a list of (field, lon, lat) geo points
+        '''
+        leaves = collections.defaultdict(list)
+        points = []
+        def walk(value, prefix):
+            if isinstance(value, dict):
+                items = value.items()
+            elif hasattr(value, '__dict__'):
+                items = value.__dict__.items()
+            elif isinstance(value, (list, tuple, set)):
+                for v in value:
+                    walk(v, prefix)
+                return
+            else:
+                if value is not None and prefix:
+                    leaves[prefix].append(value)
+                return
+            attrs = dict(items)
+            if prefix and isinstance(attrs.get('lat'), (int, long, float)) and isinstance(attrs.get('lon'), (int, long, float)):
+                points.append((prefix, float(attrs['lon']), float(attrs['lat'])))
+            for k, v in attrs.iteritems():
+                if k.startswith('_'):
+                    continue
+                walk(v, '%s.%s' % (prefix, k) if prefix else k)
+        walk(resource, '')
+        return leaves, points
+
+
+class LocalSearchIndex(object):
+    '''
+    The embedded indexes of the container, kept current from resource events.
+
+    Resources are read from the resource registry when the indexes are started and re-read whenever a
+    ResourceModifiedEvent reports a change, retired and deleted resources are dropped.
+    The indexes are shared by everything in the container that started them, they are only stopped
+    once stop has been called as many times as start.
+    '''
+    PAGE_SIZE   = 1000 # Resources read per request when indexing every resource type
+
+    _indexes    = {}
+    _subscriber = None
+    _resource_registry = None
+    _users      = 0
+
+    @classmethod
+    def start(cls, resource_registry, index_definitions):
+        '''
+        @param resource_registry  Resource registry client used to read resources
+        @param index_definitions  {index name : [resource types]}, None indexes every resource type
+        '''
+        cls._users += 1
+        if cls._resource_registry is not None:
+            return
+        cls._resource_registry = resource_registry
+        for name, resource_types in index_definitions.iteritems():
+            cls._indexes[name] = LocalIndex(name, resource_types)
+
+        resource_types = set()
+        for types in index_definitions.itervalues():
+            if not types:
+                # An index over every resource type needs every resource, not only those of the listed types
+                cls._index_all_resources(resource_registry)
+                break
+            resource_types.update(types)
+        else:
+            for resource_type in resource_types:
+                resources, _ = resource_registry.find_resources(restype=resource_type, id_only=False)
+                for resource in resources:
+                    cls.index_resource(resource)
+
+        if Container.instance is not None:
+            cls._subscriber = EventSubscriber(event_type=OT.ResourceModifiedEvent, callback=cls._resource_modified, auto_delete=True)
+            cls._subscriber.start()
+
+    @classmethod
+    def _index_all_resources(cls, resource_registry):
+        '''
+        Indexes every resource in the registry, read PAGE_SIZE resources at a time
+        '''
+        skip = 0
+        while True:
+            resources, _ = resource_registry.find_resources_ext(limit=cls.PAGE_SIZE, skip=skip, id_only=False)
+            for resource in resources:
+                cls.index_resource(resource)
+            if len(resources) < cls.PAGE_SIZE:
+                return
+            skip += cls.PAGE_SIZE
+
+    @classmethod
+    def stop(cls):
+        cls._users = max(cls._users - 1, 0)
+        if cls._users:
+            return
+        if cls._subscriber is not None:
+            cls._subscriber.stop()
+            cls._subscriber = None
+        cls._indexes.clear()
+        cls._resource_registry = None
+
+    @classmethod
+    def get_index(cls, name):
+        '''
+        Index whose name contains name, like IndexManagementService.find_indexes
+        '''
+        if not name:
+            return None
+        if name in cls._indexes:
+            return cls._indexes[name]
+        for index_name, index in cls._indexes.iteritems():
+            if name in index_name:
+                return index
+        return None
+
+    @classmethod
+    def index_resource(cls, resource):
+        resource_id = resource._id
+        if getattr(resource, 'lcstate', None) == 'RETIRED':
+            cls.remove_resource(resource_id)
+            return
+        resource_type = getattr(resource, 'type_', None) or type(resource).__name__
+        for index in cls._indexes.itervalues():
+            if index.accepts(resource_type):
+                index.add(resource_id, resource)
+
+    @classmethod
+    def remove_resource(cls, resource_id):
+        for index in cls._indexes.itervalues():
+            index.remove(resource_id)
+
+    @classmethod
+    def _resource_modified(cls, event, *args, **kwargs):
+        if event.sub_type == 'DELETE':
+            cls.remove_resource(event.origin)
+            return
+        try:
+            resource = cls._resource_registry.read(event.origin)
+        except Exception:
+            log.exception('Unable to index resource %s', event.origin)
+            cls.remove_resource(event.origin)
+            return
+        cls.index_resource(resource)
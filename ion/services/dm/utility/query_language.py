@@ -7,6 +7,12 @@
 '''
 from pyparsing import ParseException, Regex, quotedString, CaselessLiteral, MatchFirst, removeQuotes, Optional
 from pyon.core.exception import BadRequest
+from pyon.public import CFG
+from gevent.coros import RLock
+
+import collections
+import copy
+import re
 
 
 class QueryLanguage(object):
@@ -58,6 +64,15 @@ class QueryLanguage(object):
               <double>  ::= 0-9 ('.' 0-9)
               <integer> ::= 0-9
     '''
+    QUERY_CACHE_LIMIT = CFG.get_safe('service.discovery.query_cache_size', 200)
+
+    _parser      = None
+    _query_cache = collections.OrderedDict() # normalized query string -> json query (LRU)
+    _cache_lock  = RLock()
+    cache_hits   = 0
+    cache_misses = 0
+
+    _quoted = re.compile(r'("(?:[^"\\]|\\.)*"|\'(?:[^\'\\]|\\.)*\')')
 
     def __init__(self):
 
@@ -314,6 +329,50 @@ class QueryLanguage(object):
 
         return self.json_query
 
+    @classmethod
+    def normalize(cls, s):
+        '''
+        Collapses whitespace and case outside of the quoted strings, keywords are caseless and quoted
+        strings are the only case sensitive tokens in the language.
+        '''
+        parts = cls._quoted.split(s.strip())
+        # Quoted strings land on the odd indices
+        for i in xrange(0, len(parts), 2):
+            parts[i] = ' '.join(parts[i].lower().split())
+        return ''.join(parts)
+
+    @classmethod
+    def parse_cached(cls, s):
+        '''
+        Parses string s with a shared parser, the json query is cached by the normalized query string.
+        Callers get their own copy of the json query.
+        '''
+        key = cls.normalize(s)
+        with cls._cache_lock:
+            json_query = cls._query_cache.pop(key, None)
+            if json_query is not None:
+                cls.cache_hits += 1
+            else:
+                cls.cache_misses += 1
+                if cls._parser is None:
+                    cls._parser = cls()
+                json_query = cls._parser.parse(s)
+                if len(cls._query_cache) >= cls.QUERY_CACHE_LIMIT:
+                    cls._query_cache.popitem(0)
+            cls._query_cache[key] = json_query
+            return copy.deepcopy(json_query)
+
+    @classmethod
+    def cache_stats(cls):
+        return {'hits':cls.cache_hits, 'misses':cls.cache_misses, 'size':len(cls._query_cache)}
+
+    @classmethod
+    def clear_query_cache(cls):
+        with cls._cache_lock:
+            cls._query_cache.clear()
+            cls.cache_hits = 0
+            cls.cache_misses = 0
+
     #=========================================
     # Methods for checking the requests
     #=========================================
@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+'''
+@file ion/services/dm/utility/test/test_coverage_pool.py
+@brief Unit tests for the read-only coverage pool
+'''
+
+from pyon.util.unit_test import PyonTestCase
+from ion.services.dm.utility.coverage_pool import CoveragePool
+from nose.plugins.attrib import attr
+from mock import Mock, patch
+
+
+@attr('UNIT',group='dm')
+class CoveragePoolUnitTest(PyonTestCase):
+    def setUp(self):
+        patcher = patch('ion.services.dm.utility.coverage_pool.DatasetManagementService')
+        self.dsm = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.dsm._get_coverage.side_effect = lambda dataset_id, mode: Mock(name=dataset_id)
+
+        self.addCleanup(CoveragePool.clear)
+        self.addCleanup(setattr, CoveragePool, 'limit', CoveragePool.limit)
+        CoveragePool.limit = 2
+
+    def test_shared_handles(self):
+        with CoveragePool.read('ds1') as cov:
+            with CoveragePool.read('ds1') as cov2:
+                self.assertIs(cov, cov2)
+        self.assertEquals(self.dsm._get_coverage.call_count, 1)
+        self.assertFalse(cov.close.called)
+
+    def test_lru_eviction(self):
+        cov1 = CoveragePool.acquire('ds1')
+        with CoveragePool.read('ds2') as cov2:
+            pass
+        # ds1 is in use so the idle ds2 is evicted
+        with CoveragePool.read('ds3'):
+            pass
+        cov2.close.assert_called_once_with(timeout=5)
+        self.assertFalse(cov1.close.called)
+        self.assertEquals(CoveragePool._handles.keys(), ['ds1', 'ds3'])
+        CoveragePool.release('ds1', cov1)
+
+    def test_invalidation(self):
+        cov = CoveragePool.acquire('ds1')
+        CoveragePool.invalidate('ds1')
+        # Closed only once the reader is done with it
+        self.assertFalse(cov.close.called)
+        with CoveragePool.read('ds1') as fresh:
+            self.assertIsNot(fresh, cov)
+        CoveragePool.release('ds1', cov)
+        cov.close.assert_called_once_with(timeout=5)
@@ -161,7 +161,74 @@ class RecordDictionaryIntegrationTest(IonIntegrationTestCase):
         self.assertEquals(rdt2.connection_index,'0')
         for k,v in rdt.iteritems():
             self.assertTrue(np.array_equal(rdt[k], rdt2[k]))
-        
+
+    def test_pdict_cache(self):
+        pdict_id = self.dataset_management.read_parameter_dictionary_by_name('ctd_parsed_param_dict', id_only=True)
+        stream_def_id = self.pubsub_management.create_stream_definition('ctd', parameter_dictionary_id=pdict_id)
+        self.addCleanup(self.pubsub_management.delete_stream_definition, stream_def_id)
+
+        rdt = RecordDictionaryTool(stream_definition_id=stream_def_id)
+        rdt['time'] = np.arange(10)
+        rdt['temp'] = np.arange(10)
+        granule = rdt.to_granule()
+
+        # The compiled parameter dictionary is shared, values are not
+        rdt2 = RecordDictionaryTool.load_from_granule(granule)
+        rdt3 = RecordDictionaryTool.load_from_granule(granule)
+        self.assertIs(rdt._pdict, rdt2._pdict)
+        self.assertIs(rdt2._pdict, rdt3._pdict)
+        rdt3['temp'] = np.arange(10) + 1
+        np.testing.assert_array_equal(rdt2['temp'], np.arange(10))
+
+        pdict_dump = rdt._pdict.dump()
+        rdt4 = RecordDictionaryTool(param_dictionary=pdict_dump)
+        rdt5 = RecordDictionaryTool(param_dictionary=pdict_dump)
+        self.assertIs(rdt4._pdict, rdt5._pdict)
+
+    def test_size_split(self):
+        pdict_id = self.dataset_management.read_parameter_dictionary_by_name('ctd_parsed_param_dict', id_only=True)
+        stream_def_id = self.pubsub_management.create_stream_definition('ctd', parameter_dictionary_id=pdict_id)
+        self.addCleanup(self.pubsub_management.delete_stream_definition, stream_def_id)
+
+        rdt = RecordDictionaryTool(stream_definition_id=stream_def_id)
+        rdt['time'] = np.arange(20)
+        rdt['temp'] = np.arange(20) * 1.5
+
+        self.assertTrue(rdt._values_size() < rdt.size())
+        self.assertTrue(rdt.size(exact=True) > 0)
+
+        chunks = rdt.split(rdt.size() / 3)
+        self.assertTrue(len(chunks) > 1)
+        for chunk in chunks:
+            self.assertTrue(chunk.size() <= rdt.size() / 3)
+        np.testing.assert_array_equal(np.concatenate([chunk['time'] for chunk in chunks]), np.arange(20))
+        self.assertEquals(rdt.split(rdt.size()), [rdt])
+
+
+    def test_columnar_granule(self):
+        pdict_id = self.dataset_management.read_parameter_dictionary_by_name('ctd_parsed_param_dict', id_only=True)
+        stream_def_id = self.pubsub_management.create_stream_definition('ctd columnar', parameter_dictionary_id=pdict_id, stream_configuration={'granule_encoding':'columnar'})
+        self.addCleanup(self.pubsub_management.delete_stream_definition, stream_def_id)
+
+        rdt = RecordDictionaryTool(stream_definition_id=stream_def_id)
+        rdt['time'] = np.arange(20)
+        rdt['temp'] = np.arange(20) * 1.5
+        rdt['pressure'] = [20] * 20
+
+        granule = rdt.to_granule(connection_id='c1', connection_index='0')
+        self.assertIn('__columnar__', granule.record_dictionary)
+
+        rdt2 = RecordDictionaryTool.load_from_granule(granule)
+        self.assertEquals(rdt2.connection_id, 'c1')
+        for k,v in rdt.iteritems():
+            np.testing.assert_array_equal(rdt[k], rdt2[k])
+        self.assertEquals(rdt2['pressure'].dtype, rdt['pressure'].dtype)
+
+        # The default encoding remains available to every stream
+        granule = rdt.to_granule(encoding='record')
+        self.assertNotIn('__columnar__', granule.record_dictionary)
+        np.testing.assert_array_equal(RecordDictionaryTool.load_from_granule(granule)['temp'], np.arange(20) * 1.5)
+
 
 
     def test_rdt_param_funcs(self):
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+'''
+@file ion/services/dm/utility/test/test_local_index.py
+@brief Unit tests for the embedded discovery indexes
+'''
+
+from pyon.util.unit_test import PyonTestCase
+from pyon.util.containers import DotDict
+from ion.services.dm.utility.local_index import LocalIndex, LocalSearchIndex
+from nose.plugins.attrib import attr
+from mock import Mock, patch
+
+
+class Resource(object):
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+@attr('UNIT',group='dm')
+class LocalIndexUnitTest(PyonTestCase):
+    def setUp(self):
+        self.ctd = Resource(_id='ctd', type_='DataProduct', name='CTD Parsed Data', ts_created='1000',
+                location={'lat':40.0, 'lon':-70.0},
+                geospatial_bounds={'geospatial_vertical_min':0.0, 'geospatial_vertical_max':10.0},
+                nominal_datetime={'start_datetime':'100', 'end_datetime':'200'})
+        self.glider = Resource(_id='glider', type_='DataProduct', name='Glider raw data', ts_created='2000',
+                location={'lat':41.5, 'lon':-71.0},
+                geospatial_bounds={'geospatial_vertical_min':20.0, 'geospatial_vertical_max':30.0},
+                nominal_datetime={'start_datetime':'300', 'end_datetime':'400'})
+        self.index = LocalIndex('data_products_index', ['DataProduct'])
+        self.index.add('ctd', self.ctd)
+        self.index.add('glider', self.glider)
+
+    def test_term(self):
+        self.assertEquals(self.index.term('name', 'data'), set(['ctd', 'glider']))
+        self.assertEquals(self.index.term('name', 'ctd*'), set(['ctd']))
+        self.assertEquals(self.index.term('*', 'glider'), set(['glider']))
+        self.assertEquals(self.index.term('name', 'CTD Parsed'), set(['ctd']))
+        self.assertEquals(self.index.term('name', 'parsed da', match=True), set(['ctd']))
+        self.assertEquals(self.index.term('name', 'glidr', fuzzy=True), set(['glider']))
+
+    def test_range_and_bounds(self):
+        self.assertEquals(self.index.range('ts_created', 1500), set(['glider']))
+        self.assertEquals(self.index.range('ts_created', to_value=1000), set(['ctd']))
+
+        vertical = ('geospatial_bounds.geospatial_vertical_min', 'geospatial_bounds.geospatial_vertical_max')
+        self.assertEquals(self.index.bounds(vertical[0], vertical[1], 5.0, 15.0), set(['ctd']))
+        # Bare names match the nested fields
+        self.assertEquals(self.index.bounds('geospatial_vertical_min', 'geospatial_vertical_max', 5.0, 25.0), set(['ctd', 'glider']))
+        self.assertEquals(self.index.bounds('start_datetime', 'end_datetime', 250., 500.), set(['glider']))
+
+    def test_geo(self):
+        self.assertEquals(self.index.geo_bbox('location', [-72, 42], [-70.5, 41]), set(['glider']))
+        self.assertEquals(self.index.geo_bbox('*', [-180, 90], [180, -90]), set(['ctd', 'glider']))
+        self.assertEquals(self.index.geo_distance('location', [-70.0, 40.0], 150, 'km'), ['ctd'])
+        self.assertEquals(self.index.geo_distance('location', [-70.0, 40.0], 200, 'km'), ['ctd', 'glider'])
+
+    def test_maintenance(self):
+        self.glider.name = 'Something else'
+        self.index.add('glider', self.glider)
+        self.assertEquals(self.index.term('name', 'glider'), set())
+        self.assertEquals(len(self.index._values['ts_created']), 2)
+
+        self.index.remove('ctd')
+        self.assertEquals(len(self.index), 1)
+        self.assertEquals(self.index.term('name', 'data'), set())
+        self.assertEquals(self.index.range('ts_created'), set(['glider']))
+        self.assertEquals(self.index.geo_bbox('*', [-180, 90], [180, -90]), set(['glider']))
+
+        self.assertEquals(self.index.sort(['glider', 'ctd']), ['ctd', 'glider'])
+
+    def test_search_index_start(self):
+        rr = Mock()
+        rr.find_resources.return_value = ([self.ctd], [])
+        LocalSearchIndex.start(rr, {'sys_data_products_index':['DataProduct']})
+        self.addCleanup(LocalSearchIndex.stop)
+
+        self.assertIn('ctd', LocalSearchIndex.get_index('data_products_index'))
+        rr.find_resources.assert_called_once_with(restype='DataProduct', id_only=False)
+        self.assertFalse(rr.find_resources_ext.called)
+
+    def test_search_index_shared(self):
+        rr = Mock()
+        rr.find_resources.return_value = ([self.ctd], [])
+        LocalSearchIndex.start(rr, {'sys_data_products_index':['DataProduct']})
+        LocalSearchIndex.start(rr, {'sys_data_products_index':['DataProduct']})
+        self.addCleanup(LocalSearchIndex.stop)
+        self.assertEquals(rr.find_resources.call_count, 1)
+
+        # One of the two workers quits, the other one still uses the index
+        LocalSearchIndex.stop()
+        self.assertIn('ctd', LocalSearchIndex.get_index('data_products_index'))
+
+        LocalSearchIndex.stop()
+        self.assertIsNone(LocalSearchIndex.get_index('data_products_index'))
+
+    @patch.object(LocalSearchIndex, 'PAGE_SIZE', 2)
+    def test_search_index_start_all_types(self):
+        org = Resource(_id='org', type_='Org', name='Marine facility')
+        resources = [self.ctd, org, self.glider]
+        rr = Mock()
+        rr.find_resources_ext.side_effect = lambda limit, skip, id_only: (resources[skip:skip+limit], [])
+        LocalSearchIndex.start(rr, {'sys_data_products_index':['DataProduct'], 'sys_resources_index':None})
+        self.addCleanup(LocalSearchIndex.stop)
+
+        # Resources outside the listed types are read too, a page at a time
+        self.assertEquals(rr.find_resources_ext.call_count, 2)
+        self.assertFalse(rr.find_resources.called)
+        index = LocalSearchIndex.get_index('resources_index')
+        self.assertEquals(len(index), 3)
+        self.assertIn('org', index)
+        self.assertNotIn('org', LocalSearchIndex.get_index('data_products_index'))
+
+    def test_search_index_events(self):
+        rr = Mock()
+        rr.find_resources_ext.return_value = ([self.ctd], [])
+        LocalSearchIndex.start(rr, {'sys_data_products_index':['DataProduct'], 'sys_resources_index':None})
+        self.addCleanup(LocalSearchIndex.stop)
+
+        index = LocalSearchIndex.get_index('data_products_index')
+        self.assertIn('ctd', index)
+
+        rr.read.return_value = self.glider
+        LocalSearchIndex._resource_modified(DotDict(origin='glider', sub_type='CREATE'))
+        self.assertIn('glider', index)
+        self.assertIn('glider', LocalSearchIndex.get_index('resources_index'))
+
+        self.glider.lcstate = 'RETIRED'
+        LocalSearchIndex._resource_modified(DotDict(origin='glider', sub_type='UPDATE'))
+        self.assertNotIn('glider', index)
+
+        LocalSearchIndex._resource_modified(DotDict(origin='ctd', sub_type='DELETE'))
+        self.assertEquals(len(index), 0)
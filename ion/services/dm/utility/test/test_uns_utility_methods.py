@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+'''
+@file ion/services/dm/utility/test/test_uns_utility_methods.py
+@brief Unit tests and benchmarks for the notification subscription matching
+'''
+
+from pyon.util.unit_test import PyonTestCase
+from pyon.util.log import log
+from ion.services.dm.utility.uns_utility_methods import calculate_reverse_user_info, check_user_notification_interest, SubscriptionIndex
+from pyon.public import IonObject
+from interface.objects import NotificationRequest, ResourceLifecycleEvent
+from nose.plugins.attrib import attr
+
+import random
+import time
+
+EVENT_TYPES = ['ResourceLifecycleEvent', 'DetectionEvent', 'DeviceEvent', 'DeviceStatusEvent', 'PlatformEvent',
+               'PlatformTelemetryEvent', 'ProcessLifecycleEvent', 'ResourceAgentStateEvent', 'TimerEvent']
+
+def random_subscriptions(rng, users):
+    '''
+    Reverse user info for users with 10 subscriptions each, a few subscribe to any origin
+    '''
+    reverse_user_info = dict((key, {}) for key in ('event_type', 'event_origin', 'event_subtype', 'event_origin_type'))
+    for i in xrange(users):
+        user_id = 'user_%s' % i
+        for j in xrange(10):
+            origin = '' if rng.random() < 0.05 else 'origin_%s' % rng.randint(0, 999)
+            for key, value in (('event_type', rng.choice(EVENT_TYPES)),
+                               ('event_origin', origin),
+                               ('event_subtype', 'subtype_%s' % rng.randint(0, 9)),
+                               ('event_origin_type', 'origin_type_%s' % rng.randint(0, 9))):
+                reverse_user_info[key].setdefault(value, set()).add(user_id)
+    for users_by_value in reverse_user_info.itervalues():
+        for value, user_ids in users_by_value.iteritems():
+            users_by_value[value] = list(user_ids)
+    return reverse_user_info
+
+def random_events(rng, count):
+    return [IonObject(rng.choice(EVENT_TYPES), origin='origin_%s' % rng.randint(0, 999),
+                      sub_type='subtype_%s' % rng.randint(0, 9), origin_type='origin_type_%s' % rng.randint(0, 9))
+            for i in xrange(count)]
+
+
+@attr('UNIT',group='dm')
+class SubscriptionIndexTest(PyonTestCase):
+    def setUp(self):
+        def user(*notifications):
+            return {'user_contact':None, 'notifications':list(notifications),
+                    'notifications_daily_digest':False, 'notifications_disabled':False}
+
+        self.user_info = {
+            'user_1' : user(NotificationRequest(name='n1', origin='instrument_1', origin_type='type_1',
+                                                event_type='ResourceLifecycleEvent', event_subtype='subtype_1')),
+            'user_2' : user(NotificationRequest(name='n2', origin='instrument_2', origin_type='type_1',
+                                                event_type='ResourceLifecycleEvent', event_subtype='subtype_1')),
+            # Any origin
+            'user_3' : user(NotificationRequest(name='n3', origin='', origin_type='type_1',
+                                                event_type='ResourceLifecycleEvent', event_subtype='subtype_1')),
+        }
+        self.reverse_user_info = calculate_reverse_user_info(self.user_info)
+
+    def test_reverse_user_info(self):
+        self.assertEquals(self.reverse_user_info['event_origin']['instrument_1'], ['user_1'])
+        self.assertEquals(self.reverse_user_info['event_origin'][''], ['user_3'])
+        self.assertEquals(set(self.reverse_user_info['event_type']['ResourceLifecycleEvent']), set(['user_1', 'user_2', 'user_3']))
+
+    def test_match(self):
+        subscriptions = SubscriptionIndex(self.reverse_user_info)
+        event = ResourceLifecycleEvent(origin='instrument_1', origin_type='type_1', sub_type='subtype_1')
+        self.assertEquals(set(subscriptions.match(event)), set(['user_1', 'user_3']))
+        self.assertEquals(set(check_user_notification_interest(event, self.reverse_user_info)), set(['user_1', 'user_3']))
+        self.assertEquals(set(check_user_notification_interest(event, subscriptions)), set(['user_1', 'user_3']))
+
+        event = ResourceLifecycleEvent(origin='instrument_9', origin_type='type_1', sub_type='subtype_1')
+        self.assertEquals(subscriptions.match(event), ['user_3'])
+
+        event = ResourceLifecycleEvent(origin='instrument_1', origin_type='type_2', sub_type='subtype_1')
+        self.assertEquals(subscriptions.match(event), [])
+
+        # Matching repeatedly leaves the reverse user info alone
+        for i in xrange(3):
+            check_user_notification_interest(ResourceLifecycleEvent(origin='instrument_2', origin_type='type_1', sub_type='subtype_1'), self.reverse_user_info)
+        self.assertEquals(self.reverse_user_info['event_origin']['instrument_2'], ['user_2'])
+        self.assertEquals(self.reverse_user_info['event_origin'][''], ['user_3'])
+
+    def test_match_random(self):
+        rng = random.Random(0)
+        reverse_user_info = random_subscriptions(rng, 200)
+        subscriptions = SubscriptionIndex(reverse_user_info)
+        for event in random_events(rng, 200):
+            self.assertEquals(set(subscriptions.match(event)), set(check_user_notification_interest(event, reverse_user_info)))
+
+
+# Timings only, run with: bin/nosetests -a BENCHMARK
+@attr('BENCHMARK',group='dm')
+class SubscriptionIndexBenchmark(PyonTestCase):
+    def test_match_benchmark(self):
+        rng = random.Random(0)
+        reverse_user_info = random_subscriptions(rng, 10000)
+        events = random_events(rng, 200)
+
+        then = time.time()
+        expected = [set(check_user_notification_interest(event, reverse_user_info)) for event in events]
+        lists_time = time.time() - then
+
+        then = time.time()
+        subscriptions = SubscriptionIndex(reverse_user_info)
+        compile_time = time.time() - then
+
+        then = time.time()
+        matched = [set(subscriptions.match(event)) for event in events]
+        compiled_time = time.time() - then
+
+        log.info('Matching %d events against 10k users / 100k subscriptions: lists %.4fs, compiled %.4fs (compiled once in %.4fs)',
+                 len(events), lists_time, compiled_time, compile_time)
+        self.assertEquals(matched, expected)
@@ -17,6 +17,7 @@ import string
 from email.mime.text import MIMEText
 from gevent import Greenlet
 import datetime
+import zlib
 
 class fake_smtplib(object):
 
@@ -80,16 +81,10 @@ def _convert_to_human_readable(t = ''):
     it = IonTime(int(t)/1000.)
     return str(it)
 
-def send_email(message, msg_recipient, smtp_client):
+def _format_event(message):
     '''
-    A common method to send email with formatting
-
-    @param message              Event
-    @param msg_recipient        str
-    @param smtp_client          fake or real smtp client object
-
+    The email lines describing a single event
     '''
-
     log.debug("Got type of event to notify on: %s", message.type_)
 
     # Get the diffrent attributes from the event message
@@ -99,28 +94,48 @@ def send_email(message, msg_recipient, smtp_client):
     event_obj_as_string = str(message)
     ts_created = _convert_to_human_readable(message.ts_created)
 
+    return ["Event type: %s," %  event,
+            "",
+            "Originator: %s," %  origin,
+            "",
+            "Description: %s," % description,
+            "",
+            "ts_created: %s," %  ts_created,
+            "",
+            "Event object as a dictionary: %s," %  event_obj_as_string,
+            ""]
+
+EMAIL_FOOTER = ["You received this notification from ION because you asked to be "\
+                "notified about this event from this source. ",
+                "To modify or remove notifications about this event, "\
+                "please access My Notifications Settings in the ION Web UI.",
+                "Do not reply to this email.  This email address is not monitored "\
+                "and the emails will not be read."]
+
+def compose_email(messages, msg_recipient):
+    '''
+    Builds the notification email for one or more events sent to the same recipient
+
+    @param messages             list of Event
+    @param msg_recipient        str
+    @retval (smtp_sender, email string)
+    '''
     #------------------------------------------------------------------------------------
     # build the email from the event content
     #------------------------------------------------------------------------------------
 
-    msg_body = string.join(("Event type: %s," %  event,
-                            "",
-                            "Originator: %s," %  origin,
-                            "",
-                            "Description: %s," % description,
-                            "",
-                            "ts_created: %s," %  ts_created,
-                            "",
-                            "Event object as a dictionary: %s," %  event_obj_as_string,
-                            "",
-                            "You received this notification from ION because you asked to be "\
-                            "notified about this event from this source. ",
-                            "To modify or remove notifications about this event, "\
-                            "please access My Notifications Settings in the ION Web UI.",
-                            "Do not reply to this email.  This email address is not monitored "\
-                            "and the emails will not be read."),
-        "\r\n")
-    msg_subject = "(SysName: " + get_sys_name() + ") ION event " + event + " from " + origin
+    if len(messages) == 1:
+        message = messages[0]
+        msg_body = string.join(_format_event(message) + EMAIL_FOOTER, "\r\n")
+        msg_subject = "(SysName: " + get_sys_name() + ") ION event " + message.type_ + " from " + message.origin
+    else:
+        lines = []
+        for message in messages:
+            lines.extend(_format_event(message))
+            lines.extend(["------------------------", ""])
+        msg_body = string.join(lines + EMAIL_FOOTER, "\r\n")
+        origins = sorted(set(message.origin for message in messages))
+        msg_subject = "(SysName: " + get_sys_name() + ") %s ION events from " % len(messages) + string.join(origins, ", ")
 
     log.debug("msg_body::: %s", msg_body)
 
@@ -135,16 +150,134 @@ def send_email(message, msg_recipient, smtp_client):
     msg['Subject'] = msg_subject
     msg['From'] = smtp_sender
     msg['To'] = msg_recipient
+    return smtp_sender, msg.as_string()
+
+def send_email(message, msg_recipient, smtp_client):
+    '''
+    A common method to send email with formatting
+
+    @param message              Event
+    @param msg_recipient        str
+    @param smtp_client          fake or real smtp client object
+
+    '''
+    smtp_sender, msg = compose_email([message], msg_recipient)
     log.debug("UNS sending email from %s to %s for event type: %s", smtp_sender,msg_recipient, message.type_)
     log.debug("UNS using the smtp client: %s", smtp_client)
 
     try:
-        smtp_client.sendmail(smtp_sender, [msg_recipient], msg.as_string())
+        smtp_client.sendmail(smtp_sender, [msg_recipient], msg)
     except: # Can be due to a broken connection... try to create a connection
         smtp_client = setting_up_smtp_client()
         log.debug("Connect again...message received after ehlo exchange: %s", str(smtp_client.ehlo()))
-        smtp_client.sendmail(smtp_sender, [msg_recipient], msg.as_string())
+        smtp_client.sendmail(smtp_sender, [msg_recipient], msg)
+
+
+REVERSE_USER_INFO_KEYS = ('event_type', 'event_origin', 'event_subtype', 'event_origin_type')
+
+class SubscriptionIndex(object):
+    '''
+    The reverse user info compiled for matching. Each dimension maps a value to the frozenset of users
+    subscribed to it, with the users subscribed to any value ('') already merged in, so matching an event
+    is at most four lookups and three set intersections.
+
+    Build one whenever the reverse user info is (re)calculated:
+        subscriptions = SubscriptionIndex(reverse_user_info)
+        user_ids = subscriptions.match(event)
+    '''
+    def __init__(self, reverse_user_info=None):
+        self.dimensions = {}
+        reverse_user_info = reverse_user_info or {}
+        for dimension in REVERSE_USER_INFO_KEYS:
+            users_by_value = reverse_user_info.get(dimension, {})
+            wildcard = frozenset(users_by_value.get('', ()))
+            compiled = dict((value, frozenset(users) | wildcard) for value, users in users_by_value.iteritems())
+            self.dimensions[dimension] = (compiled, wildcard)
+
+    def lookup(self, dimension, value):
+        '''
+        The users interested in value along dimension, None when nobody subscribed to it specifically
+        '''
+        compiled, wildcard = self.dimensions[dimension]
+        return compiled.get(value, wildcard or None)
+
+    def match(self, event):
+        return _match_subscriptions(event, self.lookup)
+
+class DigestIndex(object):
+    '''
+    The active notifications of the daily digest users, keyed on (event_type, origin) with '' standing for any
+    value, so each event in the digest window is matched against every subscription with four lookups.
+
+    Usage:
+        digests = DigestIndex(user_info)
+        for event in events:
+            digests.add(event)
+        for user_id, events in digests.results.iteritems():
+            ...
+    '''
+    def __init__(self, user_info=None, shards=1, shard=0):
+        self.subscriptions = {}     # (event_type, origin) -> [(origin_type, user_id)]
+        self.results = {}           # user_id -> [events], in the order they were added
+        self._seen = {}             # user_id -> set of event ids already in the digest
+
+        for user_id, value in (user_info or {}).iteritems():
+            # Ignore users who do NOT want batch notifications or who have disabled the delivery switch
+            if value.get('notifications_disabled') or not value.get('notifications_daily_digest'):
+                continue
+            # Digest users can be split between several processes, each one sending its own share
+            if shards > 1 and zlib.crc32(user_id) % shards != shard:
+                continue
+            for notification in value.get('notifications') or []:
+                # If the notification request has expired, then do not use it
+                if notification.temporal_bounds.end_datetime:
+                    continue
+                key = (notification.event_type or '', notification.origin or '')
+                self.subscriptions.setdefault(key, []).append((notification.origin_type or '', user_id))
+
+    def __len__(self):
+        return len(self.subscriptions)
+
+    def add(self, event):
+        '''
+        Fans the event out to the digests of every user with a subscription matching it
+        '''
+        event_type, origin = event.type_ or '', event.origin or ''
+        for key in set([(event_type, origin), (event_type, ''), ('', origin), ('', '')]):
+            for origin_type, user_id in self.subscriptions.get(key, ()):
+                if origin_type and origin_type != event.origin_type:
+                    continue
+                seen = self._seen.setdefault(user_id, set())
+                if event._id in seen:
+                    continue
+                seen.add(event._id)
+                self.results.setdefault(user_id, []).append(event)
 
+def _match_subscriptions(event, lookup):
+    '''
+    Prioritize... First check event type. If that matches proceed to check origin if that attribute of the event obj is filled,
+    If that matches too, check for sub_type if that attribute is filled for the event object...
+    If this matches too, check for origin_type if that attribute of the event object is not empty.
+    '''
+    candidates = []
+    for dimension, value, required in (('event_type', event.type_ or None, True),
+                                       ('event_origin', event.origin, True),
+                                       ('event_subtype', event.sub_type, False),
+                                       ('event_origin_type', event.origin_type, True)):
+        if value is None:
+            continue
+        users = lookup(dimension, value)
+        if users is None:
+            if required:
+                return []
+            continue
+        candidates.append(users)
+
+    if not candidates:
+        return []
+    # Intersect starting from the smallest set
+    candidates.sort(key=len)
+    return list(candidates[0].intersection(*candidates[1:]))
 
 def check_user_notification_interest(event, reverse_user_info):
     '''
@@ -153,81 +286,29 @@ def check_user_notification_interest(event, reverse_user_info):
     Returns the list of users interested in the notification
 
     @param event                Event
-    @param reverse_user_info    dict
+    @param reverse_user_info    dict or SubscriptionIndex
 
     @retval user_ids list
     '''
-#    log.debug("Checking for interested users. Event type: %s, reverse_user_info: %s", event.type_, reverse_user_info)
-
     if not isinstance(event, Event):
         raise BadRequest("The input parameter should have been an Event.")
 
-    if reverse_user_info.has_key('event_origin') and\
-       reverse_user_info.has_key('event_origin_type') and\
-       reverse_user_info.has_key('event_type') and\
-       reverse_user_info.has_key('event_subtype'):
-        pass
-    else:
-        raise BadRequest("Missing keys in reverse_user_info. Reverse_user_info not properly set up.")
-
+    if isinstance(reverse_user_info, SubscriptionIndex):
+        return reverse_user_info.match(event)
 
-    if not event or not reverse_user_info:
-        raise BadRequest("Missing input parameters for method, check_user_notification_interest().")
+    if not reverse_user_info or not all(reverse_user_info.has_key(key) for key in REVERSE_USER_INFO_KEYS):
+        raise BadRequest("Missing keys in reverse_user_info. Reverse_user_info not properly set up.")
 
-    users = set()
+    # Only the sets this event touches are built, reverse_user_info itself is left as is
+    def lookup(dimension, value):
+        users_by_value = reverse_user_info[dimension]
+        if value not in users_by_value:
+            return set(users_by_value['']) if '' in users_by_value else None
+        users = set(users_by_value[value])
+        users.update(users_by_value.get('', ()))
+        return users
 
-    """
-    Prioritize... First check event type. If that matches proceed to check origin if that attribute of the event obj is filled,
-    If that matches too, check for sub_type if that attribute is filled for the event object...
-    If this matches too, check for origin_type if that attribute of the event object is not empty.
-    """
-
-    if event.type_: # for an incoming event with origin type specified
-        if reverse_user_info['event_type'].has_key(event.type_):
-            user_list_1 = reverse_user_info['event_type'][event.type_]
-            if reverse_user_info['event_type'].has_key(''): # for users who subscribe to any event types
-                user_list_1.extend(reverse_user_info['event_type'][''])
-            users = set(user_list_1)
-#            log.debug("For event_type = %s, UNS got interested users here  %s", event.type_, users)
-        else:
-#            log.debug("After checking event_type = %s, UNS got no interested users here", event.type_)
-            return []
-
-    if event.origin is not None: # for an incoming event that has origin specified (this should be true for almost all events)
-        if reverse_user_info['event_origin'].has_key(event.origin):
-            user_list_2 = set(reverse_user_info['event_origin'][event.origin])
-            if reverse_user_info['event_origin'].has_key(''): # for users who subscribe to any event origins
-                user_list_2.extend(reverse_user_info['event_origin'][''])
-            users = set.intersection(users, user_list_2)
-#            log.debug("For event origin = %s too, UNS got interested users here  %s", event.origin, users)
-        else:
-#            log.debug("After checking  event origin = %s, UNS got no interested users here", event.origin)
-            return []
-
-    if event.sub_type is not None: # for an incoming event with the sub type specified
-        if reverse_user_info['event_subtype'].has_key(event.sub_type):
-            user_list_3 = reverse_user_info['event_subtype'][event.sub_type]
-            if reverse_user_info['event_subtype'].has_key(''): # for users who subscribe to any event subtypes
-                user_list_3.extend(reverse_user_info['event_subtype'][''])
-            users = set.intersection(users, user_list_3)
-#            log.debug("For event_subtype = %s too, UNS got interested users here  %s", event.sub_type, users)
-#        else:
-#            log.debug("After checking event_subtype = %s, UNS got no interested users here", event.sub_type)
-#            return []
-
-    if event.origin_type is not None: # for an incoming event with origin type specified
-        if reverse_user_info['event_origin_type'].has_key(event.origin_type):
-            user_list_4 = reverse_user_info['event_origin_type'][event.origin_type]
-            if reverse_user_info['event_origin_type'].has_key(''): # for users who subscribe to any event origin types
-                user_list_4.extend(reverse_user_info['event_origin_type'][''])
-            users = set.intersection(users, user_list_4)
-#            log.debug("For event_origin_type = %s too, UNS got interested users here  %s", event.origin_type, users)
-        else:
-#            log.debug("After checking event_origin_type = %s, UNS got no interested users here", event.origin_type)
-            return []
-
-#    log.debug("The interested users found here are: %s, for event: %s", users, event)
-    return list( users)
+    return _match_subscriptions(event, lookup)
 
 def calculate_reverse_user_info(user_info=None):
     '''
@@ -254,12 +335,7 @@ def calculate_reverse_user_info(user_info=None):
     if not user_info:
         return {}
 
-    reverse_user_info = {}
-
-    dict_1 = {}
-    dict_2 = {}
-    dict_3 = {}
-    dict_4 = {}
+    users_by_value = dict((key, {}) for key in REVERSE_USER_INFO_KEYS)
 
     for user_id, value in user_info.iteritems():
 
@@ -274,50 +350,26 @@ def calculate_reverse_user_info(user_info=None):
         if notifications_disabled or not not notifications_daily_digest:
             continue
 
-        if notifications:
+        for notification in notifications or []:
 
-            for notification in notifications:
+            # If the notification has expired, do not keep it in the reverse user info that the notification
+            # workers use
+            if notification.temporal_bounds.end_datetime:
+                continue
 
-                # If the notification has expired, do not keep it in the reverse user info that the notification
-                # workers use
-                if notification.temporal_bounds.end_datetime:
-                    continue
+            if not isinstance(notification, NotificationRequest):
+                continue
 
-                if not isinstance(notification, NotificationRequest):
-                    continue
+            # An empty value subscribes the user to any value, recorded under ''
+            for key, attribute in (('event_type', notification.event_type),
+                                   ('event_subtype', notification.event_subtype),
+                                   ('event_origin', notification.origin),
+                                   ('event_origin_type', notification.origin_type)):
+                users_by_value[key].setdefault(attribute or '', set()).add(user_id)
+
+    if not any(users_by_value.itervalues()):
+        return {}
 
-                if dict_1.has_key(notification.event_type) and notification.event_type != '':
-                    dict_1[notification.event_type].append(user_id)
-                    # to remove duplicate user names
-                    dict_1[notification.event_type] = list(set(dict_1[notification.event_type]))
-                elif notification.event_type != '':
-                    dict_1[notification.event_type] = [user_id]
-
-                if dict_2.has_key(notification.event_subtype) and notification.event_subtype != '':
-                    dict_2[notification.event_subtype].append(user_id)
-                    # to remove duplicate user names
-                    dict_2[notification.event_subtype] = list(set(dict_2[notification.event_subtype]))
-                elif notification.event_subtype != '':
-                    dict_2[notification.event_subtype] = [user_id]
-
-                if dict_3.has_key(notification.origin) and notification.origin != '':
-                    dict_3[notification.origin].append(user_id)
-                    # to remove duplicate user names
-                    dict_3[notification.origin] = list(set(dict_3[notification.origin]))
-                elif notification.origin != '':
-                    dict_3[notification.origin] = [user_id]
-
-                if dict_4.has_key(notification.origin_type) and notification.origin_type != '':
-                    dict_4[notification.origin_type].append(user_id)
-                    # to remove duplicate user names
-                    dict_4[notification.origin_type] = list(set(dict_4[notification.origin_type]))
-                elif notification.origin_type != '':
-                    dict_4[notification.origin_type] = [user_id]
-
-                reverse_user_info['event_type'] = dict_1
-                reverse_user_info['event_subtype'] = dict_2
-                reverse_user_info['event_origin'] = dict_3
-                reverse_user_info['event_origin_type'] = dict_4
-
-    return reverse_user_info
+    return dict((key, dict((value, list(users)) for value, users in users.iteritems()))
+                for key, users in users_by_value.iteritems())
 
@@ -860,7 +860,7 @@ class ObservatoryManagementService(BaseObservatoryManagementService):
             device_relations = outil.get_device_relations(site_ids)
 
             # Set parent immediate child sites
-            parent_site_ids = [a.s for a in RR2.filter_cached_associations(PRED.hasSite, lambda a: a.p ==PRED.hasSite and a.o == site_id)]
+            parent_site_ids = [a.s for a in RR2.find_cached_associations(PRED.hasSite, object_id=site_id)]
             if parent_site_ids:
                 extended_site.parent_site = RR2.read(parent_site_ids[0])
             else:
@@ -887,14 +887,14 @@ class ObservatoryManagementService(BaseObservatoryManagementService):
 
             # Set deployments
             RR2.cache_predicate(PRED.hasDeployment)
-            deployment_assocs = RR2.filter_cached_associations(PRED.hasDeployment, lambda a: a.s in site_ids)
+            deployment_assocs = [a for sid in site_ids for a in RR2.find_cached_associations(PRED.hasDeployment, subject_id=sid)]
             deployment_ids = [a.o for a in deployment_assocs]
             deployment_objs = RR2.read_mult(list(set(deployment_ids)))
             extended_site.deployments = deployment_objs
 
             # Set data products
             RR2.cache_predicate(PRED.hasSource)
-            dataproduct_assocs = RR2.filter_cached_associations(PRED.hasSource, lambda a: a.o in site_ids)
+            dataproduct_assocs = [a for sid in site_ids for a in RR2.find_cached_associations(PRED.hasSource, object_id=sid)]
             dataproduct_ids = [a.s for a in dataproduct_assocs]
             dataproduct_objs = RR2.read_mult(list(set(dataproduct_ids)))
             extended_site.data_products = dataproduct_objs
@@ -1307,11 +1307,8 @@ class ObservatoryManagementService(BaseObservatoryManagementService):
         return extended_org
 
     def _get_root_platforms(self, RR2, platform_device_list):
-        # get all relevant assocation objects
-        filter_fn = lambda a: a.o in platform_device_list
-
         # get child -> parent dict
-        lookup = dict([(a.o, a.s) for a in RR2.filter_cached_associations(PRED.hasDevice, filter_fn)])
+        lookup = dict([(a.o, a.s) for pd in platform_device_list for a in RR2.find_cached_associations(PRED.hasDevice, object_id=pd)])
 
         # root platforms have no parent, or a parent that's not in our list
         return [r for r in platform_device_list if (r not in lookup or (lookup[r] not in platform_device_list))]
@@ -94,6 +94,7 @@ class EnhancedResourceRegistryClient(object):
         # TODO: s/_cached_/_fetched_/g
         self._cached_predicates = {}
         self._cached_resources  = {}
+        self._cached_assoc_index = {} # predicate -> lookups of its cached associations by subject/object id and type
 
         self.console_mode = False
 
@@ -298,6 +299,7 @@ class EnhancedResourceRegistryClient(object):
                                         predicate=association_type,
                                         object=object_id)
         self.RR.delete_association(assoc)
+        self._uncache_associations(association_type, subject_id=subject_id, object_id=object_id)
 
 
     def find_resource_by_name(self, resource_type, name, id_only=False):
@@ -346,19 +348,10 @@ class EnhancedResourceRegistryClient(object):
 
         log.info("Using %s cached results for 'find (%s) subjects'", len(self._cached_predicates[predicate]), predicate)
 
-        def filter_fn(assoc):
-            if object != assoc.o:
-                return False
-
-            if "" != subject_type and subject_type != assoc.st:
-                return False
-
-            return True
-
         log.debug("Checking object_id=%s, subject_type=%s", object_id, subject_type)
         preds = self._cached_predicates[predicate]
         time_search_start = get_ion_ts()
-        subject_ids = [a.s for a in self.filter_cached_associations(predicate, filter_fn)]
+        subject_ids = [a.s for a in self.find_cached_associations(predicate, object_id=object_id, subject_type=subject_type)]
         time_search_stop = get_ion_ts()
         total_time = int(time_search_stop) - int(time_search_start)
         log.debug("Processed %s %s predicates for %s subjects in %s seconds",
@@ -387,19 +380,10 @@ class EnhancedResourceRegistryClient(object):
 
         log.info("Using %s cached results for 'find (%s) objects'", len(self._cached_predicates[predicate]), predicate)
 
-        def filter_fn(assoc):
-            if subject_id != assoc.s:
-                return False
-
-            if "" != object_type and object_type != assoc.ot:
-                return False
-
-            return True
-
         log.debug("Checking subject_id=%s, object_type=%s", subject_id, object_type)
         preds = self._cached_predicates[predicate]
         time_search_start = get_ion_ts()
-        object_ids = [a.o for a in self.filter_cached_associations(predicate, filter_fn)]
+        object_ids = [a.o for a in self.find_cached_associations(predicate, subject_id=subject_id, object_type=object_type)]
         time_search_stop = get_ion_ts()
         total_time = int(time_search_stop) - int(time_search_start)
         log.debug("Processed %s %s predicates for %s objects in %s seconds",
@@ -487,6 +471,7 @@ class EnhancedResourceRegistryClient(object):
 
         for a in associations:
             self.RR.delete_association(a)
+        self._uncache_associations(association_type, subject_id=subject_id)
 
 
     def delete_subject_associations(self, association_type='', object_id=''):
@@ -500,6 +485,7 @@ class EnhancedResourceRegistryClient(object):
 
         for a in associations:
             self.RR.delete_association(a)
+        self._uncache_associations(association_type, object_id=object_id)
 
 
     def advance_lcs(self, resource_id, transition_event):
@@ -548,7 +534,16 @@ class EnhancedResourceRegistryClient(object):
         total_time = int(time_caching_stop) - int(time_caching_start)
 
         log.info("Cached %s %s predicates in %s seconds", len(preds), predicate, total_time / 1000.0)
-        self._cached_predicates[predicate] = preds
+        self._cached_predicates[predicate] = []
+        lookups = DotDict()
+        lookups.by_subject      = {}
+        lookups.by_object       = {}
+        lookups.by_subject_type = {}
+        lookups.by_object_type  = {}
+        self._cached_assoc_index[predicate] = lookups
+
+        for a in preds:
+            self._add_association_to_cache(predicate, a)
 
 
     def filter_cached_associations(self, predicate, is_match_fn):
@@ -557,6 +552,79 @@ class EnhancedResourceRegistryClient(object):
 
         return [a for a in self._cached_predicates[predicate] if is_match_fn(a)]
 
+
+    def find_cached_associations(self, predicate, subject_id='', object_id='', subject_type='', object_type=''):
+        """
+        indexed lookup of cached associations; the most selective of the given ids/types picks the
+        candidates, the remaining criteria filter them
+        """
+        if not self.has_cached_predicate(predicate):
+            raise BadRequest("Attempted to find cached associations of uncached predicate '%s'" % predicate)
+
+        lookups = self._cached_assoc_index[predicate]
+        if subject_id:
+            candidates = lookups.by_subject.get(subject_id, [])
+        elif object_id:
+            candidates = lookups.by_object.get(object_id, [])
+        elif subject_type:
+            candidates = lookups.by_subject_type.get(subject_type, [])
+        elif object_type:
+            candidates = lookups.by_object_type.get(object_type, [])
+        else:
+            candidates = self._cached_predicates[predicate]
+
+        return [a for a in candidates
+                if (not subject_id or subject_id == a.s)
+                and (not object_id or object_id == a.o)
+                and (not subject_type or subject_type == a.st)
+                and (not object_type or object_type == a.ot)]
+
+
+    def _add_association_to_cache(self, predicate, assoc):
+        lookups = self._cached_assoc_index[predicate]
+        self._cached_predicates[predicate].append(assoc)
+        lookups.by_subject.setdefault(assoc.s, []).append(assoc)
+        lookups.by_object.setdefault(assoc.o, []).append(assoc)
+        lookups.by_subject_type.setdefault(assoc.st, []).append(assoc)
+        lookups.by_object_type.setdefault(assoc.ot, []).append(assoc)
+
+
+    def _cache_new_association(self, subject_id, predicate, object_id):
+        """
+        keep a cached predicate current after creating an association through this client
+        """
+        if not self.has_cached_predicate(predicate):
+            return
+        assoc = self.RR.get_association(subject_id, predicate, object_id, id_only=False)
+        self._add_association_to_cache(predicate, assoc)
+
+
+    def _uncache_associations(self, predicate=None, subject_id='', object_id=''):
+        """
+        drop cached associations that were deleted through this client; without a predicate, every cached
+        predicate is searched
+        """
+        predicates = [predicate] if predicate else self._cached_assoc_index.keys()
+        for p in predicates:
+            if not self.has_cached_predicate(p):
+                continue
+            stale = self.find_cached_associations(p, subject_id=subject_id, object_id=object_id)
+            if not stale:
+                continue
+            stale_ids = set(id(a) for a in stale)
+            keep = lambda assocs: [a for a in assocs if id(a) not in stale_ids]
+
+            lookups = self._cached_assoc_index[p]
+            self._cached_predicates[p] = keep(self._cached_predicates[p])
+            for index, key in [(lookups.by_subject, 's'), (lookups.by_object, 'o'),
+                               (lookups.by_subject_type, 'st'), (lookups.by_object_type, 'ot')]:
+                for k in set(getattr(a, key) for a in stale):
+                    remaining = keep(index.get(k, []))
+                    if remaining:
+                        index[k] = remaining
+                    else:
+                        index.pop(k, None)
+
     def get_cached_associations(self, predicate):
         return self.filter_cached_associations(predicate, lambda x: True)
 
@@ -613,8 +681,10 @@ class EnhancedResourceRegistryClient(object):
     def clear_cached_predicate(self, predicate=None):
         if None is predicate:
             self._cached_predicates = {}
+            self._cached_assoc_index = {}
         elif predicate in self._cached_predicates:
             del self._cached_predicates[predicate]
+            del self._cached_assoc_index[predicate]
 
 
     def clear_cached_resource(self, resource_type=None):
@@ -822,6 +892,7 @@ class EnhancedResourceRegistryClient(object):
                 log.info("Dynamically creating association %s -> %s -> %s", isubj, ipred, iobj)
                 log.debug("%s -> %s -> %s", subj_id, ipred, obj_id)
                 self.RR.create_association(subj_id, ipred, obj_id)
+                self._cache_new_association(subj_id, ipred, obj_id)
 
             return ret_fn
 
@@ -871,6 +942,7 @@ class EnhancedResourceRegistryClient(object):
                         return
 
                 self.RR.create_association(subj_id, ipred, obj_id)
+                self._cache_new_association(subj_id, ipred, obj_id)
 
             return ret_fn
 
@@ -922,6 +994,7 @@ class EnhancedResourceRegistryClient(object):
                         return
 
                 self.RR.create_association(subj_id, ipred, obj_id)
+                self._cache_new_association(subj_id, ipred, obj_id)
 
             return ret_fn
 
@@ -1317,6 +1390,9 @@ class EnhancedResourceRegistryClient(object):
             log.debug("pluck deleting subject association %s", assn)
             self.RR.delete_association(assn)
 
+        self._uncache_associations(subject_id=resource_id)
+        self._uncache_associations(object_id=resource_id)
+
         debug = False
 
         if debug:
@@ -5,39 +5,133 @@
 @file ion/util/stored_values.py
 '''
 
+from pyon.container.cc import Container
 from pyon.core.exception import NotFound
+from pyon.ion.event import EventPublisher, EventSubscriber
+from pyon.public import CFG, OT
+import collections
 import gevent
+import time
 
 
 
 class StoredValueManager(object):
+    # Process-wide cache of stored value documents, doc_key -> (document or None if not found, time read) (LRU)
+    _cache            = collections.OrderedDict()
+    _cache_subscriber = None
+    _update_publisher = None
+    _last_published   = {} # doc_key -> time the last update event was published
+    cache_ttl         = CFG.get_safe('container.stored_values.cache_ttl', 60)
+    cache_size        = CFG.get_safe('container.stored_values.cache_size', 1000)
+    update_interval   = CFG.get_safe('container.stored_values.update_interval', 10)
+
     def __init__(self, container):
         self.store = container.object_store
 
-    def stored_value_cas(self, doc_key, document_updates):
+    def stored_value_cas(self, doc_key, document_updates, notify=True):
         '''
         Performs a check and set for a lookup_table in the object store for the given key
+
+        @param notify  Tell the caches of other processes when the values changed (see value_updated), writers
+                       whose documents are not read through the cache can turn this off
         '''
         try:
             doc = self.store.read_doc(doc_key)
         except NotFound:
             doc_id, rev = self.store.create_doc(document_updates, object_id=doc_key)
+            self.value_updated(doc_key, notify)
             return doc_id, rev
         except KeyError as e:
             if 'http' in e.message:
                 doc_id, rev = self.store.create_doc(document_updates, object_id=doc_key)
+                self.value_updated(doc_key, notify)
                 return doc_id, rev
 
+        changed = False
         for k,v in document_updates.iteritems():
+            changed = changed or k not in doc or doc[k] != v
             doc[k] = v
         doc_id, rev = self.store.update_doc(doc)
+        if changed:
+            self.value_updated(doc_key, notify)
         return doc_id, rev
 
     def read_value(self, doc_key):
         doc = self.store.read_doc(doc_key)
         return doc
 
+    def read_cached_value(self, doc_key):
+        '''
+        Reads the document through the process-wide cache. Cached documents (and missing documents) are
+        served for up to cache_ttl seconds or until an ExternalReferencesUpdatedEvent names their key. Writes
+        through a StoredValueManager publish one at most every update_interval seconds per key, so a document
+        rewritten more often than that can be served up to cache_ttl seconds stale in other processes.
+        The returned document is shared and must not be modified.
+        '''
+        self.start_cache_monitor()
+        try:
+            doc, read_time = self._cache.pop(doc_key)
+            if (time.time() - read_time) > self.cache_ttl:
+                raise KeyError(doc_key)
+        except KeyError:
+            try:
+                doc = self.read_value(doc_key)
+            except NotFound:
+                doc = None
+            read_time = time.time()
+            if len(self._cache) >= self.cache_size:
+                self._cache.popitem(last=False)
+        self._cache[doc_key] = (doc, read_time)
+        if doc is None:
+            raise NotFound('No stored value for %s' % doc_key)
+        return doc
+
     def delete_stored_value(self, doc_key):
         self.store.delete_doc(doc_key)
+        self.value_updated(doc_key)
+
+    @classmethod
+    def value_updated(cls, doc_key, notify=True):
+        '''
+        Drops the document from this process' cache and tells the caches of the other processes to do the same,
+        at most once every update_interval seconds per key
+        '''
+        cls.invalidate(doc_key)
+        if not notify or Container.instance is None:
+            return
+        now = time.time()
+        if now - cls._last_published.get(doc_key, 0) < cls.update_interval:
+            return
+        if len(cls._last_published) >= cls.cache_size:
+            cls._last_published.clear()
+        cls._last_published[doc_key] = now
+        if cls._update_publisher is None:
+            cls._update_publisher = EventPublisher(event_type=OT.ExternalReferencesUpdatedEvent)
+        cls._update_publisher.publish_event(origin=doc_key, reference_keys=[doc_key])
+
+    @classmethod
+    def invalidate(cls, doc_key=None):
+        '''
+        Drops a document, or every document if no key is given, from the cache
+        '''
+        if doc_key is None:
+            cls._cache.clear()
+        else:
+            cls._cache.pop(doc_key, None)
+
+    @classmethod
+    def start_cache_monitor(cls):
+        if cls._cache_subscriber is not None or Container.instance is None:
+            return
+        cls._cache_subscriber = EventSubscriber(event_type=OT.ExternalReferencesUpdatedEvent, callback=cls._references_updated, auto_delete=True)
+        cls._cache_subscriber.start()
+
+    @classmethod
+    def _references_updated(cls, event, *args, **kwargs):
+        if isinstance(event.reference_keys, list):
+            for doc_key in event.reference_keys:
+                cls.invalidate(doc_key)
+        else:
+            cls.invalidate()
 
 
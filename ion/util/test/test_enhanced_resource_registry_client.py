@@ -631,3 +631,36 @@ class TestEnhancedResourceRegistryClient(PyonTestCase):
         self.assertEqual([d], results)
 
         self.assertEqual(0, self.rr.find_subjects.call_count)
+
+    def test_cached_predicate_maintenance(self):
+        d1 = "d1_id"
+        d2 = "d2_id"
+        m = "m_id"
+
+        assn1 = DotDict(s=d1, st=RT.InstrumentDevice, p=PRED.hasModel, o=m, ot=RT.InstrumentModel)
+        self.rr.find_associations.return_value = [assn1]
+        self.RR2.cache_predicate(PRED.hasModel)
+
+        # assigning through the client adds the new association to the cache
+        assn2 = DotDict(s=d2, st=RT.InstrumentDevice, p=PRED.hasModel, o=m, ot=RT.InstrumentModel)
+        self.rr.get_association.return_value = assn2
+        self.RR2.assign_instrument_model_to_instrument_device_with_has_model(m, d2)
+        self.rr.get_association.assert_called_once_with(d2, PRED.hasModel, m, id_only=False)
+
+        results = self.RR2.find_instrument_device_ids_by_instrument_model_using_has_model(m)
+        self.assertEqual([d1, d2], results)
+        self.assertEqual([assn2], self.RR2.find_cached_associations(PRED.hasModel, subject_id=d2))
+        self.assertEqual(2, len(self.RR2.find_cached_associations(PRED.hasModel, subject_type=RT.InstrumentDevice)))
+
+        # unassigning removes it
+        self.RR2.unassign_instrument_model_from_instrument_device_with_has_model(m, d1)
+        self.assertEqual([d2], self.RR2.find_instrument_device_ids_by_instrument_model_using_has_model(m))
+        self.assertEqual([], self.RR2.find_instrument_model_ids_of_instrument_device_using_has_model(d1))
+        self.assertEqual([assn2], self.RR2.get_cached_associations(PRED.hasModel))
+
+        # plucking a resource removes every cached association to/from it
+        self.rr.find_subjects.return_value = ([d2], ["aaa"])
+        self.rr.find_objects.return_value = ([], [])
+        self.RR2.pluck(m)
+        self.assertEqual([], self.RR2.get_cached_associations(PRED.hasModel))
+        self.assertEqual([], self.RR2.find_cached_associations(PRED.hasModel, subject_type=RT.InstrumentDevice))
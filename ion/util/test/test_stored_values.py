@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+'''
+@file ion/util/test/test_stored_values.py
+@brief Unit tests for the stored value cache
+'''
+
+from pyon.core.exception import NotFound
+from pyon.util.unit_test import PyonTestCase
+from ion.util.stored_values import StoredValueManager
+from nose.plugins.attrib import attr
+from mock import Mock, patch
+
+import time
+
+
+@attr('UNIT', group='dm')
+class StoredValueCacheUnitTest(PyonTestCase):
+    def setUp(self):
+        self.container = Mock()
+        self.store = self.container.object_store
+        self.store.read_doc.side_effect = lambda doc_key: {'offset_a': 2.0}
+        self.svm = StoredValueManager(self.container)
+        StoredValueManager.invalidate()
+        self.addCleanup(StoredValueManager.invalidate)
+
+    def test_cached_reads(self):
+        self.assertEquals(self.svm.read_cached_value('coefficients'), {'offset_a': 2.0})
+        self.assertEquals(self.svm.read_cached_value('coefficients'), {'offset_a': 2.0})
+        self.assertEquals(self.store.read_doc.call_count, 1)
+
+        # Writes through any manager in the process invalidate the document
+        self.store.read_doc.side_effect = lambda doc_key: {'offset_a': 2.0, '_id': doc_key}
+        self.store.update_doc.return_value = ('coefficients', '2')
+        StoredValueManager(self.container).stored_value_cas('coefficients', {'offset_a': 3.0})
+        self.svm.read_cached_value('coefficients')
+        self.assertEquals(self.store.read_doc.call_count, 3)
+
+    def test_missing_documents(self):
+        self.store.read_doc.side_effect = NotFound('coefficients')
+        with self.assertRaises(NotFound):
+            self.svm.read_cached_value('coefficients')
+        with self.assertRaises(NotFound):
+            self.svm.read_cached_value('coefficients')
+        self.assertEquals(self.store.read_doc.call_count, 1)
+
+    def test_expiry_and_events(self):
+        self.svm.read_cached_value('coefficients')
+        StoredValueManager._cache['coefficients'] = (StoredValueManager._cache['coefficients'][0], time.time() - StoredValueManager.cache_ttl - 1)
+        self.svm.read_cached_value('coefficients')
+        self.assertEquals(self.store.read_doc.call_count, 2)
+
+        event = Mock()
+        event.reference_keys = ['coefficients']
+        StoredValueManager._references_updated(event)
+        self.svm.read_cached_value('coefficients')
+        self.assertEquals(self.store.read_doc.call_count, 3)
+
+    @patch('ion.util.stored_values.EventPublisher')
+    @patch('ion.util.stored_values.Container')
+    def test_update_events(self, container, publisher):
+        self.addCleanup(setattr, StoredValueManager, '_update_publisher', None)
+        self.addCleanup(StoredValueManager._last_published.clear)
+        StoredValueManager._update_publisher = None
+        StoredValueManager._last_published.clear()
+        self.store.update_doc.return_value = ('coefficients', '2')
+        events = publisher.return_value.publish_event
+
+        # Changes tell the caches of other processes
+        StoredValueManager._cache['coefficients'] = ({'offset_a': 2.0}, time.time())
+        self.svm.stored_value_cas('coefficients', {'offset_a': 3.0})
+        self.assertNotIn('coefficients', StoredValueManager._cache)
+        events.assert_called_once_with(origin='coefficients', reference_keys=['coefficients'])
+
+        # Rewriting the same values does not
+        self.svm.stored_value_cas('coefficients', {'offset_a': 2.0})
+        self.assertEquals(events.call_count, 1)
+
+        # At most one event per key every update_interval
+        self.svm.delete_stored_value('coefficients')
+        self.assertEquals(events.call_count, 1)
+        StoredValueManager._last_published['coefficients'] -= StoredValueManager.update_interval
+        self.svm.delete_stored_value('coefficients')
+        self.assertEquals(events.call_count, 2)
+
+        # Writers can keep their documents to themselves
+        self.svm.stored_value_cas('watermark', {'timestep': 10}, notify=False)
+        self.assertEquals(events.call_count, 2)
+        self.assertEquals(publisher.call_count, 1)
+
+    def test_cache_size(self):
+        self.store.read_doc.side_effect = lambda doc_key: {'key': doc_key}
+        with patch.object(StoredValueManager, 'cache_size', 2):
+            self.svm.read_cached_value('a')
+            self.svm.read_cached_value('b')
+            self.svm.read_cached_value('a')
+            self.svm.read_cached_value('c')
+        # The least recently read document is dropped
+        self.assertEquals(StoredValueManager._cache.keys(), ['a', 'c'])
@@ -37,6 +37,22 @@ class TimeUtils(object):
         else:
             return val
 
+    @classmethod
+    def ts_to_units_array(cls, units, vals):
+        '''
+        Converts an array of unix timestamps, 'since' units are linear in unix time so
+        the conversion is evaluated once and applied to the whole array.
+        '''
+        vals = np.asanyarray(vals, dtype='float64')
+        if 'iso' in units:
+            return np.array([cls.ts_to_units(units, val) for val in vals])
+        elif 'since' in units:
+            origin = cls.ts_to_units(units, 0)
+            scale = cls.ts_to_units(units, 86400) - origin
+            return origin + vals * (scale / 86400.)
+        else:
+            return vals
+
 
     @classmethod
     def units_to_ts(cls, units, val):
@@ -64,3 +80,17 @@ class TimeUtils(object):
         '''
         idx = np.abs(arr-val).argmin()
         return idx
+
+    @classmethod
+    def find_nearest_sorted(cls, arr, vals):
+        '''
+        Vectorized find_nearest for a monotonically increasing array, returns the index of
+        the best matching value for each of vals (the first occurrence on ties, like find_nearest)
+        '''
+        vals = np.atleast_1d(vals)
+        right = np.clip(np.searchsorted(arr, vals, side='left'), 0, arr.shape[0] - 1)
+        left = np.clip(right - 1, 0, arr.shape[0] - 1)
+        # Nearest left neighbour is the first occurrence of its value
+        left = np.searchsorted(arr, arr[left], side='left')
+        use_left = np.abs(arr[left] - vals) <= np.abs(arr[right] - vals)
+        return np.where(use_left, left, right)